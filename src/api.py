@@ -1,17 +1,43 @@
+import os
+
 from flask import Flask, request, jsonify
-from database import DataLogger, calculate_energy
-import sqlite3
-from datetime import datetime
+import database
+from database import DataLogger, BufferedDataLogger, release_connection
+import metrics
+import sharding
+
+# Batch sensor inserts into one transaction instead of one commit per reading
+BUFFERED_LOGGING = True
+# Directory of a sharded store (see sharding.py) to spread rooms over
+# several SQLite files, each with its own writer; None uses the one file
+SHARD_DIR = os.environ.get('SHEMS_SHARD_DIR')
 
 app = Flask(__name__)
-logger = DataLogger()
+if SHARD_DIR:
+    storage = sharding.ShardedStore(SHARD_DIR)
+    logger = sharding.ShardedDataLogger(storage)
+else:
+    # The module offers the same calls as a ShardedStore
+    storage = database
+    logger = BufferedDataLogger() if BUFFERED_LOGGING else DataLogger()
+metrics.instrument_flask(app)
+
+@app.teardown_appcontext
+def release_db(exception):
+    """Returns this request thread's DB connection to the pool."""
+    release_connection()
 
 # 1. Endpoint to log sensor data
 @app.route('/log/sensor', methods=['POST'])
 def log_sensor():
     data = request.json
     # Expected format: {"room_id": "Living Room", "type": "Temp", "value": 24.5}
-    logger.update(data['room_id'], data['type'], data['value'])
+    try:
+        logger.update(data['room_id'], data['type'], data['value'])
+    except KeyError as e:
+        return jsonify({"error": f"Missing field {e}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({"status": "success", "message": "Sensor data logged"}), 201
 
 # 2. Endpoint to log appliance state changes
@@ -19,28 +45,32 @@ def log_sensor():
 def log_appliance():
     data = request.json
     # Expected format: {"room_id": "Kitchen", "appliance": "lights", "state": "ON", "is_on": 1}
-    conn = sqlite3.connect('smarthome.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO appliance_log (room_id, appliance, state, is_on, timestamp)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (data['room_id'], data['appliance'], data['state'], data['is_on'], datetime.now()))
-    conn.commit()
-    conn.close()
+    # Goes through the database layer so the last-state cache stays current
+    try:
+        storage.record_appliance_state(data['room_id'], data['appliance'], data['state'], data['is_on'])
+    except KeyError as e:
+        return jsonify({"error": f"Missing field {e}"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({"status": "success", "message": "Appliance state logged"}), 201
 
 # 3. Endpoint to get energy report
 @app.route('/report/energy/<room_id>/<appliance>', methods=['GET'])
 def get_energy(room_id, appliance):
-    kwh = calculate_energy(room_id, appliance)
+    kwh = storage.calculate_energy(room_id, appliance)
     return jsonify({
         "room_id": room_id,
         "appliance": appliance,
         "kwh_consumed": round(kwh, 4)
     }), 200
 
+# 4. Endpoint for timers and counters (Prometheus text format)
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
-    from database import init_db
-    init_db()  # Creates tables if they don't exist
+    metrics.configure_logging()
+    storage.init_db()  # Creates tables if they don't exist
     # This line MUST be reached for the server to stay open:
     app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
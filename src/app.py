@@ -1,22 +1,100 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+
 from flask import Flask, jsonify, request
+from werkzeug.serving import is_running_from_reloader
 
 import database as db 
-from control import RoomController
-from sensors import RoomSensors
+import metrics
+import snapshot
+from control import OVERRIDE_STATES
+from response_cache import ResponseCache
+from sensors import QueuedObserver, RoomSensors
+from state_store import RoomStateStore
 
 app = Flask(__name__)
 
-rooms = {} 
+rooms = RoomStateStore()  # room_id -> RoomController-style view
 sensors_dict = {}
+observer_queues = {}  # room_id -> QueuedObserver feeding that room's logger
+response_cache = ResponseCache()  # polled GET bodies, keyed by data version
 
 # Configuration constants
 BASELINE_AC_KWH = 36.0  # 24h * 1.5kW
 BASELINE_LIGHT_KWH = 0.72  # 12h * 0.06kW
 BASELINE_TOTAL = BASELINE_AC_KWH + BASELINE_LIGHT_KWH
+BUFFERED_LOGGING = True  # Route sensor readings through BufferedDataLogger
+ASYNC_LOGGING = True  # Log readings from a background queue, off the tick path
+LOG_QUEUE_SIZE = 1000
+LOG_QUEUE_POLICY = 'block'  # or 'drop_oldest' to shed load instead of waiting
+RETENTION = True  # Prune old sensor data in db.RETENTION_WINDOW (see db.RETENTION_DAYS)
+ROOM_NAMES = ["Living Room"]  # Rooms registered at startup
+SNAPSHOTS = True  # Restore room state from a snapshot at startup and keep it fresh (see snapshot.py)
+DEBUG = True  # Flask debug mode, with the code reloader
+BATCH_HOURS = range(25)  # Hours /api/tick/batch accepts: one simulated day, ticked 1-24
+
+class LoggerAdapter:
+    """Fixes the argument mismatch between sensors and the database loggers."""
+    def __init__(self, logger, room_id):
+        self.logger = logger
+        self.room_id = room_id
+
+    def update(self, temp, occupied, light_level):
+        # Formats the data exactly how DataLogger expects it
+        self.logger.update(self.room_id, "Temperature", temp)
+        self.logger.update(self.room_id, "Occupancy", 1 if occupied else 0)
+        self.logger.update(self.room_id, "LightLevel", light_level)
+
+def add_room(room_name, logger, queued=ASYNC_LOGGING):
+    """Registers a room's controller and sensors, logging readings to logger.
+
+    With queued=True the logger runs behind a QueuedObserver, off the
+    tick path; control logic always runs inline.
+    """
+    rooms.add(room_name)
+    sensors_dict[room_name] = RoomSensors(room_name)
+    adapter = LoggerAdapter(logger, room_name)
+    if queued:
+        adapter = observer_queues[room_name] = QueuedObserver(
+            adapter, maxsize=LOG_QUEUE_SIZE, policy=LOG_QUEUE_POLICY, name=f"logger:{room_name}")
+    sensors_dict[room_name].add_observer(rooms[room_name]) # Control logic, runs inline
+    sensors_dict[room_name].add_observer(adapter)          # Safe database logging
+
+metrics.instrument_flask(app)
+
+@app.teardown_appcontext
+def release_db(exception):
+    """Returns this request thread's DB connection to the pool."""
+    db.release_connection()
+
+def cached_response(key, version, build):
+    """Serves build()'s JSON from response_cache, answering conditional GETs.
+
+    build returns the payload to jsonify and only runs when version has
+    moved since the body was last rendered. Responses carry an ETag and
+    Last-Modified; a matching If-None-Match (or If-Modified-Since when no
+    ETag is sent) gets an empty 304.
+    """
+    body, etag, built_at = response_cache.get(key, version, lambda: jsonify(build()).get_data())
+    response = app.response_class(body, mimetype=app.json.mimetype)
+    response.set_etag(etag)
+    response.last_modified = built_at
+    # Clients may keep the body but must revalidate before reusing it
+    response.cache_control.no_cache = True
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        response_cache.count_not_modified()
+    return response
 
 @app.route('/api/status', methods=['GET'])
 def get_all_status():
     """Returns the current state of all rooms."""
+    return cached_response("status", rooms.version, status_payload)
+
+def status_payload():
     status_data = {}
     for room_id, controller in rooms.items():
         status_data[room_id] = {
@@ -26,14 +104,16 @@ def get_all_status():
             "ac_state": controller.ac.state,
             "light_state": controller.lights.state
         }
-    return jsonify({"status": "success", "data": status_data}), 200
+    return {"status": "success", "data": status_data}
 
 @app.route('/api/room/<room_id>', methods=['GET'])
 def get_room_status(room_id):
     """Detailed status for a single room."""
     if room_id not in rooms:
         return jsonify({"error": "Room not found"}), 404
-        
+    return jsonify(room_payload(room_id)), 200
+
+def room_payload(room_id):
     controller = rooms[room_id]
     room_data = {
         "room_name": controller.room_name,
@@ -45,40 +125,140 @@ def get_room_status(room_id):
         "manual_ac_override": controller.manual_ac_override,
         "manual_light_override": controller.manual_light_override
     }
-    return jsonify({"status": "success", "data": room_data}), 200
+    return {"status": "success", "data": room_data}
 
 @app.route('/api/history/<room_id>/<sensor_type>', methods=['GET'])
 def get_sensor_history(room_id, sensor_type):
-    """Fetches sensor reading history from the database layer."""
+    """Sensor reading history, newest first, one page at a time.
+
+    Optional query args: limit (default 50) and cursor (the next_cursor
+    of the previous page). next_cursor is null on the last page.
+    """
+    try:
+        history, next_cursor = db.get_sensor_history_page(
+            room_id, sensor_type, request.args.get("limit", 50), request.args.get("cursor"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    return jsonify({"status": "success", "room": room_id, "sensor": sensor_type,
+                    "data": history, "next_cursor": next_cursor}), 200
+
+def parse_range_args():
+    """Reads ISO 'start'/'end' query args; defaults to the last 24 hours."""
+    end = request.args.get("end")
+    end = datetime.fromisoformat(end) if end else datetime.now()
+    start = request.args.get("start")
+    start = datetime.fromisoformat(start) if start else end - timedelta(hours=24)
+    return start, end
+
+EXPORT_COLUMNS = ["id", "room_id", "sensor_type", "value", "timestamp"]
+EXPORT_CHUNK_ROWS = 1000  # rows rendered into each chunk sent to the client
+
+def export_chunks(rows, fmt):
+    """Renders sensor_log rows as NDJSON or CSV text, EXPORT_CHUNK_ROWS at a time."""
+    rows = iter(rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(EXPORT_COLUMNS)
+    while True:
+        batch = list(islice(rows, EXPORT_CHUNK_ROWS))
+        if not batch:
+            break
+        if fmt == "ndjson":
+            for row in batch:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))))
+                buffer.write("\n")
+        else:
+            writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for an export with no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.route('/api/history/<room_id>/<sensor_type>/export', methods=['GET'])
+def export_sensor_history(room_id, sensor_type):
+    """Streams every reading in a time range as NDJSON or CSV (format=ndjson|csv).
+
+    Rows are written as they are read from the database, so exports of
+    any size use constant memory. start/end default to all of history.
+    """
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be 'ndjson' or 'csv'"}), 400
+    try:
+        start = request.args.get("start")
+        start = datetime.fromisoformat(start) if start else datetime.min
+        end = request.args.get("end")
+        end = datetime.fromisoformat(end) if end else datetime.max
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows = db.iter_sensor_log(room_id, sensor_type, start, end)
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "text/csv"
+    response = app.response_class(export_chunks(rows, fmt), mimetype=mimetype)
+    filename = f"{room_id}_{sensor_type}.{fmt}".replace(" ", "_")
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+@app.route('/api/history/<room_id>/<sensor_type>/range', methods=['GET'])
+def get_sensor_history_range(room_id, sensor_type):
+    """Sensor history over a time range; resolution=auto|raw|hour|day."""
     try:
-        history = db.get_sensor_history(room_id, sensor_type) 
-        return jsonify({"status": "success", "room": room_id, "sensor": sensor_type, "data": history}), 200
+        start, end = parse_range_args()
+        resolution = request.args.get("resolution", "auto")
+        result = db.get_sensor_range(room_id, sensor_type, start, end, resolution)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
+    return jsonify({"status": "success", "room": room_id, "sensor": sensor_type,
+                    "start": start.isoformat(), "end": end.isoformat(), **result}), 200
+
+@app.route('/api/energy/<room_id>/<appliance>/range', methods=['GET'])
+def get_energy_range(room_id, appliance):
+    """kWh per hour or day over a time range; resolution=hour|day."""
+    try:
+        start, end = parse_range_args()
+        resolution = request.args.get("resolution", "hour")
+        result = db.get_energy_range(room_id, appliance, start, end, resolution)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    return jsonify({"status": "success", "room": room_id, "appliance": appliance,
+                    "start": start.isoformat(), "end": end.isoformat(), **result}), 200
 
 @app.route('/api/energy', methods=['GET'])
 def get_energy_summary():
     """Energy consumption summary with baseline comparison."""
     try:
-        energy_data = db.calculate_total_energy() 
-        
-        actual_total = energy_data.get("total_kwh", 0)
-        saved_kwh = BASELINE_TOTAL - actual_total
-        savings_percentage = (saved_kwh / BASELINE_TOTAL) * 100 if BASELINE_TOTAL > 0 else 0
-        
-        return jsonify({
-            "status": "success", 
-            "data": energy_data,
-            "analysis": {
-                "baseline_kwh": BASELINE_TOTAL,
-                "actual_kwh": actual_total,
-                "saved_kwh": round(saved_kwh, 2),
-                "savings_percentage": round(savings_percentage, 1)
-            }
-        }), 200
+        # Energy only changes when appliance rows are written, by any process
+        return cached_response("energy", db.energy_version(), energy_payload)
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
+def energy_payload():
+    energy_data = db.calculate_total_energy() 
+    
+    actual_total = energy_data.get("total_kwh", 0)
+    saved_kwh = BASELINE_TOTAL - actual_total
+    savings_percentage = (saved_kwh / BASELINE_TOTAL) * 100 if BASELINE_TOTAL > 0 else 0
+    
+    return {
+        "status": "success", 
+        "data": energy_data,
+        "analysis": {
+            "baseline_kwh": BASELINE_TOTAL,
+            "actual_kwh": actual_total,
+            "saved_kwh": round(saved_kwh, 2),
+            "savings_percentage": round(savings_percentage, 1)
+        }
+    }
+
 @app.route('/api/override', methods=['POST'])
 def manual_override():
     """Manual override for an appliance."""
@@ -87,15 +267,19 @@ def manual_override():
     appliance = data.get("appliance")
     state = data.get("state")
 
-    if not room_id or not appliance or room_id not in rooms:
+    if not isinstance(room_id, str) or not isinstance(appliance, str) or room_id not in rooms:
         return jsonify({"error": "Invalid room or missing fields"}), 400
 
+    allowed = OVERRIDE_STATES.get(appliance.lower())
+    if allowed is None:
+        return jsonify({"error": "Appliance must be 'ac' or 'light'"}), 400
+    if state and state not in allowed:
+        return jsonify({"error": f"State for {appliance} must be one of {list(allowed)}, or null to clear"}), 400
+
     if appliance.lower() == 'ac':
         rooms[room_id].manual_ac_override = state
-    elif appliance.lower() == 'light':
-        rooms[room_id].manual_light_override = state
     else:
-        return jsonify({"error": "Appliance must be 'ac' or 'light'"}), 400
+        rooms[room_id].manual_light_override = state
 
     return jsonify({"status": "success", "message": f"{appliance} in {room_id} overridden to {state}"}), 200
 
@@ -113,63 +297,127 @@ def advance_simulation():
         return jsonify({"error": f"Room '{room_id}' not initialized."}), 404
 
     try:
-        sensors_dict[room_id].read_all(hour)
-        ac_state, light_state = rooms[room_id].evaluate_state()
-
-        db.log_appliance_state(room_id, "AC", ac_state, ac_state == "COOLING", hour)
-        db.log_appliance_state(room_id, "Light", light_state, light_state == "ON", hour)
-
-        current_status = {
-            "hour_simulated": hour,
-            "temperature": rooms[room_id].current_temp,
-            "occupied": rooms[room_id].is_occupied,
-            "light_level": rooms[room_id].current_light_level,
-            "ac_state": ac_state,
-            "light_state": light_state
-        }
+        return jsonify(tick_room(room_id, hour)), 200
+    except Exception as e:
+        return jsonify({"error": f"Simulation failed at hour {hour}: {str(e)}"}), 500
+
+def tick_room(room_id, hour):
+    """Reads one room's sensors for an hour, applies control and logs transitions."""
+    sensors_dict[room_id].read_all(hour)
+    ac_state, light_state = rooms[room_id].evaluate_state()
+
+    db.log_appliance_state(room_id, "AC", ac_state, ac_state == "COOLING", hour)
+    db.log_appliance_state(room_id, "Light", light_state, light_state == "ON", hour)
+
+    current_status = {
+        "hour_simulated": hour,
+        "temperature": rooms[room_id].current_temp,
+        "occupied": rooms[room_id].is_occupied,
+        "light_level": rooms[room_id].current_light_level,
+        "ac_state": ac_state,
+        "light_state": light_state
+    }
+
+    return {
+        "status": "success", 
+        "message": f"Simulation advanced to hour {hour}",
+        "data": current_status
+    }
+
+@app.route('/api/tick/batch', methods=['POST'])
+def advance_simulation_batch():
+    """Advance many rooms over an hour range in one request.
+
+    Body: {"rooms": [...], "start_hour": 1, "end_hour": 24}. rooms defaults
+    to every initialized room and the hour range is inclusive and within
+    one simulated day (0-24). All appliance transitions are written in
+    one transaction.
+    """
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    room_ids = data.get("rooms") or list(rooms)
+    start_hour = data.get("start_hour")
+    end_hour = data.get("end_hour")
 
-        return jsonify({
-            "status": "success", 
-            "message": f"Simulation advanced to hour {hour}",
-            "data": current_status
-        }), 200
+    if not all(isinstance(hour, int) and not isinstance(hour, bool) and hour in BATCH_HOURS
+               for hour in (start_hour, end_hour)) or start_hour > end_hour:
+        return jsonify({"error": f"'start_hour' and 'end_hour' must be integers from {BATCH_HOURS[0]} "
+                                 f"to {BATCH_HOURS[-1]} with start_hour <= end_hour"}), 400
+    if not isinstance(room_ids, list) or not all(isinstance(room_id, str) for room_id in room_ids):
+        return jsonify({"error": "'rooms' must be a list of room names"}), 400
+    room_ids = list(dict.fromkeys(room_ids))  # each room ticks once per hour
 
+    missing = [room_id for room_id in room_ids if room_id not in rooms or room_id not in sensors_dict]
+    if missing:
+        return jsonify({"error": f"Rooms not initialized: {missing}"}), 404
+
+    hours = list(range(start_hour, end_hour + 1))
+    timeline = {room_id: {"temperature": [], "occupied": [], "light_level": [],
+                          "ac_state": [], "light_state": []} for room_id in room_ids}
+    entries = []
+    try:
+        for hour in hours:
+            for room_id in room_ids:
+                sensors_dict[room_id].read_all(hour)
+                controller = rooms[room_id]
+                ac_state, light_state = controller.evaluate_state()
+                entries.append((room_id, "AC", ac_state, ac_state == "COOLING", hour))
+                entries.append((room_id, "Light", light_state, light_state == "ON", hour))
+
+                room_timeline = timeline[room_id]
+                room_timeline["temperature"].append(controller.current_temp)
+                room_timeline["occupied"].append(controller.is_occupied)
+                room_timeline["light_level"].append(controller.current_light_level)
+                room_timeline["ac_state"].append(ac_state)
+                room_timeline["light_state"].append(light_state)
+
+        transitions = db.log_appliance_states(entries)
     except Exception as e:
-        return jsonify({"error": f"Simulation failed at hour {hour}: {str(e)}"}), 500
+        return jsonify({"error": f"Batch simulation failed: {str(e)}"}), 500
+
+    return jsonify({
+        "status": "success",
+        "message": f"Simulated {len(room_ids)} rooms over hours {start_hour}-{end_hour}",
+        "hours": hours,
+        "transitions_logged": transitions,
+        "data": timeline
+    }), 200
 
 @app.route('/api/stats', methods=['GET'])
 def get_db_stats():
     """Database statistics."""
     try:
         stats = db.get_db_stats()
+        stats["observer_queues"] = {room_id: queue.metrics() for room_id, queue in observer_queues.items()}
+        stats["response_cache"] = response_cache.metrics()
         return jsonify({"status": "success", "data": stats}), 200
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Timers and counters in the Prometheus text format."""
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
         
 if __name__ == '__main__':
-    db.init_db()
-    
-    room_name = "Living Room"
-    rooms[room_name] = RoomController(room_name)
-    sensors_dict[room_name] = RoomSensors(room_name)
-    
-    # Adapter to fix the argument mismatch between sensors and database
-    class LoggerAdapter:
-        def __init__(self, logger, room_id):
-            self.logger = logger
-            self.room_id = room_id
-            
-        def update(self, temp, occupied, light_level):
-            # Formats the data exactly how DataLogger expects it
-            self.logger.update(self.room_id, "Temperature", temp)
-            self.logger.update(self.room_id, "Occupancy", 1 if occupied else 0)
-            self.logger.update(self.room_id, "LightLevel", light_level)
-
-    from database import DataLogger
-    logger = DataLogger()
-    adapter = LoggerAdapter(logger, room_name)
-    
-    sensors_dict[room_name].add_observer(rooms[room_name]) # Control logic
-    sensors_dict[room_name].add_observer(adapter)          # Safe database logging
-    
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    metrics.configure_logging()
+    # The debug reloader runs this block in a watcher process as well as
+    # the one serving requests; only the serving one opens the database
+    # and starts workers, so two processes never write the same snapshot
+    if not DEBUG or is_running_from_reloader():
+        # With snapshots the state cache is filled by snapshot.restore()
+        db.init_db(warm=not SNAPSHOTS)
+
+        logger = db.BufferedDataLogger() if BUFFERED_LOGGING else db.DataLogger()
+        for room_name in ROOM_NAMES:
+            add_room(room_name, logger)
+
+        if SNAPSHOTS:
+            snapshot.restore(rooms)
+            snapshot.SnapshotWorker(rooms).start()
+
+        if RETENTION:
+            db.RetentionWorker().start()
+
+    app.run(debug=DEBUG, port=5000)
\ No newline at end of file
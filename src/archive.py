@@ -0,0 +1,161 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+# Columnar archive files for cold sensor_log and appliance_log rows, one
+# file per room. Layout:
+#
+#   8 bytes   MAGIC
+#   uint32    VERSION
+#   uint32    header length
+#   JSON      header: the room and, per series, its row count, the end of
+#             the time range it covers and each column's dtype and offset
+#   columns   fixed-width little-endian arrays, each 8-byte aligned
+#
+# A series is one sensor type ('sensor') or one appliance ('appliance')
+# of the room, sorted by (ts_ms, id). Readers map the file and wrap the
+# columns with numpy.frombuffer, so nothing is parsed or copied. Files
+# are only ever replaced whole, by rename, so a mapped file never changes
+# under a reader.
+
+MAGIC = b"SHEMSCOL"
+VERSION = 1
+SUFFIX = ".col"
+PREFIX = struct.Struct("<8sII")
+ALIGN = 8
+
+# Column dtypes per kind of series
+COLUMNS = {
+    'sensor': {'id': '<i8', 'ts_ms': '<i8', 'value': '<f8'},
+    'appliance': {'id': '<i8', 'ts_ms': '<i8', 'is_on': '<i1', 'state': '<u2'},
+}
+
+def room_path(directory, room_id):
+    """The archive file of a room; names are percent-encoded to be file-safe."""
+    return os.path.join(directory, quote(room_id, safe='') + SUFFIX)
+
+def rooms(directory):
+    """Names of the rooms with an archive file in directory."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [unquote(name[:-len(SUFFIX)]) for name in names if name.endswith(SUFFIX)]
+
+class RoomArchive:
+    """A read-only, memory-mapped archive file of one room."""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = PREFIX.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a v{VERSION} archive file")
+        header = json.loads(self._map[PREFIX.size:PREFIX.size + header_len])
+        self.path = path
+        self.room = header["room"]
+        self.series = {(s["kind"], s["name"]): s for s in header["series"]}
+
+    def names(self, kind):
+        return [name for series_kind, name in self.series if series_kind == kind]
+
+    def columns(self, kind, name):
+        """{column: array} of a series, views over the mapped file; None if absent."""
+        series = self.series.get((kind, name))
+        if series is None:
+            return None
+        result = {column: np.frombuffer(self._map, dtype=dtype, count=series["count"], offset=offset)
+                  for column, (dtype, offset) in series["columns"].items()}
+        if kind == 'appliance':
+            result["states"] = series["states"]
+        return result
+
+    def end_ms(self, kind, name):
+        series = self.series.get((kind, name))
+        return series["end_ms"] if series else None
+
+    def rows(self, kind):
+        return sum(s["count"] for (series_kind, _), s in self.series.items() if series_kind == kind)
+
+_open = {}  # path -> ((inode, mtime, size), RoomArchive)
+_open_lock = threading.Lock()
+
+def open_room(directory, room_id):
+    """The cached RoomArchive of a room, reopened if the file was replaced; None if none."""
+    path = room_path(directory, room_id)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _open_lock:
+        cached = _open.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    # The old map is left to the garbage collector, since arrays handed
+    # out earlier may still point into it
+    room = RoomArchive(path)
+    with _open_lock:
+        _open[path] = (key, room)
+    return room
+
+def forget(directory):
+    """Drops cached archives under directory (after its files are moved or deleted)."""
+    with _open_lock:
+        for path in [path for path in _open if os.path.dirname(path) == directory]:
+            del _open[path]
+
+def write_room(directory, room_id, series):
+    """Atomically writes a room's archive file.
+
+    series is a list of dicts with kind, name, end_ms, the COLUMNS arrays
+    of that kind (sorted by ts_ms, id) and, for appliances, states, the
+    names the state column indexes.
+    """
+    os.makedirs(directory, exist_ok=True)
+    entries = []
+    arrays = []
+    offset = 0
+    for s in series:
+        columns = {}
+        for column, dtype in COLUMNS[s["kind"]].items():
+            array = np.ascontiguousarray(s[column], dtype=dtype)
+            columns[column] = [dtype, offset]
+            arrays.append((offset, array))
+            offset += -(-array.nbytes // ALIGN) * ALIGN
+        entry = {"kind": s["kind"], "name": s["name"], "count": len(s["ts_ms"]),
+                 "end_ms": s["end_ms"], "columns": columns}
+        if s["kind"] == 'appliance':
+            entry["states"] = list(s["states"])
+        entries.append(entry)
+
+    # Column offsets are relative until the header size is known, and
+    # making them absolute can lengthen the header, so settle it first
+    data_start = 0
+    while True:
+        absolute = [{**entry, "columns": {column: [dtype, relative + data_start]
+                                          for column, (dtype, relative) in entry["columns"].items()}}
+                    for entry in entries]
+        header = json.dumps({"room": room_id, "series": absolute}).encode()
+        header_end = PREFIX.size + len(header)
+        if header_end <= data_start:
+            break
+        data_start = -(-header_end // ALIGN) * ALIGN
+
+    path = room_path(directory, room_id)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start - header_end))
+        for relative, array in arrays:
+            f.seek(data_start + relative)
+            f.write(array.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,376 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.http import http_date, parse_etags
+
+import app as flask_app
+import database as db
+import metrics
+import snapshot
+
+# Serve with any ASGI server, e.g. `uvicorn asgi:app --app-dir src --port 5000`.
+# The routes answer like their Flask counterparts in app.py and api.py, but
+# blocking database reads run on a small thread pool and every write goes
+# through one writer thread, so a slow query never ties up the event loop
+# and writers never contend for SQLite's lock.
+
+DB_READ_WORKERS = 8  # threads running blocking read queries
+WRITE_BATCH = 256  # most queued writes handed to the writer thread at once
+
+JSON_TYPE = b"application/json"
+
+log = logging.getLogger(__name__)
+
+class SerialWriter:
+    """Runs every database write on one thread, in arrival order.
+
+    Writes queued while the writer is busy are taken as one batch, and
+    the sensor readings they log (including those from ticks) are
+    committed together at the end of it, so a burst of requests costs
+    one transaction. A write's awaitable resolves once its batch has
+    committed. If that transaction fails, each write's readings are
+    retried on their own, so a bad row only fails the write that logged it.
+    """
+    def __init__(self, max_batch=WRITE_BATCH):
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.readings = []  # only touched on the writer thread
+        self.jobs = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """Starts the writer task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Lets queued writes finish, then stops the writer."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, fn, *args):
+        """Runs fn(*args) on the writer thread and returns its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, args, future))
+        return await future
+
+    def update(self, room_id, sensor_type, value):
+        """DataLogger interface, for writes already running on the writer thread."""
+        self.readings.append((room_id, sensor_type, value, db._now_ms()))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            if not batch:
+                continue
+            results = await loop.run_in_executor(self.executor, self._run_batch, batch)
+            for (_, _, future), (error, value) in zip(batch, results):
+                # A client that went away cancels its future
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(value)
+                else:
+                    future.set_exception(error)
+
+    def _run_batch(self, batch):
+        results = []
+        spans = []  # the slice of self.readings each job logged
+        for fn, args, _ in batch:
+            start = len(self.readings)
+            try:
+                results.append((None, fn(*args)))
+            except Exception as e:
+                results.append((e, None))
+            spans.append((start, len(self.readings)))
+        self.jobs += len(batch)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        if self.readings:
+            rows, self.readings = self.readings, []
+            try:
+                db.record_sensor_readings(rows)
+            except Exception:
+                # A job is only acknowledged once its own readings are written
+                for i, (start, end) in enumerate(spans):
+                    if start == end:
+                        continue
+                    try:
+                        db.record_sensor_readings(rows[start:end])
+                    except Exception as e:
+                        results[i] = (e, None)
+        return results
+
+    def metrics(self):
+        return {
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "largest_batch": self.largest_batch,
+            "avg_batch": round(self.jobs / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+writer = SerialWriter()
+readers = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-reader")
+_started = False
+_start_lock = None
+_snapshots = None  # snapshot.SnapshotWorker, with app.SNAPSHOTS
+
+async def read(fn, *args):
+    """Runs a blocking read on the reader pool."""
+    return await asyncio.get_running_loop().run_in_executor(readers, fn, *args)
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = {key: values[-1] for key, values in parse_qs(scope["query_string"].decode()).items()}
+        self.headers = {key.decode().lower(): value.decode() for key, value in scope["headers"]}
+        self.body = body
+
+    def json(self):
+        """The parsed JSON body, None when empty; ValueError if malformed."""
+        return json.loads(self.body) if self.body else None
+
+def json_body(payload):
+    # Same bytes as Flask's jsonify(), so ETags match across both servers
+    return (flask_app.app.json.dumps(payload) + "\n").encode()
+
+def json_response(payload, status=200):
+    return status, [(b"content-type", JSON_TYPE)], json_body(payload)
+
+async def cached_response(request, key, version, build, on_writer=False):
+    """Serves build()'s payload from app.response_cache, like app.cached_response.
+
+    on_writer runs a rebuild on the writer thread, for payloads whose
+    build writes (the energy summary advances its checkpoints).
+    """
+    cache = flask_app.response_cache
+    entry = cache.lookup(key, version)
+    if entry is None:
+        render = lambda: json_body(build())
+        if on_writer:
+            entry = await writer.submit(cache.get, key, version, render)
+        else:
+            entry = cache.get(key, version, render)
+    body, etag, built_at = entry
+    headers = [
+        (b"content-type", JSON_TYPE),
+        (b"etag", f'"{etag}"'.encode()),
+        (b"last-modified", http_date(built_at).encode()),
+        (b"cache-control", b"no-cache"),
+    ]
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        cache.count_not_modified()
+        return 304, headers, b""
+    return 200, headers, body
+
+async def get_all_status(request):
+    return await cached_response(request, "status", flask_app.rooms.version, flask_app.status_payload)
+
+async def get_room_status(request, room_id):
+    if room_id not in flask_app.rooms:
+        return json_response({"error": "Room not found"}, 404)
+    return json_response(flask_app.room_payload(room_id))
+
+async def get_sensor_history(request, room_id, sensor_type):
+    try:
+        history, next_cursor = await read(
+            db.get_sensor_history_page, room_id, sensor_type,
+            request.args.get("limit", 50), request.args.get("cursor"))
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    except Exception as e:
+        return json_response({"error": f"Database error: {str(e)}"}, 500)
+    return json_response({"status": "success", "room": room_id, "sensor": sensor_type,
+                          "data": history, "next_cursor": next_cursor})
+
+async def get_energy_summary(request):
+    try:
+        version = await read(db.energy_version)
+        return await cached_response(request, "energy", version, flask_app.energy_payload,
+                                     on_writer=True)
+    except Exception as e:
+        return json_response({"error": f"Database error: {str(e)}"}, 500)
+
+async def advance_simulation(request):
+    data = request.json() or {}
+    hour = data.get("hour")
+    room_id = data.get("room_id")
+
+    if hour is None or not room_id:
+        return json_response({"error": "Missing 'hour' or 'room_id' parameter"}, 400)
+    if room_id not in flask_app.rooms or room_id not in flask_app.sensors_dict:
+        return json_response({"error": f"Room '{room_id}' not initialized."}, 404)
+
+    try:
+        # Ticks change room state and log rows, so they run on the writer too
+        return json_response(await writer.submit(flask_app.tick_room, room_id, hour))
+    except Exception as e:
+        return json_response({"error": f"Simulation failed at hour {hour}: {str(e)}"}, 500)
+
+async def log_sensor(request):
+    data = request.json() or {}
+    # Expected format: {"room_id": "Living Room", "type": "Temp", "value": 24.5}
+    if not all(key in data for key in ("room_id", "type", "value")):
+        return json_response({"error": "Expected 'room_id', 'type' and 'value'"}, 400)
+    if not isinstance(data['room_id'], str) or not isinstance(data['type'], str):
+        return json_response({"error": "'room_id' and 'type' must be strings"}, 400)
+    # Checked here, since a bad value would only fail once its batch commits
+    value = db.sensor_value(data['value'])
+    await writer.submit(writer.update, data['room_id'], data['type'], value)
+    return json_response({"status": "success", "message": "Sensor data logged"}, 201)
+
+async def log_appliance(request):
+    data = request.json() or {}
+    # Expected format: {"room_id": "Kitchen", "appliance": "lights", "state": "ON", "is_on": 1}
+    if not all(key in data for key in ("room_id", "appliance", "state", "is_on")):
+        return json_response({"error": "Expected 'room_id', 'appliance', 'state' and 'is_on'"}, 400)
+    await writer.submit(db.record_appliance_state, data['room_id'], data['appliance'], data['state'], data['is_on'])
+    return json_response({"status": "success", "message": "Appliance state logged"}, 201)
+
+async def get_db_stats(request):
+    try:
+        stats = await read(db.get_db_stats)
+    except Exception as e:
+        return json_response({"error": f"Database error: {str(e)}"}, 500)
+    stats["response_cache"] = flask_app.response_cache.metrics()
+    stats["writer"] = writer.metrics()
+    return json_response({"status": "success", "data": stats})
+
+async def get_metrics(request):
+    return 200, [(b"content-type", metrics.CONTENT_TYPE.encode())], metrics.render().encode()
+
+# Flask-style rule templates, so metrics carry the same route labels as app.py
+ROUTES = [
+    ('GET', '/api/status', get_all_status),
+    ('GET', '/api/room/<room_id>', get_room_status),
+    ('GET', '/api/history/<room_id>/<sensor_type>', get_sensor_history),
+    ('GET', '/api/energy', get_energy_summary),
+    ('GET', '/api/stats', get_db_stats),
+    ('GET', '/api/metrics', get_metrics),
+    ('POST', '/api/tick', advance_simulation),
+    ('POST', '/log/sensor', log_sensor),
+    ('POST', '/log/appliance', log_appliance),
+]
+_routes = [(method, re.compile(re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', rule) + '$'), rule, handler)
+           for method, rule, handler in ROUTES]
+
+def match(method, path):
+    """Returns (handler, path params, rule), or (None, status, None) for 404/405."""
+    allowed = False
+    for route_method, pattern, rule, handler in _routes:
+        found = pattern.match(path)
+        if found:
+            if route_method == method:
+                return handler, found.groupdict(), rule
+            allowed = True
+    return None, 405 if allowed else 404, None
+
+async def startup():
+    """Opens the database, registers the rooms and starts the writer."""
+    global _started, _snapshots
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(writer.executor, lambda: db.init_db(warm=not flask_app.SNAPSHOTS))
+    # Readings from ticks go straight to the writer, which already runs
+    # them off the event loop, so no QueuedObserver is needed
+    for room_name in flask_app.ROOM_NAMES:
+        flask_app.add_room(room_name, writer, queued=False)
+    if flask_app.SNAPSHOTS:
+        await loop.run_in_executor(writer.executor, snapshot.restore, flask_app.rooms)
+        _snapshots = snapshot.SnapshotWorker(flask_app.rooms).start()
+    writer.start()
+    if flask_app.RETENTION:
+        db.RetentionWorker().start()
+    _started = True
+
+async def shutdown():
+    global _started
+    await writer.stop()
+    if _snapshots is not None:
+        # After the writer, so the last snapshot covers every queued write
+        await asyncio.get_running_loop().run_in_executor(None, _snapshots.stop)
+    _started = False
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await startup()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    global _start_lock
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    # Servers that skip lifespan events start the app on the first request
+    if not _started:
+        _start_lock = _start_lock or asyncio.Lock()
+        async with _start_lock:
+            if not _started:
+                await startup()
+
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    start = time.perf_counter()
+    handler, params, rule = match(scope["method"], scope["path"])
+    if handler is None:
+        status, headers, body = json_response({"error": "Not found" if params == 404 else "Method not allowed"}, params)
+    else:
+        try:
+            status, headers, body = await handler(Request(scope, body), **params)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            status, headers, body = json_response({"error": "Invalid JSON body"}, 400)
+        except (ValueError, sqlite3.IntegrityError) as e:
+            # A value the database layer rejected
+            status, headers, body = json_response({"error": str(e)}, 400)
+        except sqlite3.Error as e:
+            status, headers, body = json_response({"error": f"Database error: {str(e)}"}, 500)
+        except Exception:
+            log.exception("Unhandled error in %s %s", scope["method"], scope["path"])
+            status, headers, body = json_response({"error": "Internal server error"}, 500)
+    if metrics.ENABLED:
+        metrics.observe_request(scope["method"], rule or "unmatched", status, time.perf_counter() - start)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+if __name__ == '__main__':
+    metrics.configure_logging()
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("uvicorn is not installed: pip install uvicorn, "
+                         "or serve asgi:app with any other ASGI server")
+    uvicorn.run(app, port=5000)
@@ -0,0 +1,78 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import database as db
+import energy_engine
+from bench_energy import generate_transitions
+
+def generate_readings(rows, rooms, seed=0):
+    """A reading every 10 minutes per room, as record_sensor_readings rows."""
+    rng = np.random.default_rng(seed)
+    start = db.to_ms(datetime(2026, 1, 1))
+    per_room = rows // rooms
+    values = rng.uniform(18, 32, size=per_room).tolist()
+    return [(f"Room {r}", "Temperature", value, start + i * 600_000)
+            for r in range(rooms) for i, value in enumerate(values)]
+
+def best_of(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def measure(rooms):
+    """Seconds for the long-range reads, on whatever mix of table and archive holds the rows."""
+    bulk_time, bulk = best_of(energy_engine.calculate_energy_bulk)
+    recompute_time, recompute = best_of(lambda: db.recompute_energy("Room 0", "AC"))
+    year = (datetime(2026, 1, 1), datetime(2027, 1, 1))
+    export_time, exported = best_of(lambda: sum(1 for _ in db.iter_sensor_log("Room 0", "Temperature", *year)))
+    return {"bulk energy": bulk_time, "recompute (1 appliance)": recompute_time,
+            "export (1 room, 1 year)": export_time}, (bulk, recompute, exported)
+
+def benchmark(appliance_rows, sensor_rows, rooms):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db.set_db_path(db_path)
+        db.init_db()
+        db.record_appliance_states(generate_transitions(appliance_rows, rooms))
+        db.record_sensor_readings(generate_readings(sensor_rows, rooms))
+        print(f"{appliance_rows:,} appliance rows and {sensor_rows:,} sensor rows across {rooms} rooms")
+
+        live, live_results = measure(rooms)
+        size_before = os.path.getsize(db_path)
+
+        start = time.perf_counter()
+        moved = db.archive_before(datetime(2030, 1, 1))
+        print(f"Archived {moved} in {time.perf_counter() - start:.1f}s")
+        db.incremental_vacuum(pause=0)
+        archived, archived_results = measure(rooms)
+
+        bulk, recompute, exported = live_results
+        assert archived_results[2] == exported, "archive export lost rows"
+        assert abs(archived_results[1] - recompute) < 1e-6, "archive recompute differs"
+        worst = max(abs(archived_results[0][key] - bulk[key]) for key in bulk)
+        assert worst < 1e-6, f"archive bulk energy differs by {worst} kWh"
+
+        for name, seconds in live.items():
+            print(f"  {name:<24} table {seconds * 1000:>8.1f} ms   archive {archived[name] * 1000:>8.1f} ms "
+                  f"({seconds / archived[name]:.1f}x)")
+        stats = db.archive_stats()
+        print(f"  database file {size_before / 1e6:.1f} MB; archive {stats['bytes'] / 1e6:.1f} MB in "
+              f"{stats['files']} files, database now {os.path.getsize(db_path) / 1e6:.1f} MB")
+        db.close_all_connections()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-range reads from SQLite vs the columnar archive")
+    parser.add_argument("--appliance-rows", type=int, default=1_000_000)
+    parser.add_argument("--sensor-rows", type=int, default=1_000_000)
+    parser.add_argument("--rooms", type=int, default=50)
+    args = parser.parse_args()
+    benchmark(args.appliance_rows, args.sensor_rows, args.rooms)
@@ -0,0 +1,65 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import database as db
+import energy_engine
+
+def generate_transitions(rows, rooms, seed=0):
+    """Random ON/OFF rows, time-ordered per (room, appliance), as insert tuples.
+
+    Repeated ON or OFF rows are included on purpose so the parity check
+    covers the restart/ignore rules, not just clean pairs.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = rooms * 2
+    per_pair = rows // pairs
+    start = db.to_ms(datetime(2026, 1, 1))
+    result = []
+    for p in range(pairs):
+        room_id = f"Room {p // 2}"
+        appliance = ("AC", "Light")[p % 2]
+        gaps = rng.integers(1, 180 * 60 * 1000, size=per_pair)
+        stamps = start + np.cumsum(gaps)
+        is_on = (rng.random(per_pair) < 0.5).astype(int)
+        for on, ts in zip(is_on.tolist(), stamps.tolist()):
+            result.append((room_id, appliance, "ON" if on else "OFF", on, ts))
+    return result
+
+def benchmark(rows, rooms):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db.set_db_path(db_path)
+        db.init_db()
+        data = generate_transitions(rows, rooms)
+        db.record_appliance_states(data)
+        print(f"Generated {len(data):,} transition rows across {rooms * 2} appliances")
+
+        start = time.perf_counter()
+        bulk = energy_engine.calculate_energy_bulk()
+        bulk_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scalar = {key: db.recompute_energy(*key) for key in bulk}
+        scalar_time = time.perf_counter() - start
+
+        worst = max(abs(bulk[key] - scalar[key]) for key in bulk)
+        assert worst < 1e-6, f"bulk and scalar results differ by {worst} kWh"
+        incremental = max(abs(db.calculate_energy(*key) - scalar[key]) for key in bulk)
+        assert incremental < 1e-6, f"calculate_energy and scalar results differ by {incremental} kWh"
+        print(f"Parity: {len(bulk)} appliances match across bulk, recompute and calculate_energy "
+              f"(max diff {max(worst, incremental):.2e} kWh)")
+        print(f"  scalar: {scalar_time:.2f}s")
+        print(f"    bulk: {bulk_time:.2f}s ({scalar_time / bulk_time:.1f}x faster)")
+        db.close_all_connections()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk vs scalar energy integration")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--rooms", type=int, default=500)
+    args = parser.parse_args()
+    benchmark(args.rows, args.rooms)
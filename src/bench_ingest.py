@@ -0,0 +1,40 @@
+import os
+import tempfile
+import time
+
+import database
+
+ROOMS = 100
+READINGS_PER_ROOM = 20
+
+def run_logger(logger, rooms=ROOMS, readings=READINGS_PER_ROOM):
+    """Feeds rooms x readings x 3 sensor values through a logger, returns seconds."""
+    start = time.perf_counter()
+    for i in range(readings):
+        for r in range(rooms):
+            room_id = f"Room {r}"
+            logger.update(room_id, "Temperature", 24.0 + (i % 5))
+            logger.update(room_id, "Occupancy", i % 2)
+            logger.update(room_id, "LightLevel", 100 + i)
+    if hasattr(logger, 'close'):
+        logger.close()
+    return time.perf_counter() - start
+
+def benchmark():
+    rows = ROOMS * READINGS_PER_ROOM * 3
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, factory in [
+            ("per-row", database.DataLogger),
+            ("buffered", database.BufferedDataLogger),
+        ]:
+            db_name = os.path.join(tmp, f"{name}.db")
+            database.init_db(db_name)
+            elapsed = run_logger(factory(db_name))
+            results[name] = rows / elapsed
+            print(f"{name:>9}: {rows} rows in {elapsed:.2f}s -> {results[name]:,.0f} rows/sec")
+
+    print(f"Speedup: {results['buffered'] / results['per-row']:.1f}x")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import database as db
+import snapshot
+from bench_energy import generate_transitions
+from bench_archive import generate_readings
+from state_store import RoomStateStore
+
+HISTORY_SIZES = [10_000, 100_000, 1_000_000]  # appliance_log rows (and as many sensor_log rows)
+ROOMS = 50
+ROWS_AFTER_SNAPSHOT = 1000  # appliance rows logged between the snapshot and the restart
+
+def startup(db_path, rooms, use_snapshot):
+    """What app.py does at startup; returns (seconds, cached states). Run in a fresh process."""
+    db.set_db_path(db_path)
+    start = time.perf_counter()
+    db.init_db(warm=not use_snapshot)
+    if use_snapshot:
+        store = RoomStateStore()
+        for i in range(rooms):
+            store.add(f"Room {i}")
+        snapshot.restore(store)
+    return time.perf_counter() - start, db._last_state.get(db_path, {})
+
+def restart(db_path, rooms, use_snapshot):
+    """Runs startup() in a new interpreter, like a real restart (OS file cache stays warm)."""
+    output = subprocess.run([sys.executable, __file__, "--startup", db_path, str(rooms), str(int(use_snapshot))],
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output)
+    return result["seconds"], result["states"]
+
+def benchmark(sizes, rooms):
+    print(f"{rooms} rooms; {ROWS_AFTER_SNAPSHOT} appliance rows logged after each snapshot")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            db.set_db_path(db_path)
+            db.init_db()
+            transitions = generate_transitions(rows + ROWS_AFTER_SNAPSHOT, rooms)
+            db.record_appliance_states(transitions[:rows])
+            db.record_sensor_readings(generate_readings(rows, rooms))
+            store = RoomStateStore()
+            for i in range(rooms):
+                store.add(f"Room {i}")
+            start = time.perf_counter()
+            snapshot.write(store)
+            write_time = time.perf_counter() - start
+            db.record_appliance_states(transitions[rows:])
+            db.close_all_connections()
+
+            full_time, full_states = restart(db_path, rooms, False)
+            snapshot_time, snapshot_states = restart(db_path, rooms, True)
+            assert snapshot_states == full_states, "snapshot restore left a different state cache"
+            print(f"{rows:>10,} rows: full scan {full_time * 1000:>8.1f} ms   snapshot {snapshot_time * 1000:>7.1f} ms "
+                  f"({full_time / snapshot_time:.1f}x)   first snapshot write {write_time * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup time with and without a state snapshot")
+    parser.add_argument("--rows", type=int, nargs="+", default=HISTORY_SIZES)
+    parser.add_argument("--rooms", type=int, default=ROOMS)
+    parser.add_argument("--startup", nargs=3, help=argparse.SUPPRESS)  # child process of restart()
+    args = parser.parse_args()
+    if args.startup:
+        db_path, rooms, use_snapshot = args.startup
+        seconds, states = startup(db_path, int(rooms), use_snapshot == "1")
+        print(json.dumps({"seconds": seconds, "states": sorted([*key, *entry] for key, entry in states.items())}))
+    else:
+        benchmark(args.rows, args.rooms)
@@ -0,0 +1,55 @@
+import argparse
+import time
+
+import numpy as np
+
+from control import RoomController, state_code
+from rules import RuleTable
+
+def make_rooms(n, seed=0):
+    """n controllers with random readings; about 1% carry a manual override."""
+    rng = np.random.default_rng(seed)
+    temps = rng.uniform(18, 32, n)
+    occupied = rng.random(n) < 0.5
+    light_levels = rng.choice([100, 250, 800], n)
+    controllers = []
+    for i in range(n):
+        controller = RoomController(f"Room {i}")
+        controller.update(float(temps[i]), bool(occupied[i]), int(light_levels[i]))
+        if i % 100 == 0:
+            controller.manual_ac_override = "OFF"
+        if i % 150 == 0:
+            controller.manual_light_override = "ON"
+        controllers.append(controller)
+    return controllers, temps, occupied, light_levels
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+def benchmark(n, repeat):
+    controllers, temps, occupied, light_levels = make_rooms(n)
+    table = RuleTable([c.room_name for c in controllers])
+    ac_override = np.array([state_code(c.manual_ac_override) for c in controllers], dtype=np.uint8)
+    light_override = np.array([state_code(c.manual_light_override) for c in controllers], dtype=np.uint8)
+
+    loop_time, expected = timed(lambda: [c.evaluate_state() for c in controllers], repeat)
+    apply_time, applied = timed(lambda: table.apply(controllers), repeat)
+    array_time, _ = timed(lambda: table.evaluate(temps, occupied, light_levels, None, ac_override, light_override), repeat)
+
+    assert applied == expected, "rule table disagrees with RoomController.evaluate_state"
+    print(f"{n:,} rooms, decisions match the per-object loop")
+    # Each room makes two decisions (AC and lights)
+    for name, seconds in [("per-object loop", loop_time),
+                          ("RuleTable.apply (objects)", apply_time),
+                          ("RuleTable.evaluate (arrays)", array_time)]:
+        print(f"  {name:>28}: {2 * n / seconds:>14,.0f} decisions/sec")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vectorized rules vs per-object evaluate_state")
+    parser.add_argument("--rooms", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    benchmark(args.rooms, args.repeat)
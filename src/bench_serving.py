@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote, urlsplit
+
+import app as flask_app
+import api as flask_api
+import asgi
+import database as db
+
+ROOMS = 20
+REQUESTS = 2000  # per concurrency level
+CONCURRENCY = [1, 8, 32, 128]
+
+# (weight, method, path, body) with {room} and {hour} filled in per request;
+# dashboards polling plus sensors and ticks writing
+WORKLOAD = [
+    (25, "GET", "/api/status", None),
+    (10, "GET", "/api/room/{room}", None),
+    (15, "GET", "/api/history/{room}/Temperature?limit=50", None),
+    (10, "GET", "/api/energy", None),
+    (25, "POST", "/log/sensor", {"room_id": "{room}", "type": "Temperature", "value": 24.5}),
+    (5, "POST", "/log/appliance", {"room_id": "{room}", "appliance": "Fan", "state": "ON", "is_on": 1}),
+    (10, "POST", "/api/tick", {"room_id": "{room}", "hour": "{hour}"}),
+]
+
+def make_requests(n, room_names, seed=0):
+    """n (method, path, json body bytes) requests drawn from WORKLOAD."""
+    rng = random.Random(seed)
+    weights = [weight for weight, *_ in WORKLOAD]
+    result = []
+    for _ in range(n):
+        _, method, path, body = rng.choices(WORKLOAD, weights)[0]
+        room = rng.choice(room_names)
+        hour = rng.randint(1, 24)
+        path = path.format(room=quote(room), hour=hour)
+        if body is not None:
+            body = {key: (room if value == "{room}" else hour if value == "{hour}" else value)
+                    for key, value in body.items()}
+            body = json.dumps(body).encode()
+        result.append((method, path, body))
+    return result
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {
+        "requests": n,
+        "errors": errors,
+        "rps": round(n / elapsed, 1),
+        "p50_ms": round(latencies[n // 2] * 1000, 2),
+        "p99_ms": round(latencies[min(n - 1, int(n * 0.99))] * 1000, 2),
+    }
+
+def run_closed_loop(requests, concurrency, send):
+    """concurrency threads each send() requests back to back; send returns a status."""
+    pending = iter(requests)
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def worker():
+        while True:
+            with lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            start = time.perf_counter()
+            status = send(*request)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+def bench_wsgi(requests, concurrency):
+    """Flask apps called in-process from a thread per client, like the threaded dev server."""
+    local = threading.local()
+
+    def send(method, path, body):
+        if not hasattr(local, "clients"):
+            local.clients = (flask_app.app.test_client(), flask_api.app.test_client())
+        # The /log routes live in api.py
+        client = local.clients[1] if path.startswith("/log/") else local.clients[0]
+        return client.open(path, method=method, data=body, content_type="application/json").status_code
+
+    return run_closed_loop(requests, concurrency, send)
+
+async def call_asgi(method, path, body):
+    """Sends one request through asgi.app and returns the response status."""
+    path, _, query = path.partition("?")
+    # Servers hand ASGI apps the decoded path
+    scope = {"type": "http", "method": method, "path": unquote(path), "raw_path": path.encode(),
+             "query_string": query.encode(), "headers": [(b"content-type", b"application/json")]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body or b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.app(scope, receive, send)
+    return sent[0]["status"]
+
+async def bench_asgi_levels(requests_per_level, levels):
+    """Runs every level on one event loop, which owns the writer task."""
+    await asgi.startup()
+    results = {}
+    try:
+        for concurrency in levels:
+            pending = iter(requests_per_level[concurrency])
+            latencies = []
+            errors = 0
+
+            async def client():
+                nonlocal errors
+                for request in pending:
+                    start = time.perf_counter()
+                    status = await call_asgi(*request)
+                    latencies.append(time.perf_counter() - start)
+                    if status >= 400:
+                        errors += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+            results[concurrency] = summarize(latencies, errors, time.perf_counter() - start)
+    finally:
+        await asgi.shutdown()
+    return results
+
+def bench_http(url, requests, concurrency):
+    """Drives a running server over HTTP, one keep-alive connection per client."""
+    parts = urlsplit(url)
+    local = threading.local()
+
+    def send(method, path, body):
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        local.conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = local.conn.getresponse()
+        response.read()
+        return response.status
+
+    return run_closed_loop(requests, concurrency, send)
+
+def fresh_db(tmp, name):
+    """Points the database layer at a new file and registers nothing else."""
+    db.close_all_connections()
+    db.set_db_path(os.path.join(tmp, f"{name}.db"))
+    db.init_db()
+    flask_app.response_cache.clear()
+
+def print_row(mode, concurrency, result):
+    print(f"{mode:>5} {concurrency:>5} {result['rps']:>9,.0f} {result['p50_ms']:>9.2f} "
+          f"{result['p99_ms']:>9.2f} {result['errors']:>7}")
+
+def server_rooms(url):
+    """Room names a running server reports in /api/status."""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    conn.request("GET", "/api/status")
+    rooms = list(json.loads(conn.getresponse().read())["data"])
+    conn.close()
+    return rooms
+
+def benchmark(levels, requests, url=None):
+    room_names = server_rooms(url) if url else [f"Room {i}" for i in range(ROOMS)]
+    workload = {concurrency: make_requests(requests, room_names, seed=concurrency) for concurrency in levels}
+    print(f"{'mode':>5} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+    if url:
+        for concurrency in levels:
+            print_row("http", concurrency, bench_http(url, workload[concurrency], concurrency))
+        return
+
+    # No retention worker, and the sensor logger queue would hide the write cost
+    flask_app.RETENTION = False
+    flask_app.ROOM_NAMES = room_names
+    with tempfile.TemporaryDirectory() as tmp:
+        fresh_db(tmp, "wsgi")
+        logger = db.BufferedDataLogger()
+        for room_name in room_names:
+            flask_app.add_room(room_name, logger, queued=False)
+        for concurrency in levels:
+            print_row("wsgi", concurrency, bench_wsgi(workload[concurrency], concurrency))
+        logger.close()
+        flask_api.logger.close()
+
+        fresh_db(tmp, "asgi")
+        results = asyncio.run(bench_asgi_levels(workload, levels))
+        for concurrency in levels:
+            print_row("asgi", concurrency, results[concurrency])
+        print(f"writer: {asgi.writer.metrics()}")
+        db.close_all_connections()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="p50/p99 latency of the API at increasing concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=REQUESTS, help="requests per concurrency level")
+    parser.add_argument("--url", help="load a running server (e.g. http://127.0.0.1:5000) instead of "
+                                      "comparing the Flask and ASGI apps in-process; app.py alone "
+                                      "answers the /log routes with 404, they are served by api.py")
+    args = parser.parse_args()
+    benchmark(args.concurrency, args.requests, args.url)
@@ -0,0 +1,64 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import database as db
+import sharding
+
+SHARD_COUNTS = [1, 2, 4, 8]
+WRITERS = 8  # threads writing at once, like concurrent API requests
+ROOMS = 64
+WRITES_PER_WRITER = 1000
+
+def run_writers(store, writers, writes):
+    """writers threads each commit writes appliance rows one at a time; returns rows/sec."""
+    rooms = [f"Room {i}" for i in range(ROOMS)]
+    start_ms = db.to_ms("2026-01-01 00:00:00")
+    barrier = threading.Barrier(writers + 1)
+
+    def writer(w):
+        barrier.wait()
+        for i in range(writes):
+            room = rooms[(w + i * writers) % len(rooms)]
+            store.record_appliance_state(room, "AC", ("OFF", "ON")[i % 2], i % 2, start_ms + i * 60_000)
+        db.release_connection()
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return writers * writes / (time.perf_counter() - start)
+
+def benchmark(shard_counts, writers, writes, directory=None):
+    print(f"{writers} writer threads, {writes} single-row commits each, {ROOMS} rooms, "
+          f"synchronous={db.PRAGMAS['synchronous']}")
+    baseline = None
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for shards in shard_counts:
+            store = sharding.ShardedStore(os.path.join(tmp, f"store-{shards}"), shards)
+            store.init_db()
+            rate = run_writers(store, writers, writes)
+            baseline = baseline or rate
+            stats = store.get_db_stats()
+            assert stats["appliance_log"] == writers * writes, stats["appliance_log"]
+            per_shard = [shard["appliance_log"] for shard in stats["shards"]]
+            print(f"{shards:>2} shards: {rate:>9,.0f} rows/sec ({rate / baseline:.2f}x)  rows per shard {per_shard}")
+            store.close()
+            db.close_all_connections()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write throughput of a room-sharded store by shard count")
+    parser.add_argument("--shards", type=int, nargs="+", default=SHARD_COUNTS)
+    parser.add_argument("--writers", type=int, default=WRITERS)
+    parser.add_argument("--writes", type=int, default=WRITES_PER_WRITER, help="rows per writer thread")
+    parser.add_argument("--synchronous", default=db.PRAGMAS['synchronous'],
+                        help="SQLite synchronous mode; FULL waits for the disk on every commit")
+    parser.add_argument("--dir", help="directory for the stores (default: a temp dir), to bench a real disk")
+    args = parser.parse_args()
+    db.PRAGMAS['synchronous'] = args.synchronous
+    benchmark(args.shards, args.writers, args.writes, args.dir)
@@ -0,0 +1,52 @@
+import argparse
+import time
+import tracemalloc
+
+from control import RoomController
+from state_store import RoomStateStore
+
+def measure(build):
+    """Returns (bytes allocated by build(), the built object)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+def build_store(names):
+    store = RoomStateStore()
+    for name in names:
+        store.add(name)
+    return store
+
+def benchmark(n):
+    # Names are shared by both layouts, so leave them out of the totals
+    names = [f"Room {i}" for i in range(n)]
+    object_bytes, controllers = measure(lambda: [RoomController(name) for name in names])
+    index_bytes, _ = measure(lambda: {name: i for i, name in enumerate(names)})
+    store = build_store(names)
+    column_bytes = sum(column[:n].nbytes for column in store.columns.values())
+
+    # Both layouts need a name -> room lookup (the app's dict, the store's
+    # index), so it is reported separately from the room state itself
+    print(f"{n:,} rooms, bytes per room")
+    print(f"  RoomController + 2 Appliance objects: {object_bytes / n:6.1f}")
+    print(f"  RoomStateStore columns:               {column_bytes / n:6.1f} ({object_bytes / column_bytes:.1f}x smaller)")
+    print(f"  name -> room index (either layout):   {index_bytes / n:6.1f}")
+
+    start = time.perf_counter()
+    for controller in controllers:
+        controller.evaluate_state()
+    loop_time = time.perf_counter() - start
+    store.evaluate_all()  # compiles the rule table once
+    start = time.perf_counter()
+    store.evaluate_all()
+    store_time = time.perf_counter() - start
+    print(f"  evaluate every room: objects {loop_time * 1000:.1f} ms, store {store_time * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory per room: objects vs columnar store")
+    parser.add_argument("--rooms", type=int, default=100_000)
+    args = parser.parse_args()
+    benchmark(args.rooms)
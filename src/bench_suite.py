@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import api as flask_api
+import app as flask_app
+import database as db
+from bench_energy import generate_transitions
+from bench_ingest import run_logger
+
+# Offline benchmark suite: every path is driven in-process through Flask's
+# test client against a temp database, with fixed seeds, so two runs on
+# the same machine are comparable. Results go to a JSON file per commit;
+# --compare diffs a run against an earlier one.
+
+RESULTS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench_results"))
+REPEAT = 5  # timed repetitions per point; the median is reported
+REGRESSION_THRESHOLD = 0.25  # relative slowdown flagged by --compare; sub-ms timings wander run to run
+
+# (full, --quick) sizes for each scaling curve
+INGEST_ROOMS = (100, 20)
+INGEST_READINGS = (20, 10)  # readings per room, x3 sensor values each
+TICK_ROOMS = ((1, 10, 100), (1, 10))
+ENERGY_HISTORY = ((10_000, 100_000, 1_000_000), (1_000, 10_000, 100_000))  # appliance_log rows
+ENERGY_HISTORY_ROOMS = 10
+SUMMARY_ROOMS = ((1, 10, 100, 1000), (1, 10, 100))
+SUMMARY_ROWS_PER_ROOM = 200
+
+def median_ms(fn, repeat):
+    """Median wall time of repeat calls to fn, in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 3)
+
+def percentiles_ms(latencies):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {
+        "p50_ms": round(latencies[n // 2] * 1000, 3),
+        "p99_ms": round(latencies[min(n - 1, int(n * 0.99))] * 1000, 3),
+    }
+
+def fresh_db(tmp, name):
+    """Points the database layer at a new file with empty caches."""
+    db.close_all_connections()
+    db.set_db_path(os.path.join(tmp, f"{name}.db"))
+    db.init_db()
+    flask_app.response_cache.clear()
+
+def register_rooms(names):
+    """Registers rooms with the Flask app once; readings are logged inline."""
+    logger = db.BufferedDataLogger()
+    for name in names:
+        if name not in flask_app.rooms:
+            flask_app.add_room(name, logger, queued=False)
+    return logger
+
+def bench_ingest(tmp, rooms, readings, repeat):
+    """Sensor rows/sec through each logger and through POST /log/sensor (median of repeat runs)."""
+    rows = rooms * readings * 3
+    results = {}
+    for name, factory in [("DataLogger", db.DataLogger), ("BufferedDataLogger", db.BufferedDataLogger)]:
+        rates = []
+        for run in range(repeat):
+            fresh_db(tmp, f"ingest-{name}-{run}")
+            rates.append(rows / run_logger(factory(), rooms, readings))
+        results[f"ingest.{name}"] = {"rows": rows, "rows_per_sec": round(statistics.median(rates), 1)}
+
+    client = flask_api.app.test_client()
+    rates = []
+    for run in range(repeat):
+        fresh_db(tmp, f"ingest-api-{run}")
+        # api.logger binds to the database of its first flush, so give it a fresh one
+        flask_api.logger = db.BufferedDataLogger()
+        start = time.perf_counter()
+        for i in range(readings):
+            for r in range(rooms):
+                client.post("/log/sensor", json={"room_id": f"Room {r}", "type": "Temperature", "value": 24.0 + i % 5})
+        flask_api.logger.close()
+        rates.append(rooms * readings / (time.perf_counter() - start))
+    results["ingest./log/sensor"] = {"rows": rooms * readings, "rows_per_sec": round(statistics.median(rates), 1)}
+    return results
+
+def bench_tick(tmp, room_counts, repeat):
+    """POST /api/tick for every room over repeat simulated days, per room count.
+
+    ticks_per_sec is the median day's; the percentiles span every tick.
+    """
+    results = {}
+    client = flask_app.app.test_client()
+    for n in room_counts:
+        fresh_db(tmp, f"tick-{n}")
+        names = [f"Tick Room {i}" for i in range(n)]
+        logger = register_rooms(names)
+        latencies = []
+        rates = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for hour in range(1, 25):
+                for name in names:
+                    tick_start = time.perf_counter()
+                    response = client.post("/api/tick", json={"room_id": name, "hour": hour})
+                    latencies.append(time.perf_counter() - tick_start)
+                    assert response.status_code == 200, response.get_json()
+            rates.append(24 * n / (time.perf_counter() - start))
+        logger.close()
+        results[f"tick.rooms={n}"] = {"ticks": len(latencies), "ticks_per_sec": round(statistics.median(rates), 1),
+                                      **percentiles_ms(latencies)}
+    return results
+
+def bench_calculate_energy(tmp, history_sizes, repeat):
+    """calculate_energy latency against appliance_log size.
+
+    cold is the first call, which folds the whole history into the
+    checkpoints; warm calls only read new rows; recompute is the full
+    rescan of one appliance that calculate_energy replaced.
+    """
+    results = {}
+    for rows in history_sizes:
+        fresh_db(tmp, f"energy-{rows}")
+        db.record_appliance_states(generate_transitions(rows, ENERGY_HISTORY_ROOMS))
+        results[f"calculate_energy.rows={rows}"] = {
+            "cold_ms": median_ms(lambda: db.calculate_energy("Room 0", "AC"), 1),
+            "warm_ms": median_ms(lambda: db.calculate_energy("Room 0", "AC"), repeat),
+            "recompute_ms": median_ms(lambda: db.recompute_energy("Room 0", "AC"), repeat),
+        }
+    return results
+
+def bench_energy_summary(tmp, room_counts, repeat):
+    """GET /api/energy latency per room count, without and with the response cache."""
+    results = {}
+    client = flask_app.app.test_client()
+
+    def uncached():
+        flask_app.response_cache.clear()
+        assert client.get("/api/energy").status_code == 200
+
+    for n in room_counts:
+        fresh_db(tmp, f"summary-{n}")
+        db.record_appliance_states(generate_transitions(n * SUMMARY_ROWS_PER_ROOM, n))
+        results[f"api_energy.rooms={n}"] = {
+            "cold_ms": median_ms(uncached, 1),
+            "uncached_ms": median_ms(uncached, repeat),
+            "cached_ms": median_ms(lambda: client.get("/api/energy"), repeat),
+        }
+    return results
+
+def git_revision():
+    """(short commit, whether the tree has local changes), or ('unknown', None)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", None
+
+def run_suite(quick=False, repeat=REPEAT, only=None):
+    size = 1 if quick else 0
+    commit, dirty = git_revision()
+    random.seed(0)
+    sections = {
+        "ingest": lambda tmp: bench_ingest(tmp, INGEST_ROOMS[size], INGEST_READINGS[size], repeat),
+        "tick": lambda tmp: bench_tick(tmp, TICK_ROOMS[size], repeat),
+        "calculate_energy": lambda tmp: bench_calculate_energy(tmp, ENERGY_HISTORY[size], repeat),
+        "api_energy": lambda tmp: bench_energy_summary(tmp, SUMMARY_ROOMS[size], repeat),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, section in sections.items():
+            if only and name not in only:
+                continue
+            start = time.perf_counter()
+            results.update(section(tmp))
+            print(f"{name}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        db.close_all_connections()
+    return {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "quick": quick,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "numpy": np.__version__,
+            "machine": f"{platform.system()} {platform.machine()}",
+        },
+        "results": results,
+    }
+
+def higher_is_better(metric):
+    return metric.endswith("_per_sec")
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Prints every shared metric's change; returns the regressed (point, metric) pairs."""
+    regressions = []
+    print(f"{'point':<34} {'metric':<14} {'baseline':>11} {'current':>11} {'change':>8}")
+    for point, values in current["results"].items():
+        old_values = baseline["results"].get(point, {})
+        for metric, value in values.items():
+            old = old_values.get(metric)
+            if not (metric.endswith("_ms") or higher_is_better(metric)) or not old:
+                continue
+            change = value / old - 1
+            worse = -change if higher_is_better(metric) else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions.append((point, metric))
+            print(f"{point:<34} {metric:<14} {old:>11,.3f} {value:>11,.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+def print_results(run):
+    for point, values in run["results"].items():
+        print(f"{point:<34} " + "  ".join(f"{metric}={value:,}" for metric, value in values.items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the ingest, tick and reporting paths")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast check")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--only", nargs="+", choices=["ingest", "tick", "calculate_energy", "api_energy"])
+    parser.add_argument("--output", help="results file (default: bench_results/<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="results file of an earlier run; exits 1 if any metric regressed")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    run = run_suite(args.quick, args.repeat, args.only)
+    print_results(run)
+
+    output = args.output
+    if output is None:
+        meta = run["meta"]
+        suffix = ("-dirty" if meta["dirty"] else "") + ("-quick" if meta["quick"] else "")
+        output = os.path.join(RESULTS_DIR, f"{meta['commit']}{suffix}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, run, args.threshold):
+            sys.exit(1)
@@ -1,14 +1,53 @@
+import metrics
+
+EVALUATE_SECONDS = metrics.histogram(
+    "shems_controller_evaluate_seconds", "Time to evaluate one room's appliance states")
+
+# Default automation thresholds
+AC_ON_ABOVE = 24  # °C
+LIGHT_ON_BELOW = 300  # lux, only while occupied
+
+# Appliance ratings in kW
+AC_POWER = 1.5
+LIGHT_POWER = 0.06
+
+# Compact integer codes for appliance states. Code 0 means "no state",
+# which is how override arrays say no manual override is set. The list is
+# fixed: request input never adds to it.
+STATE_NAMES = [None, "OFF", "COOLING", "ON"]
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+# States a manual override may force, per appliance; None or "" clears it
+OVERRIDE_STATES = {
+    "ac": ("COOLING", "OFF"),
+    "light": ("ON", "OFF"),
+}
+
+def state_code(name):
+    """Returns the code for a state name; raises ValueError for unknown names."""
+    if not name:
+        return 0
+    try:
+        return STATE_CODES[name]
+    except (KeyError, TypeError):
+        raise ValueError(f"unknown appliance state {name!r}") from None
+
 class Appliance:
+    __slots__ = ('name', 'power', 'state')
+
     def __init__(self, name, power):
         self.name = name
         self.power = power
         self.state = "OFF"
 
 class RoomController:
+    __slots__ = ('room_name', 'ac', 'lights', 'current_temp', 'current_light_level',
+                 'is_occupied', 'manual_ac_override', 'manual_light_override')
+
     def __init__(self, room_name):
         self.room_name = room_name
-        self.ac = Appliance("AC", 1.5)
-        self.lights = Appliance("Light", 0.06)
+        self.ac = Appliance("AC", AC_POWER)
+        self.lights = Appliance("Light", LIGHT_POWER)
         self.current_temp = 25.0
         self.current_light_level = 500
         self.is_occupied = False
@@ -21,18 +60,19 @@ class RoomController:
         self.is_occupied = occupied
         self.current_light_level = light_level
 
+    @metrics.timed(EVALUATE_SECONDS)
     def evaluate_state(self):
         """Logic to turn things ON/OFF based on sensor data"""
         # AC Logic
         if self.manual_ac_override:
             self.ac.state = self.manual_ac_override
         else:
-            self.ac.state = "COOLING" if self.current_temp > 24 else "OFF"
-            
+            self.ac.state = "COOLING" if self.current_temp > AC_ON_ABOVE else "OFF"
+
         # Light Logic
         if self.manual_light_override:
             self.lights.state = self.manual_light_override
         else:
-            self.lights.state = "ON" if self.is_occupied and self.current_light_level < 300 else "OFF"
-            
-        return self.ac.state, self.lights.state
\ No newline at end of file
+            self.lights.state = "ON" if self.is_occupied and self.current_light_level < LIGHT_ON_BELOW else "OFF"
+
+        return self.ac.state, self.lights.state
@@ -1,200 +1,1870 @@
+import atexit
+import base64
+import contextlib
+import heapq
+import logging
+import math
+import numbers
+import os
+import shutil
 import sqlite3
+import threading
+import time
 from datetime import datetime, timedelta
 
-def init_db():
-    """Initializes the SQLite database and creates tables."""
-    conn = sqlite3.connect('smarthome.db')
-    cursor = conn.cursor()
+import numpy as np
+
+import archive
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Database file used when no explicit path is given
+DB_PATH = os.environ.get('SHEMS_DB_PATH', 'smarthome.db')
+
+# Applied to every new connection. WAL lets readers run alongside the
+# single writer, and busy_timeout waits on a lock instead of failing.
+# auto_vacuum only takes effect on a new file (or after VACUUM) and has to
+# come before journal_mode, which creates the file.
+PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,  # negative = KiB, so ~16 MB page cache
+    'mmap_size': 268435456,  # 256 MB
+    'busy_timeout': 5000,  # ms
+}
+
+# Idle connections kept per database file once threads release them
+POOL_SIZE = 8
+
+_local = threading.local()
+_pool = {}
+_pool_lock = threading.Lock()
+
+DB_CONNECT_SECONDS = metrics.histogram(
+    "shems_db_connect_seconds", "Time to open a connection and apply PRAGMAS")
+DB_CALL_SECONDS = metrics.histogram(
+    "shems_db_call_seconds", "Time spent in database.py functions, queries included", ["function"])
+DB_ROWS = metrics.counter(
+    "shems_db_rows_total", "Rows read or written by database.py functions", ["function"])
+
+def _timed(fn):
+    """Records fn's call durations in DB_CALL_SECONDS under its name."""
+    return metrics.timed(DB_CALL_SECONDS, fn.__qualname__)(fn)
+
+def set_db_path(db_path):
+    """Points the database layer at a different SQLite file."""
+    global DB_PATH
+    DB_PATH = db_path
+
+def current_db_path():
+    """The file calls without an explicit path use on this thread."""
+    return getattr(_local, 'db_path', None) or DB_PATH
+
+@contextlib.contextmanager
+def using_db(db_path):
+    """Sends this thread's calls without an explicit path to db_path.
+
+    Lets a sharded store run the module's functions against one shard
+    file while other threads use theirs.
+    """
+    previous = getattr(_local, 'db_path', None)
+    _local.db_path = db_path
+    try:
+        yield
+    finally:
+        _local.db_path = previous
+
+@metrics.timed(DB_CONNECT_SECONDS)
+def connect(db_path=None):
+    """Opens a new connection with the tuned PRAGMAS applied."""
+    conn = sqlite3.connect(db_path or current_db_path(), check_same_thread=False)
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+def get_connection(db_path=None):
+    """Returns the calling thread's connection, reusing a pooled one if possible."""
+    path = db_path or current_db_path()
+    conns = _local.__dict__.setdefault('conns', {})
+    conn = conns.get(path)
+    if conn is None:
+        with _pool_lock:
+            idle = _pool.get(path)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = connect(path)
+        conns[path] = conn
+    return conn
+
+def release_connection():
+    """Hands the calling thread's connections back to the pool.
+
+    Flask apps call this on request teardown so the next request thread
+    can reuse the connection instead of opening a new one.
+    """
+    conns = getattr(_local, 'conns', None)
+    if not conns:
+        return
+    with _pool_lock:
+        for path, conn in conns.items():
+            if conn.in_transaction:
+                conn.rollback()
+            idle = _pool.setdefault(path, [])
+            if len(idle) < POOL_SIZE:
+                idle.append(conn)
+            else:
+                conn.close()
+    conns.clear()
+
+def close_all_connections():
+    """Closes the calling thread's and all pooled connections."""
+    release_connection()
+    with _pool_lock:
+        for idle in _pool.values():
+            for conn in idle:
+                conn.close()
+        _pool.clear()
+
+# Timestamps are stored as integer milliseconds of wall-clock time since
+# 1970-01-01, i.e. the same naive local time the old text columns held,
+# so hour and day buckets are plain integer arithmetic
+EPOCH = datetime(1970, 1, 1)
+HOUR_MS = 3_600_000
+DAY_MS = 24 * HOUR_MS
+
+def to_ms(value):
+    """Epoch milliseconds for a datetime, a stored-format string or ms itself."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    # Rounded to the nearest millisecond, as SQLite's own date functions do
+    return (value - EPOCH + timedelta(microseconds=500)) // timedelta(milliseconds=1)
+
+def format_ts(ms, timespec='microseconds'):
+    """The API's '%Y-%m-%d %H:%M:%S.%f' string for epoch milliseconds.
+
+    timespec='seconds' drops the fraction, as rollup buckets do.
+    """
+    # isoformat() is about twice as fast as strftime() here
+    return (EPOCH + timedelta(milliseconds=ms)).isoformat(' ', timespec)
+
+def _now_ms():
+    return to_ms(datetime.now())
+
+# Dictionary tables: every room, sensor type, appliance and state name is
+# stored once and the log tables refer to it by integer id
+DICTIONARIES = {
+    'room': 'rooms',
+    'sensor_type': 'sensor_types',
+    'appliance': 'appliances',
+    'state': 'states',
+}
+
+# (db path, kind) -> {name: id} / {id: name}. Only committed names are
+# cached: a name added in a transaction that rolls back frees its id for
+# the next new name, so caching it early would give two names one id.
+# Committed ids are never reused, so cached entries stay valid.
+_name_ids = {}
+_id_names = {}
+
+def _check_name(kind, name):
+    if not isinstance(name, str):
+        raise ValueError(f"{kind} name must be a string, not {name!r}")
+    return name
+
+def name_to_id(conn, kind, name, create=True, db_path=None):
+    """The dictionary id for a name, adding the name if create is set.
+
+    Returns None for an unknown name when create is False, so read paths
+    never write. Names must be strings; anything else raises ValueError
+    before a row is written (or returns None for a lookup).
+    """
+    ids = _name_ids.setdefault((db_path or current_db_path(), kind), {})
+    if not isinstance(name, str):
+        if create:
+            _check_name(kind, name)
+        return None
+    name_id = ids.get(name)
+    if name_id is None:
+        table = DICTIONARIES[kind]
+        select = f"SELECT id FROM {table} WHERE name = ?"
+        row = conn.execute(select, (name,)).fetchone()
+        if row is not None and not conn.in_transaction:
+            name_id = ids[name] = row[0]
+            return name_id
+        if row is None and create:
+            # Not cached yet: this transaction may still roll back
+            conn.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+            row = conn.execute(select, (name,)).fetchone()
+        if row is None:
+            return None
+        name_id = row[0]
+    return name_id
+
+def id_names(conn, kind, db_path=None):
+    """The {id: name} map of a dictionary table, reloaded when it has grown.
+
+    Inside a transaction the map is read but not cached, since it may
+    hold names that roll back.
+    """
+    key = (db_path or current_db_path(), kind)
+    names = _id_names.get(key)
+    table = DICTIONARIES[kind]
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    if names is None or len(names) != count:
+        names = dict(conn.execute(f"SELECT id, name FROM {table}").fetchall())
+        if not conn.in_transaction:
+            _id_names[key] = names
+    return names
+
+def _clear_dictionary_cache(db_path=None):
+    path = db_path or current_db_path()
+    for cache in (_name_ids, _id_names):
+        for key in [key for key in cache if key[0] == path]:
+            del cache[key]
 
-    # 1. sensor_log: Raw data from sensors
+def sensor_value(value):
+    """A reading as a float; raises ValueError unless it is a finite number."""
+    if isinstance(value, (str, bytes)) or not isinstance(value, numbers.Real):
+        raise ValueError(f"sensor value must be a number, not {value!r}")
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"sensor value must be finite, not {value}")
+    return value
+
+def _sensor_rows(conn, rows, db_path=None):
+    """(room, sensor_type, value, timestamp) rows as SENSOR_INSERT_SQL parameters.
+
+    Every name and value is checked before any name is looked up or added.
+    """
+    rows = [(_check_name('room', room_id), _check_name('sensor_type', sensor_type), sensor_value(value), timestamp)
+            for room_id, sensor_type, value, timestamp in rows]
+    return [(name_to_id(conn, 'room', room_id, db_path=db_path),
+             name_to_id(conn, 'sensor_type', sensor_type, db_path=db_path),
+             value, to_ms(timestamp))
+            for room_id, sensor_type, value, timestamp in rows]
+
+SENSOR_INSERT_SQL = '''
+    INSERT INTO sensor_log (room_id, sensor_type_id, value, ts_ms)
+    VALUES (?, ?, ?, ?)
+'''
+
+# Hot queries, kept here so check_query_plans() explains the exact SQL the
+# functions below run. Room, sensor type and appliance are dictionary ids.
+HISTORY_SQL = '''
+    SELECT value, ts_ms FROM sensor_log
+    WHERE room_id = ? AND sensor_type_id = ?
+    ORDER BY ts_ms DESC LIMIT 50
+'''
+# Keyset pages, newest first. (ts_ms, id) is unique, so a page starts
+# strictly after the last row of the previous one whatever gets inserted
+HISTORY_PAGE_SQL = '''
+    SELECT id, value, ts_ms FROM sensor_log
+    WHERE room_id = ? AND sensor_type_id = ? AND (ts_ms, id) < (?, ?)
+    ORDER BY ts_ms DESC, id DESC LIMIT ?
+'''
+EXPORT_SQL = '''
+    SELECT id, value, ts_ms FROM sensor_log
+    WHERE room_id = ? AND sensor_type_id = ? AND ts_ms >= ? AND ts_ms < ?
+    ORDER BY ts_ms, id
+'''
+ENERGY_ROWS_SQL = '''
+    SELECT state_id, is_on, ts_ms FROM appliance_log
+    WHERE room_id = ? AND appliance_id = ?
+    ORDER BY ts_ms ASC
+'''
+LAST_STATE_SQL = '''
+    SELECT ts_ms, is_on FROM appliance_log
+    WHERE room_id = ? AND appliance_id = ?
+    ORDER BY ts_ms DESC LIMIT 1
+'''
+ALL_LAST_STATES_SQL = '''
+    SELECT room_id, appliance_id, MAX(ts_ms), is_on, state_id FROM appliance_log
+    GROUP BY room_id, appliance_id
+'''
+# Newest row per key among those above a row id, for replaying what was
+# logged after a snapshot (see read_changes()). NOT INDEXED keeps SQLite
+# from scanning the whole covering index for the GROUP BY; a rowid range
+# only reads the new rows.
+NEW_LAST_STATES_SQL = '''
+    SELECT room_id, appliance_id, MAX(ts_ms), is_on, state_id FROM appliance_log NOT INDEXED
+    WHERE id > ? GROUP BY room_id, appliance_id
+'''
+NEW_READINGS_SQL = '''
+    SELECT room_id, sensor_type_id, MAX(id), value FROM sensor_log NOT INDEXED
+    WHERE id > ? GROUP BY room_id, sensor_type_id
+'''
+APPLIANCE_INSERT_SQL = '''
+    INSERT INTO appliance_log (room_id, appliance_id, state_id, is_on, ts_ms)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# Covering indexes: each hot query is answered from the index alone, in
+# timestamp order, without touching the table or sorting
+INDEXES = {
+    'idx_sensor_log_room_type_ts':
+        'sensor_log (room_id, sensor_type_id, ts_ms, value)',
+    'idx_appliance_log_room_appliance_ts':
+        'appliance_log (room_id, appliance_id, ts_ms, is_on, state_id)',
+}
+
+# query name -> (sql, index it must use)
+HOT_QUERIES = {
+    'sensor_history': (HISTORY_SQL, 'idx_sensor_log_room_type_ts'),
+    'sensor_history_page': (HISTORY_PAGE_SQL, 'idx_sensor_log_room_type_ts'),
+    'sensor_export': (EXPORT_SQL, 'idx_sensor_log_room_type_ts'),
+    'energy_rows': (ENERGY_ROWS_SQL, 'idx_appliance_log_room_appliance_ts'),
+    'last_state': (LAST_STATE_SQL, 'idx_appliance_log_room_appliance_ts'),
+}
+
+# Largest page get_sensor_history_page() returns
+HISTORY_PAGE_LIMIT = 1000
+# Rows fetched per round trip while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+POWER_RATINGS = {
+    "AC": 1.5,
+    "Light": 0.06
+}
+
+# Serializes update_energy_checkpoints() per database file within this process
+_energy_locks = {}
+
+# db path -> {(room_id, appliance): (ts_ms, is_on)} of the newest
+# appliance_log row. Warmed by init_db and written through by
+# record_appliance_state, so log_appliance_state can skip its
+# read-before-write. Other processes (api.py, simulation.py) write the
+# same file, so a file's entries are only trusted while its
+# appliance_log_version() is the one in _state_versions; any other value
+# drops them.
+_last_state = {}
+_last_state_lock = threading.Lock()
+_state_versions = {}  # db path -> appliance_log_version() its entries match
+
+# Rollup resolutions and their bucket widths in ms; the width is also
+# what sensor_rollup.resolution stores
+ROLLUP_BUCKETS = {
+    'hour': HOUR_MS,
+    'day': DAY_MS,
+}
+
+SENSOR_ROLLUP_TRIGGER_SQL = '''
+    CREATE TRIGGER IF NOT EXISTS sensor_log_rollup AFTER INSERT ON sensor_log
+    BEGIN
+    ''' + "".join(f'''
+        INSERT INTO sensor_rollup (room_id, sensor_type_id, resolution, bucket_ms, count, total, min_value, max_value)
+        VALUES (NEW.room_id, NEW.sensor_type_id, {width}, NEW.ts_ms - NEW.ts_ms % {width},
+                1, NEW.value, NEW.value, NEW.value)
+        ON CONFLICT (room_id, sensor_type_id, resolution, bucket_ms) DO UPDATE SET
+            count = count + 1,
+            total = total + excluded.total,
+            min_value = MIN(min_value, excluded.min_value),
+            max_value = MAX(max_value, excluded.max_value);
+    ''' for width in ROLLUP_BUCKETS.values()) + '''
+    END
+'''
+
+# Spans up to these lengths are served at the given resolution by 'auto'
+AUTO_RESOLUTION = [
+    (timedelta(hours=6), 'raw'),
+    (timedelta(days=7), 'hour'),
+]
+RAW_RANGE_LIMIT = 5000
+
+# Days each sensor tier is kept by apply_retention(); None keeps it
+# forever. The trigger has already rolled every raw row into its hour
+# and day buckets, so pruning a tier leaves the coarser ones intact.
+RETENTION_DAYS = {
+    'raw': 30,
+    'hour': 365,
+    'day': None,
+}
+RETENTION_BATCH_SIZE = 5000  # rows deleted per transaction
+RETENTION_PAUSE = 0.05  # seconds between transactions, so other writers get the lock
+RETENTION_WINDOW = (2, 5)  # local hours [start, end) in which RetentionWorker runs
+VACUUM_PAGES_PER_STEP = 2000  # pages freed per incremental_vacuum transaction
+# Days after which RetentionWorker moves whole days of sensor and
+# appliance rows into the columnar archive (see archive_before()), ahead
+# of pruning; None leaves them in SQLite. The raw tier's retention still
+# applies to archived sensor rows; archived appliance rows are kept.
+ARCHIVE_AFTER_DAYS = 7
+
+# What apply_retention() has done in this process, for get_db_stats()
+_retention_totals = {"rows_deleted": {tier: 0 for tier in RETENTION_DAYS},
+                     "bytes_reclaimed": 0, "last_run": None}
+
+def _create_tables(cursor):
+    # 1. Dictionary tables for the names the logs refer to
+    for table in DICTIONARIES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+
+    # 2. sensor_log: Raw data from sensors
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS sensor_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room_id TEXT,
-            sensor_type TEXT,
+            room_id INTEGER, -- rooms.id
+            sensor_type_id INTEGER, -- sensor_types.id
             value REAL,
-            timestamp DATETIME
+            ts_ms INTEGER
         )
     ''')
 
-    # 2. appliance_log: Tracking when things turn ON/OFF
+    # 3. appliance_log: Tracking when things turn ON/OFF
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS appliance_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room_id TEXT,
-            appliance TEXT,
-            state TEXT,
+            room_id INTEGER, -- rooms.id
+            appliance_id INTEGER, -- appliances.id
+            state_id INTEGER, -- states.id
             is_on INTEGER, -- 1 for ON, 0 for OFF
-            timestamp DATETIME
+            ts_ms INTEGER
         )
     ''')
 
-    # 3. energy_log: The "Calculated" data
+    # 4. energy_log: The "Calculated" data
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS energy_log (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            room_id TEXT,
-            appliance TEXT,
+            room_id INTEGER,
+            appliance_id INTEGER,
             kwh REAL,
-            period_start DATETIME,
-            period_end DATETIME
+            start_ms INTEGER,
+            end_ms INTEGER
         )
     ''')
 
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully.")
+    # 5. energy_checkpoint: Running kWh per appliance for incremental reports
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS energy_checkpoint (
+            room_id INTEGER,
+            appliance_id INTEGER,
+            last_row_id INTEGER, -- newest appliance_log id folded in
+            on_since_ms INTEGER, -- start of the open ON interval, NULL if off
+            kwh REAL, -- cumulative
+            last_ts_ms INTEGER, -- newest timestamp folded in
+            PRIMARY KEY (room_id, appliance_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # 6. Rollups: hourly/daily sensor aggregates and hourly kWh
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sensor_rollup (
+            room_id INTEGER,
+            sensor_type_id INTEGER,
+            resolution INTEGER, -- bucket width in ms (ROLLUP_BUCKETS)
+            bucket_ms INTEGER, -- start of the hour/day
+            count INTEGER,
+            total REAL,
+            min_value REAL,
+            max_value REAL,
+            PRIMARY KEY (room_id, sensor_type_id, resolution, bucket_ms)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS energy_rollup (
+            room_id INTEGER,
+            appliance_id INTEGER,
+            bucket_ms INTEGER, -- start of the hour
+            kwh REAL,
+            PRIMARY KEY (room_id, appliance_id, bucket_ms)
+        ) WITHOUT ROWID
+    ''')
+
+def _create_indexes(cursor):
+    # Keeps sensor_rollup current for every writer, including raw inserts
+    cursor.execute(SENSOR_ROLLUP_TRIGGER_SQL)
+    # Indexes for the per-room hot queries
+    for name, target in INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+def _table_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+# Tables of the text-keyed schema (user_version 0)
+LEGACY_TABLES = ['sensor_log', 'appliance_log', 'energy_log', 'energy_checkpoint',
+                 'sensor_rollup', 'energy_rollup']
+
+# Epoch ms of a legacy text timestamp, exact to the millisecond
+LEGACY_TS_SQL = "CAST(ROUND((julianday({0}) - 2440587.5) * 86400000) AS INTEGER)"
+
+def _migrate_to_compact(cursor):
+    """Schema 0 -> 1: text names and timestamps to dictionary ids and epoch ms.
+
+    Sensor and appliance rows keep their ids, so history order and the
+    energy watermark are unchanged. Rows whose timestamp cannot be parsed
+    are dropped. Energy checkpoints, energy_log and both rollups are
+    derived data and are rebuilt from the converted rows.
+    """
+    # 1. Move the old tables aside; their trigger and index names clash
+    cursor.execute("DROP TRIGGER IF EXISTS sensor_log_rollup")
+    for name in INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    legacy = [table for table in LEGACY_TABLES if _table_exists(cursor, table)]
+    for table in legacy:
+        cursor.execute(f"ALTER TABLE {table} RENAME TO legacy_{table}")
+    _create_tables(cursor)
+
+    # 2. Copy the logs, names into dictionaries and timestamps into ms
+    dropped = 0
+    if 'sensor_log' in legacy:
+        cursor.execute("INSERT OR IGNORE INTO rooms (name) SELECT DISTINCT room_id FROM legacy_sensor_log")
+        cursor.execute("INSERT OR IGNORE INTO sensor_types (name) SELECT DISTINCT sensor_type FROM legacy_sensor_log")
+        cursor.execute(f'''
+            INSERT INTO sensor_log (id, room_id, sensor_type_id, value, ts_ms)
+            SELECT * FROM (
+                SELECT l.id, r.id, s.id, l.value, {LEGACY_TS_SQL.format('l.timestamp')} AS ts_ms
+                FROM legacy_sensor_log l
+                LEFT JOIN rooms r ON r.name = l.room_id
+                LEFT JOIN sensor_types s ON s.name = l.sensor_type
+            ) WHERE ts_ms IS NOT NULL
+        ''')
+        copied = cursor.rowcount
+        dropped += cursor.execute("SELECT COUNT(*) FROM legacy_sensor_log").fetchone()[0] - copied
+    if 'appliance_log' in legacy:
+        cursor.execute("INSERT OR IGNORE INTO rooms (name) SELECT DISTINCT room_id FROM legacy_appliance_log")
+        cursor.execute("INSERT OR IGNORE INTO appliances (name) SELECT DISTINCT appliance FROM legacy_appliance_log")
+        cursor.execute("INSERT OR IGNORE INTO states (name) SELECT DISTINCT state FROM legacy_appliance_log")
+        cursor.execute(f'''
+            INSERT INTO appliance_log (id, room_id, appliance_id, state_id, is_on, ts_ms)
+            SELECT * FROM (
+                SELECT l.id, r.id, a.id, s.id, l.is_on, {LEGACY_TS_SQL.format('l.timestamp')} AS ts_ms
+                FROM legacy_appliance_log l
+                LEFT JOIN rooms r ON r.name = l.room_id
+                LEFT JOIN appliances a ON a.name = l.appliance
+                LEFT JOIN states s ON s.name = l.state
+            ) WHERE ts_ms IS NOT NULL
+        ''')
+        copied = cursor.rowcount
+        dropped += cursor.execute("SELECT COUNT(*) FROM legacy_appliance_log").fetchone()[0] - copied
+
+    # 3. Drop the old tables; energy is recomputed by the next checkpoint pass
+    for table in legacy:
+        cursor.execute(f"DROP TABLE legacy_{table}")
+    rebuild_sensor_rollups(cursor)
+    if dropped:
+        log.warning("Migration dropped %d rows with unreadable timestamps.", dropped)
+
+def _add_checkpoint_ts(cursor):
+    """Schema 1 -> 2: energy_checkpoint.last_ts_ms, so back-dated rows can be detected."""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(energy_checkpoint)")]
+    if 'last_ts_ms' not in columns:
+        cursor.execute("ALTER TABLE energy_checkpoint ADD COLUMN last_ts_ms INTEGER")
+    cursor.execute('''
+        UPDATE energy_checkpoint SET last_ts_ms = (
+            SELECT MAX(a.ts_ms) FROM appliance_log a
+            WHERE a.room_id = energy_checkpoint.room_id AND a.appliance_id = energy_checkpoint.appliance_id
+              AND a.id <= energy_checkpoint.last_row_id)
+        WHERE last_ts_ms IS NULL
+    ''')
+
+def _autoincrement_logs(cursor):
+    """Schema 2 -> 3: AUTOINCREMENT ids on the log tables, so ids are never reused.
+
+    Without it SQLite hands out the id of a deleted newest row again, and
+    archive_before() can delete it, so a new appliance row could get an id
+    at or below the energy watermark and never be folded in. Rows keep
+    their ids, and the next id is set above every id the table, the
+    archive and the energy checkpoints have seen.
+    """
+    tables = [table for table in ('sensor_log', 'appliance_log', 'energy_log')
+              if 'AUTOINCREMENT' not in cursor.execute(
+                  "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]]
+    if not tables:
+        return
+
+    # 1. Rebuild the tables; the trigger and indexes are recreated after the migration
+    cursor.execute("DROP TRIGGER IF EXISTS sensor_log_rollup")
+    for name in INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    for table in tables:
+        cursor.execute(f"ALTER TABLE {table} RENAME TO old_{table}")
+    _create_tables(cursor)
+    for table in tables:
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM old_{table}")
+        cursor.execute(f"DROP TABLE old_{table}")
+
+    # 2. Ids already given to rows that are now only archived or folded
+    db_path = next(row[2] for row in cursor.execute("PRAGMA database_list") if row[1] == 'main')
+    seen = _archived_max_ids(archive_dir(db_path))
+    seen['appliance_log'] = max(seen['appliance_log'], cursor.execute(
+        "SELECT COALESCE(MAX(last_row_id), 0) FROM energy_checkpoint").fetchone()[0])
+    for table in tables:
+        _raise_sequence(cursor, table, seen.get(table, 0))
+
+def _archived_max_ids(directory, rooms=None):
+    """{table: highest row id} held in the archive files in directory.
+
+    rooms limits it to those rooms' files.
+    """
+    seen = {'sensor_log': 0, 'appliance_log': 0}
+    for room_id in archive.rooms(directory):
+        if rooms is not None and room_id not in rooms:
+            continue
+        room = archive.open_room(directory, room_id)
+        for kind, table in (('sensor', 'sensor_log'), ('appliance', 'appliance_log')):
+            for name in room.names(kind):
+                ids = room.columns(kind, name)["id"]
+                if len(ids):
+                    seen[table] = max(seen[table], int(ids.max()))
+    return seen
+
+def _raise_sequence(cursor, table, seq):
+    """Makes the next AUTOINCREMENT id of table at least seq + 1."""
+    cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, table))
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, seq))
+
+# MIGRATIONS[v] upgrades a database from user_version v to v + 1
+MIGRATIONS = [_migrate_to_compact, _add_checkpoint_ts, _autoincrement_logs]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+@_timed
+def migrate_schema(db_path=None):
+    """Brings the database to SCHEMA_VERSION; returns the version it had.
+
+    New databases get the current schema directly. Older ones run each
+    pending migration in one transaction, so a failed migration leaves
+    the file as it was.
+    """
+    conn = get_connection(db_path)
+    if conn.in_transaction:
+        conn.commit()
+    # Take the write lock first so concurrent starts migrate only once
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"Database schema v{version} is newer than this code (v{SCHEMA_VERSION})")
+        if version == 0 and not _table_exists(cursor, 'sensor_log'):
+            start = SCHEMA_VERSION
+        else:
+            start = version
+        for step in range(start, SCHEMA_VERSION):
+            MIGRATIONS[step](cursor)
+        _create_tables(cursor)
+        _create_indexes(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if start < SCHEMA_VERSION:
+        log.info("Migrated database schema v%d -> v%d.", version, SCHEMA_VERSION)
+    return version
+
+@_timed
+def init_db(db_path=None, warm=True):
+    """Initializes the SQLite database, creating or migrating its tables.
+
+    warm=False leaves the state cache cold, for callers that fill it from
+    a snapshot instead (see snapshot.restore()).
+    """
+    _clear_dictionary_cache(db_path)
+    migrate_schema(db_path)
+    if warm:
+        warm_state_cache(db_path)
+
+    problems = check_query_plans(db_path)
+    if problems:
+        log.warning("Hot queries not using their indexes: %s", problems)
+    log.info("Database initialized successfully.")
+
+@_timed
+def check_query_plans(db_path=None):
+    """Runs EXPLAIN QUERY PLAN on HOT_QUERIES.
+
+    Returns {query name: plan} for every query that does not search its
+    covering index or still needs a temp B-tree to sort. Empty means all
+    hot queries are index-only. Sorting only the "right part" of an ORDER
+    BY is allowed: that orders rows with equal timestamps by id, which
+    the keyset queries need and which never holds more than one tie group.
+    """
+    # A new connection, since a cached EXPLAIN statement is not re-prepared
+    # after the schema changes and would report the plan of a dropped index
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        problems = {}
+        for name, (sql, index) in HOT_QUERIES.items():
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, (0,) * sql.count("?"))
+            plan = " | ".join(row[3] for row in cursor.fetchall())
+            if f"COVERING INDEX {index}" not in plan or "TEMP B-TREE FOR ORDER BY" in plan:
+                problems[name] = plan
+    finally:
+        conn.close()
+    return problems
 
 class DataLogger:
     """Observer class that logs sensor data to the database."""
-    def __init__(self, db_name='smarthome.db'):
+    def __init__(self, db_name=None):
         self.db_name = db_name
 
+    @_timed
     def update(self, room_id, sensor_type, value):
         """This method is called automatically by the Sensor Subject."""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO sensor_log (room_id, sensor_type, value, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (room_id, sensor_type, value, timestamp))
-        
-        conn.commit()
-        conn.close()
-        print(f"[Log] Recorded {sensor_type} in {room_id}: {value}")
+        value = sensor_value(value)
+        conn = get_connection(self.db_name)
+        with conn:
+            conn.execute(SENSOR_INSERT_SQL, (name_to_id(conn, 'room', room_id, db_path=self.db_name),
+                                             name_to_id(conn, 'sensor_type', sensor_type, db_path=self.db_name),
+                                             value, _now_ms()))
+        DB_ROWS.inc(1, ("DataLogger.update",))
+        log.debug("Recorded %s in %s: %s", sensor_type, room_id, value)
 
-def calculate_energy(room_id, appliance):
-    """Calculates kWh based on appliance ON/OFF duration."""
-    POWER_RATINGS = {
-        "AC": 1.5,
-        "Light": 0.06
-    }
-    
-    conn = sqlite3.connect('smarthome.db')
-    cursor = conn.cursor()
+class BufferedDataLogger(DataLogger):
+    """DataLogger that batches readings and writes them in one transaction.
 
-    cursor.execute('''
-        SELECT state, is_on, timestamp FROM appliance_log 
-        WHERE room_id = ? AND appliance = ? 
-        ORDER BY timestamp ASC
-    ''', (room_id, appliance))
-    
-    logs = cursor.fetchall()
-    
-    if not logs:
-        conn.close()
-        return 0
+    Readings are kept in memory and flushed with executemany() once
+    max_rows readings are pending or max_delay seconds have passed since
+    the oldest pending reading. Pending rows are also flushed on close()
+    and at interpreter exit.
 
-    total_hours = 0
-    last_on_time = None
+    Rows stay buffered until their transaction commits. A flush that
+    fails on a locked or unavailable database keeps them for the next
+    one; any other failure retries them one row at a time, so only the
+    rows that cannot be written are dropped (and counted in dropped).
+    """
+    def __init__(self, db_name=None, max_rows=500, max_delay=1.0):
+        super().__init__(db_name)
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._buffer = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+        # Opened on first flush so the DB path can still be configured
+        self._conn = None
+        self._closed = threading.Event()
+        # Flushes a partially filled buffer when no new readings arrive
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
 
-    for state, is_on, timestamp in logs:
-        # Robustly handle timestamp conversion
+    def update(self, room_id, sensor_type, value):
+        """Queues a reading; flushes when the row or time limit is hit.
+
+        Raises ValueError for a value that is not a number or a name that
+        is not a string, so one bad reading cannot fail a whole flush.
+        """
+        _check_name('room', room_id)
+        _check_name('sensor_type', sensor_type)
+        value = sensor_value(value)
+        timestamp = _now_ms()
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append((room_id, sensor_type, value, timestamp))
+            if (len(self._buffer) >= self.max_rows
+                    or time.monotonic() - self._oldest >= self.max_delay):
+                self._flush_locked()
+
+    def flush(self):
+        """Writes all pending readings in a single transaction."""
+        with self._lock:
+            self._flush_locked()
+
+    @_timed
+    def _flush_locked(self):
+        if not self._buffer or self._closed.is_set():
+            return
+        if self._conn is None:
+            self._conn = connect(self.db_name)
+        rows = self._buffer
         try:
-            ts = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S.%f')
-        except ValueError:
-            ts = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-        
-        if is_on == 1: 
+            self._write(rows)
+        except sqlite3.OperationalError as e:
+            log.warning("Sensor flush failed, keeping %d readings for the next one: %s", len(rows), e)
+            return
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            log.error("Sensor flush failed, retrying %d readings one by one: %s", len(rows), e)
+            rows = self._write_each(rows)
+        else:
+            self._buffer = []
+        DB_ROWS.inc(len(rows), ("BufferedDataLogger._flush_locked",))
+
+    def _write(self, rows):
+        with self._conn:
+            self._conn.executemany(SENSOR_INSERT_SQL, _sensor_rows(self._conn, rows, self.db_name))
+
+    def _write_each(self, rows):
+        """Writes rows one transaction each, dropping those that fail; returns those written."""
+        written = []
+        for i, row in enumerate(rows):
+            try:
+                self._write([row])
+            except sqlite3.OperationalError as e:
+                log.warning("Sensor flush failed, keeping %d readings for the next one: %s", len(rows) - i, e)
+                self._buffer = rows[i:]
+                return written
+            except (sqlite3.Error, ValueError, TypeError) as e:
+                self.dropped += 1
+                log.error("Dropped sensor reading %r: %s", row, e)
+            else:
+                written.append(row)
+        self._buffer = []
+        return written
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.max_delay):
+            try:
+                self.flush()
+            except Exception:
+                # Keep flushing; later readings must not pile up behind one error
+                log.exception("Periodic sensor flush failed")
+
+    def close(self):
+        """Flushes pending readings and closes the connection."""
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._flush_locked()
+            self._closed.set()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+@_timed
+def recompute_energy(room_id, appliance):
+    """Integrates kWh over the full history of one appliance, archive included.
+
+    Read-only reference for calculate_energy(): it rescans every row, so
+    use it for audits rather than reports.
+    """
+    rows = _appliance_history(get_connection(), room_id, appliance)
+    DB_ROWS.inc(len(rows), ("recompute_energy",))
+
+    total_ms = 0
+    last_on_time = None
+
+    for ts, is_on in rows:
+        if is_on == 1:
             last_on_time = ts
-        elif is_on == 0 and last_on_time: 
-            duration = ts - last_on_time
-            total_hours += duration.total_seconds() / 3600
-            last_on_time = None 
+        elif is_on == 0 and last_on_time is not None:
+            total_ms += ts - last_on_time
+            last_on_time = None
+
+    return total_ms / HOUR_MS * POWER_RATINGS.get(appliance, 0)
+
+def _appliance_history(conn, room_id, appliance, db_path=None):
+    """Every (ts_ms, is_on) row of one appliance, archive included.
+
+    Rows are in (ts_ms, is_on) order, the order of the covering index, so
+    OFF sorts before ON at equal timestamps on every energy path.
+    """
+    cursor = conn.execute(ENERGY_ROWS_SQL, (name_to_id(conn, 'room', room_id, create=False, db_path=db_path),
+                                            name_to_id(conn, 'appliance', appliance, create=False, db_path=db_path)))
+    rows = [(ts, is_on) for _, is_on, ts in cursor.fetchall()]
+    archived = _archived(room_id, 'appliance', appliance, db_path)
+    if archived is not None:
+        rows = sorted(list(zip(archived["ts_ms"].tolist(), archived["is_on"].tolist())) + rows)
+    return rows
 
-    kwh = total_hours * POWER_RATINGS.get(appliance, 0)
-    
+def _fold(rows, on_since, power, key, hourly):
+    """Integrates (ts_ms, is_on) rows from an open ON interval; returns (on_since, kWh added).
+
+    An ON row (re)starts the interval and the next OFF row closes it, as
+    in recompute_energy(). Closed intervals are also added to
+    hourly[(*key, hour)] for energy_rollup.
+    """
+    added = 0.0
+    for ts, is_on in rows:
+        if is_on == 1:
+            on_since = ts
+        elif is_on == 0 and on_since is not None:
+            added += (ts - on_since) / HOUR_MS * power
+            for bucket, part in _split_hours(on_since, ts):
+                hourly[(*key, bucket)] = hourly.get((*key, bucket), 0) + part * power
+            on_since = None
+    return on_since, added
+
+@_timed
+def update_energy_checkpoints(db_path=None):
+    """Folds appliance_log rows added since the last call into energy_checkpoint.
+
+    Every (room, appliance) keeps the id of the last row it consumed, the
+    newest timestamp folded in, any open ON interval and its cumulative
+    kWh, so only rows above the highest consumed id are read. Each pair's
+    new rows are folded in timestamp order. A row older than what the
+    pair has already folded (a back-dated write) makes that pair re-fold
+    its whole history, hourly rollups included, so the result always
+    matches recompute_energy(). Each pair's change in kWh is appended to
+    energy_log as one period row; a re-fold can make it negative.
+    Returns the number of appliance_log rows processed.
+    """
+    conn = get_connection(db_path)
+    with _energy_locks.setdefault(db_path or current_db_path(), threading.Lock()):
+        if conn.in_transaction:
+            conn.commit()
+        # Take the write lock up front so concurrent passes cannot both
+        # consume the same rows
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            processed = _advance_checkpoints(conn.cursor(), db_path)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    DB_ROWS.inc(processed, ("update_energy_checkpoints",))
+    return processed
+
+def _advance_checkpoints(cursor, db_path=None):
+    cursor.execute("SELECT COALESCE(MAX(last_row_id), 0) FROM energy_checkpoint")
+    watermark = cursor.fetchone()[0]
     cursor.execute('''
-        INSERT INTO energy_log (room_id, appliance, kwh, period_start, period_end)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (room_id, appliance, kwh, logs[0][2], logs[-1][2]))
+        SELECT id, room_id, appliance_id, is_on, ts_ms FROM appliance_log
+        WHERE id > ? ORDER BY id
+    ''', (watermark,))
+    rows = cursor.fetchall()
+    cursor.execute("SELECT id, name FROM appliances")
+    appliance_names = dict(cursor.fetchall())
 
-    conn.commit()
-    conn.close()
-    return kwh
+    new_rows = {}
+    for row_id, room_id, appliance_id, is_on, ts in rows:
+        new_rows.setdefault((room_id, appliance_id), []).append((ts, is_on, row_id))
+
+    hourly = {}
+    for key, key_rows in new_rows.items():
+        key_rows.sort()
+        power = POWER_RATINGS.get(appliance_names.get(key[1]), 0)
+        cursor.execute('''
+            SELECT on_since_ms, kwh, last_ts_ms FROM energy_checkpoint
+            WHERE room_id = ? AND appliance_id = ?
+        ''', key)
+        on_since, kwh, last_ts = cursor.fetchone() or (None, 0.0, None)
+        # The last folded row is ON exactly when an interval is open
+        if last_ts is not None and key_rows[0][:2] < (last_ts, 0 if on_since is None else 1):
+            log.info("Back-dated appliance rows for %s; re-folding its history.", key)
+            cursor.execute("DELETE FROM energy_rollup WHERE room_id = ? AND appliance_id = ?", key)
+            rooms = id_names(cursor.connection, 'room', db_path)
+            history = _appliance_history(cursor.connection, rooms.get(key[0]), appliance_names.get(key[1]), db_path)
+            on_since, total = _fold(history, None, power, key, hourly)
+        else:
+            on_since, added = _fold([row[:2] for row in key_rows], on_since, power, key, hourly)
+            total = kwh + added
+        last_ts = key_rows[-1][0] if last_ts is None else max(last_ts, key_rows[-1][0])
+
+        cursor.execute('''
+            INSERT OR REPLACE INTO energy_checkpoint
+                (room_id, appliance_id, last_row_id, on_since_ms, kwh, last_ts_ms)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (*key, max(row[2] for row in key_rows), on_since, total, last_ts))
+        if total != kwh:
+            cursor.execute('''
+                INSERT INTO energy_log (room_id, appliance_id, kwh, start_ms, end_ms)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (*key, total - kwh, key_rows[0][0], key_rows[-1][0]))
+    cursor.executemany('''
+        INSERT INTO energy_rollup (room_id, appliance_id, bucket_ms, kwh) VALUES (?, ?, ?, ?)
+        ON CONFLICT (room_id, appliance_id, bucket_ms) DO UPDATE SET kwh = kwh + excluded.kwh
+    ''', [(*key, kwh) for key, kwh in hourly.items()])
+    return len(rows)
+
+@_timed
+def calculate_energy(room_id, appliance):
+    """Calculates kWh based on appliance ON/OFF duration."""
+    update_energy_checkpoints()
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT kwh FROM energy_checkpoint WHERE room_id = ? AND appliance_id = ?
+    ''', (name_to_id(conn, 'room', room_id, create=False),
+          name_to_id(conn, 'appliance', appliance, create=False)))
+    row = cursor.fetchone()
+    return row[0] if row else 0
 
 # This block ensures the database is created if you run this file directly
 if __name__ == "__main__":
     init_db()
 
 
+def _sensor_key(conn, room_id, sensor_type):
+    """(room id, sensor type id), with None for names never logged."""
+    return (name_to_id(conn, 'room', room_id, create=False),
+            name_to_id(conn, 'sensor_type', sensor_type, create=False))
+
+@_timed
 def get_sensor_history(room_id, sensor_type):
-    """Fetches sensor reading history for the API."""
-    conn = sqlite3.connect('smarthome.db')
+    """Fetches sensor reading history for the API (the newest 50 readings).
+
+    Use get_sensor_history_page() to walk further back.
+    """
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT value, timestamp FROM sensor_log 
-        WHERE room_id = ? AND sensor_type = ? 
-        ORDER BY timestamp DESC LIMIT 50
-    ''', (room_id, sensor_type))
-    history = [{"value": row[0], "timestamp": row[1]} for row in cursor.fetchall()]
-    conn.close()
+    cursor.execute(HISTORY_SQL, _sensor_key(conn, room_id, sensor_type))
+    rows = cursor.fetchall()
+    archived = _archived(room_id, 'sensor', sensor_type)
+    if archived is not None:
+        # Merged with the newest archived rows, which are usually older
+        rows = sorted(rows + list(zip(archived["value"][-50:][::-1].tolist(), archived["ts_ms"][-50:][::-1].tolist())),
+                      key=lambda row: row[1], reverse=True)[:50]
+    history = [{"value": row[0], "timestamp": format_ts(row[1])} for row in rows]
+    DB_ROWS.inc(len(history), ("get_sensor_history",))
     return history
 
-def get_connection():
-    return sqlite3.connect('smarthome.db')
+def encode_cursor(ts, row_id):
+    """Opaque page token for the row a page ended on."""
+    return base64.urlsafe_b64encode(f"{ts}|{row_id}".encode()).decode()
 
-def log_appliance_state(room_id, appliance, state, is_on, hour):
+def decode_cursor(token):
+    """Inverse of encode_cursor; raises ValueError for a malformed token."""
+    try:
+        ts, row_id = base64.urlsafe_b64decode(token.encode()).decode().split('|')
+        return int(ts), int(row_id)
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid history cursor")
+
+@_timed
+def get_sensor_history_page(room_id, sensor_type, limit=50, cursor=None):
+    """One page of readings, newest first, and the token for the next page.
+
+    cursor is the next_cursor of the previous page (None for the first).
+    Each page is a single index seek, however deep into the history it
+    is. next_cursor is None once the history is exhausted.
+    """
+    limit = max(1, min(int(limit), HISTORY_PAGE_LIMIT))
+    # Every real row sorts below this starting key
+    ts, row_id = decode_cursor(cursor) if cursor else (2 ** 63 - 1, 0)
     conn = get_connection()
+    db_cursor = conn.cursor()
+    # One extra row says whether another page exists
+    db_cursor.execute(HISTORY_PAGE_SQL, (*_sensor_key(conn, room_id, sensor_type), ts, row_id, limit + 1))
+    rows = db_cursor.fetchall()
+    archived = _archived(room_id, 'sensor', sensor_type)
+    if archived is not None:
+        # The archived rows just below the cursor, merged in key order
+        end = _keyset_end(archived, ts, row_id)
+        start = max(0, end - limit - 1)
+        rows += zip(archived["id"][start:end][::-1].tolist(), archived["value"][start:end][::-1].tolist(),
+                    archived["ts_ms"][start:end][::-1].tolist())
+        rows = sorted(rows, key=lambda row: (row[2], row[0]), reverse=True)[:limit + 1]
+    DB_ROWS.inc(len(rows), ("get_sensor_history_page",))
+    next_cursor = encode_cursor(rows[limit - 1][2], rows[limit - 1][0]) if len(rows) > limit else None
+    history = [{"value": value, "timestamp": format_ts(ts)} for _, value, ts in rows[:limit]]
+    return history, next_cursor
+
+def iter_sensor_log(room_id, sensor_type, start, end, batch_size=EXPORT_BATCH_SIZE):
+    """Yields (id, room, sensor_type, value, timestamp) rows in time order.
+
+    Streams from a cursor on its own connection, batch_size rows at a
+    time, so memory stays flat however many rows match. The export reads
+    one consistent snapshot. The connection is closed when the generator
+    is exhausted or closed.
+    """
+    start_ms, end_ms = to_ms(start), to_ms(end)
+    archived = _archived(room_id, 'sensor', sensor_type)
+    conn = connect()
+    try:
+        cursor = conn.execute(EXPORT_SQL, (*_sensor_key(conn, room_id, sensor_type), start_ms, end_ms))
+        rows = _fetch_batches(cursor, batch_size)
+        if archived is not None:
+            rows = heapq.merge(_archived_range(archived, start_ms, end_ms, batch_size), rows,
+                               key=lambda row: (row[2], row[0]))
+        for row_id, value, ts in rows:
+            yield row_id, room_id, sensor_type, value, format_ts(ts)
+    finally:
+        conn.close()
+
+def _fetch_batches(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        DB_ROWS.inc(len(rows), ("iter_sensor_log",))
+        yield from rows
+
+@_timed
+def rebuild_sensor_rollups(cursor):
+    """Recomputes sensor_rollup from the raw sensor_log rows.
+
+    Buckets whose raw rows were already pruned by apply_retention() are
+    lost, so this is only for databases that still hold all raw data.
+    """
+    cursor.execute("DELETE FROM sensor_rollup")
+    for width in ROLLUP_BUCKETS.values():
+        cursor.execute(f'''
+            INSERT INTO sensor_rollup (room_id, sensor_type_id, resolution, bucket_ms, count, total, min_value, max_value)
+            SELECT room_id, sensor_type_id, {width}, ts_ms - ts_ms % {width},
+                   COUNT(*), SUM(value), MIN(value), MAX(value)
+            FROM sensor_log GROUP BY 1, 2, 3, 4
+        ''')
+
+def choose_resolution(start, end, now=None):
+    """Picks raw rows or a rollup table for a time span.
+
+    A tier whose retention no longer covers start is skipped for the
+    next coarser one, so old ranges do not come back empty.
+    """
+    for span, resolution in AUTO_RESOLUTION:
+        if end - start <= span and _retained(resolution, start, now):
+            return resolution
+    return 'day'
+
+def _retained(tier, start, now=None):
+    days = RETENTION_DAYS.get(tier)
+    return days is None or start >= (now or datetime.now()) - timedelta(days=days)
+
+@_timed
+def get_sensor_range(room_id, sensor_type, start, end, resolution='auto'):
+    """Sensor readings between two datetimes, raw or from sensor_rollup.
+
+    resolution is 'raw', 'hour', 'day' or 'auto' (picked from the span).
+    Raw results are capped at RAW_RANGE_LIMIT rows.
+    """
+    if resolution == 'auto':
+        resolution = choose_resolution(start, end)
+    start_ms, end_ms = to_ms(start), to_ms(end)
+    conn = get_connection()
+    key = _sensor_key(conn, room_id, sensor_type)
     cursor = conn.cursor()
-    
+    if resolution == 'raw':
+        cursor.execute('''
+            SELECT value, ts_ms FROM sensor_log
+            WHERE room_id = ? AND sensor_type_id = ? AND ts_ms >= ? AND ts_ms < ?
+            ORDER BY ts_ms LIMIT ?
+        ''', (*key, start_ms, end_ms, RAW_RANGE_LIMIT))
+        rows = cursor.fetchall()
+        archived = _archived(room_id, 'sensor', sensor_type)
+        if archived is not None:
+            archived_rows = ((value, ts) for _, value, ts in
+                             _archived_range(archived, start_ms, end_ms, RAW_RANGE_LIMIT, RAW_RANGE_LIMIT))
+            rows = list(heapq.merge(archived_rows, rows, key=lambda row: row[1]))[:RAW_RANGE_LIMIT]
+        data = [{"value": row[0], "timestamp": format_ts(row[1])} for row in rows]
+    elif resolution in ROLLUP_BUCKETS:
+        # A bucket belongs to the range if it starts inside it
+        width = ROLLUP_BUCKETS[resolution]
+        cursor.execute('''
+            SELECT bucket_ms, count, total, min_value, max_value FROM sensor_rollup
+            WHERE room_id = ? AND sensor_type_id = ? AND resolution = ?
+              AND bucket_ms >= ? AND bucket_ms < ?
+            ORDER BY bucket_ms
+        ''', (*key, width, start_ms - start_ms % width, end_ms))
+        data = [{"bucket": format_ts(bucket, 'seconds'), "count": count, "avg": total / count,
+                 "min": low, "max": high}
+                for bucket, count, total, low, high in cursor.fetchall()]
+    else:
+        raise ValueError(f"Unknown resolution '{resolution}'")
+    DB_ROWS.inc(len(data), ("get_sensor_range",))
+    return {"resolution": resolution, "data": data}
+
+@_timed
+def get_energy_range(room_id, appliance, start, end, resolution='hour'):
+    """kWh per hour (or day) between two datetimes, from energy_rollup."""
+    update_energy_checkpoints()
+    if resolution not in ROLLUP_BUCKETS:
+        raise ValueError(f"Unknown resolution '{resolution}'")
+    width = ROLLUP_BUCKETS[resolution]
+    start_ms = to_ms(start)
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT bucket_ms - bucket_ms % {width}, SUM(kwh) FROM energy_rollup
+        WHERE room_id = ? AND appliance_id = ? AND bucket_ms >= ? AND bucket_ms < ?
+        GROUP BY 1 ORDER BY 1
+    ''', (name_to_id(conn, 'room', room_id, create=False),
+          name_to_id(conn, 'appliance', appliance, create=False),
+          start_ms - start_ms % width, to_ms(end)))
+    data = [{"bucket": format_ts(bucket, 'seconds'), "kwh": kwh} for bucket, kwh in cursor.fetchall()]
+    DB_ROWS.inc(len(data), ("get_energy_range",))
+    return {"resolution": resolution, "data": data}
+
+def _split_hours(start, end):
+    """Yields (hour bucket, hours) for each clock hour an interval (in ms) overlaps."""
+    while start < end:
+        bucket = start - start % HOUR_MS
+        stop = min(bucket + HOUR_MS, end)
+        yield bucket, (stop - start) / HOUR_MS
+        start = stop
+
+@_timed
+def warm_state_cache(db_path=None):
+    """Loads the newest is_on value of every (room, appliance) into the cache."""
+    conn = get_connection(db_path)
+    rooms = id_names(conn, 'room', db_path)
+    appliances = id_names(conn, 'appliance', db_path)
+    # Read first: a row logged in between only makes the next check miss
+    version = appliance_log_version(conn)
+    cursor = conn.cursor()
+    cursor.execute(ALL_LAST_STATES_SQL)
+    rows = cursor.fetchall()
+    DB_ROWS.inc(len(rows), ("warm_state_cache",))
+    path = db_path or current_db_path()
+    with _last_state_lock:
+        states = _last_state.setdefault(path, {})
+        for room_id, appliance_id, ts, is_on, _ in rows:
+            states[(rooms.get(room_id), appliances.get(appliance_id))] = (ts, is_on)
+        _state_versions[path] = version
+
+def appliance_log_version(conn):
+    """A value that changes whenever any connection, in any process, changes appliance_log.
+
+    The AUTOINCREMENT sequence moves on every insert and never goes back;
+    MAX(id) also catches rows being cleared.
+    """
+    return conn.execute('''
+        SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'appliance_log'),
+               (SELECT MAX(id) FROM appliance_log)
+    ''').fetchone()
+
+def _cached_states(conn, path):
+    """The state cache entries of a file, emptied first if the file has changed since."""
+    version = appliance_log_version(conn)
+    with _last_state_lock:
+        if _state_versions.get(path) != version:
+            # Written by someone else: entries are reloaded one by one
+            _last_state[path] = {}
+            _state_versions[path] = version
+        return _last_state.setdefault(path, {})
+
+# Warm restarts: a snapshot (see snapshot.py) records the marks, the id
+# and timestamp of the newest row of each log, so a restart only replays
+# the rows above them
+
+def snapshot_path(db_path=None):
+    """File holding the state snapshot of a database file."""
+    return (db_path or current_db_path()) + ".snapshot.npz"
+
+LOG_TABLES = ['sensor_log', 'appliance_log']
+
+def _log_marks(cursor):
+    marks = {}
+    for table in LOG_TABLES:
+        row = cursor.execute(f"SELECT id, ts_ms FROM {table} ORDER BY id DESC LIMIT 1").fetchone()
+        marks[table] = list(row) if row else [0, None]
+    return marks
+
+def marks_intact(marks, db_path=None):
+    """True if each mark's row is still there, so rows above it are exactly the newer ones.
+
+    The log ids are AUTOINCREMENT and never reused, but the marked row
+    can still go: reset_db() clears the logs, archiving moves it out, or
+    the file is swapped for a backup or another database. Then what was
+    read up to the marks is no longer a prefix of the logs, so a missing
+    or changed row means starting over.
+    """
+    cursor = get_connection(db_path).cursor()
+    for table in LOG_TABLES:
+        row_id, ts = marks.get(table, (0, None))
+        if row_id and cursor.execute(f"SELECT ts_ms FROM {table} WHERE id = ?", (row_id,)).fetchone() != (ts,):
+            return False
+    return True
+
+@_timed
+def read_changes(after=None, readings=True, db_path=None):
+    """What the logs gained since the marks after (None reads all of them).
+
+    Returns (marks, states, latest): the current marks, the newest
+    appliance row of each (room, appliance) as (ts_ms, is_on, state) and,
+    if readings is set, the last value logged for each (room,
+    sensor_type). Only keys with rows above the marks appear. Everything
+    is read in one transaction, so the new marks cover exactly what was
+    returned. The marks also carry the appliance_log_version() they were
+    read at, for seed_state_cache().
+    """
+    after = after or {}
+    conn = get_connection(db_path)
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN")
+    try:
+        cursor = conn.cursor()
+        marks = _log_marks(cursor)
+        marks['appliance_log_version'] = list(appliance_log_version(conn))
+        rooms = id_names(conn, 'room', db_path)
+        appliances = id_names(conn, 'appliance', db_path)
+        state_names = id_names(conn, 'state', db_path)
+        after_id = after.get('appliance_log', [0])[0]
+        if after_id:
+            cursor.execute(NEW_LAST_STATES_SQL, (after_id,))
+        else:
+            cursor.execute(ALL_LAST_STATES_SQL)
+        states = {(rooms.get(room_id), appliances.get(appliance_id)): (ts, is_on, state_names.get(state_id))
+                  for room_id, appliance_id, ts, is_on, state_id in cursor.fetchall()}
+        latest = {}
+        if readings:
+            sensor_types = id_names(conn, 'sensor_type', db_path)
+            cursor.execute(NEW_READINGS_SQL, (after.get('sensor_log', [0])[0],))
+            latest = {(rooms.get(room_id), sensor_types.get(type_id)): value
+                      for room_id, type_id, _, value in cursor.fetchall()}
+    finally:
+        conn.commit()
+    DB_ROWS.inc(len(states) + len(latest), ("read_changes",))
+    return marks, states, latest
+
+def seed_state_cache(states, version=None, db_path=None):
+    """Loads {(room, appliance): (ts_ms, is_on, ...)} entries into the state cache.
+
+    An entry only replaces a cached one that is not newer, as with writes.
+    version is the appliance_log_version() the states were read at (the
+    'appliance_log_version' of read_changes()' marks); without it the
+    next lookup reloads from the database.
+    """
+    path = db_path or current_db_path()
+    for key, (ts, is_on, *_) in states.items():
+        _cache_last_state(path, key, ts, is_on)
+    if version is not None:
+        with _last_state_lock:
+            _state_versions[path] = tuple(version)
+
+def energy_version(db_path=None):
+    """Changes whenever appliance rows are written or the logs are reset, by any process.
+
+    appliance_log holds the input to every energy figure, so energy
+    responses can be cached until its version moves.
+    """
+    return appliance_log_version(get_connection(db_path))
+
+@_timed
+def get_last_state(room_id, appliance):
+    """Returns the newest is_on for an appliance, or None if it was never logged."""
+    key = (room_id, appliance)
+    conn = get_connection()
+    path = current_db_path()
+    entry = _cached_states(conn, path).get(key)
+    if entry is None:
+        # Not warmed yet, never logged or changed elsewhere: fall back to
+        # the indexed lookup
+        cursor = conn.cursor()
+        cursor.execute(LAST_STATE_SQL, (name_to_id(conn, 'room', room_id, create=False),
+                                        name_to_id(conn, 'appliance', appliance, create=False)))
+        entry = cursor.fetchone()
+        if entry is None:
+            return None
+        _cache_last_state(path, key, *entry)
+    return entry[1]
+
+def _cache_last_state(path, key, ts, is_on):
+    # Keep the row with the newest timestamp, as LAST_STATE_SQL would
+    with _last_state_lock:
+        states = _last_state.setdefault(path, {})
+        cached = states.get(key)
+        if cached is None or ts >= cached[0]:
+            states[key] = (ts, is_on)
+
+def _appliance_rows(conn, rows):
+    """(room, appliance, state, is_on, ts_ms) rows as APPLIANCE_INSERT_SQL parameters."""
+    return [(name_to_id(conn, 'room', room_id), name_to_id(conn, 'appliance', appliance),
+             name_to_id(conn, 'state', state), is_on, ts)
+            for room_id, appliance, state, is_on, ts in rows]
+
+def _insert_appliance_rows(conn, rows):
+    """Inserts (room, appliance, state, is_on, ts_ms) rows in one transaction
+    and writes them through to the state cache.
+
+    The appliance_log_version() is read under the write lock before and
+    after, so the cache only stays trusted if this was the only change.
+    """
+    try:
+        params = _appliance_rows(conn, rows)
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        before = appliance_log_version(conn)
+        conn.executemany(APPLIANCE_INSERT_SQL, params)
+        after = appliance_log_version(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    path = current_db_path()
+    for room_id, appliance, _, is_on, ts in rows:
+        _cache_last_state(path, (room_id, appliance), ts, is_on)
+    with _last_state_lock:
+        if _state_versions.get(path) == before:
+            _state_versions[path] = after
+
+@_timed
+def record_appliance_state(room_id, appliance, state, is_on, timestamp=None):
+    """Inserts an appliance_log row and writes it through to the state cache.
+
+    timestamp may be a datetime, a stored-format string or epoch ms.
+    """
+    ts = _now_ms() if timestamp is None else to_ms(timestamp)
+    is_on = 1 if is_on else 0
+    _insert_appliance_rows(get_connection(), [(room_id, appliance, state, is_on, ts)])
+    DB_ROWS.inc(1, ("record_appliance_state",))
+
+@_timed
+def record_appliance_states(rows):
+    """Bulk version of record_appliance_state for (room, appliance, state, is_on, timestamp) rows.
+
+    All rows are written in one transaction.
+    """
+    rows = [(room_id, appliance, state, 1 if is_on else 0, to_ms(timestamp))
+            for room_id, appliance, state, is_on, timestamp in rows]
+    _insert_appliance_rows(get_connection(), rows)
+    DB_ROWS.inc(len(rows), ("record_appliance_states",))
+
+@_timed
+def record_sensor_readings(rows):
+    """Writes (room, sensor_type, value, timestamp) rows in one transaction."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(SENSOR_INSERT_SQL, _sensor_rows(conn, rows))
+    DB_ROWS.inc(len(rows), ("record_sensor_readings",))
+
+@_timed
+def log_appliance_state(room_id, appliance, state, is_on, hour):
     # FIX 1: Check if the state actually changed before logging
-    cursor.execute('''SELECT is_on FROM appliance_log 
-                      WHERE room_id=? AND appliance=? 
-                      ORDER BY timestamp DESC LIMIT 1''', (room_id, appliance))
-    last_entry = cursor.fetchone()
-    
-    if last_entry and last_entry[0] == (1 if is_on else 0):
-        conn.close()
+    if get_last_state(room_id, appliance) == (1 if is_on else 0):
         return # Don't log if the state is the same!
 
     # FIX 2: Use consistent Simulated Time
     sim_time = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=(24-hour))
-    timestamp = sim_time.strftime('%Y-%m-%d %H:%M:%S.%f')
-    
-    cursor.execute('''INSERT INTO appliance_log (room_id, appliance, state, is_on, timestamp)
-                      VALUES (?, ?, ?, ?, ?)''', (room_id, appliance, state, 1 if is_on else 0, timestamp))
-    conn.commit()
-    conn.close()
 
+    record_appliance_state(room_id, appliance, state, is_on, sim_time)
+
+@_timed
+def log_appliance_states(entries):
+    """Batch version of log_appliance_state for (room, appliance, state, is_on, hour) entries.
 
+    Entries are applied in order, so an appliance that flips several times
+    in the batch logs each change. Every transition is written in one
+    transaction. Returns the number of rows written.
+    """
+    now = to_ms(datetime.now().replace(minute=0, second=0, microsecond=0))
+    last = {}
+    rows = []
+    for room_id, appliance, state, is_on, hour in entries:
+        key = (room_id, appliance)
+        is_on = 1 if is_on else 0
+        if key not in last:
+            last[key] = get_last_state(room_id, appliance)
+        if last[key] == is_on:
+            continue
+        last[key] = is_on
+        rows.append((room_id, appliance, state, is_on, now - (24 - hour) * HOUR_MS))
+    if rows:
+        record_appliance_states(rows)
+    return len(rows)
 
+
+
+@_timed
 def calculate_total_energy():
     """Aggregates energy data for the baseline comparison in Chapter 3."""
-    conn = sqlite3.connect('smarthome.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT SUM(kwh) FROM energy_log")
-    total = cursor.fetchone()[0] or 0
-    
-    # Get breakdown per appliance
-    cursor.execute("SELECT appliance, SUM(kwh) FROM energy_log GROUP BY appliance")
-    breakdown = {row[0]: round(row[1], 2) for row in cursor.fetchall()}
-    
-    conn.close()
-    return {"total_kwh": round(total, 2), "breakdown": breakdown}
+    breakdown = energy_breakdown()
+    return {"total_kwh": round(sum(breakdown.values()), 2),
+            "breakdown": {name: round(kwh, 2) for name, kwh in breakdown.items()}}
+
+@_timed
+def energy_breakdown():
+    """Unrounded kWh per appliance name, summed over every room."""
+    update_energy_checkpoints()
+    cursor = get_connection().cursor()
+    cursor.execute('''
+        SELECT a.name, SUM(c.kwh) FROM energy_checkpoint c
+        JOIN appliances a ON a.id = c.appliance_id GROUP BY a.name
+    ''')
+    return dict(cursor.fetchall())
+
+def _delete_before(conn, table, column, key_sql, keys, cutoff, batch_size, pause):
+    """Deletes rows with column < cutoff, key by key, batch_size rows per transaction.
+
+    Each batch ends at a timestamp found on the (key, column) index, so
+    no batch scans the table. Returns the number of rows deleted.
+    """
+    deleted = pending = 0
+    for key in keys:
+        while True:
+            row = conn.execute(f'''
+                SELECT {column} FROM {table} WHERE {key_sql} AND {column} < ?
+                ORDER BY {column} LIMIT 1 OFFSET ?
+            ''', (*key, cutoff, batch_size - 1)).fetchone()
+            # Rows sharing the boundary timestamp go in the same batch
+            if row is None:
+                sql, bound = f"{column} < ?", cutoff
+            else:
+                sql, bound = f"{column} <= ?", row[0]
+            pending += conn.execute(f"DELETE FROM {table} WHERE {key_sql} AND {sql}", (*key, bound)).rowcount
+            if pending >= batch_size:
+                conn.commit()
+                deleted, pending = deleted + pending, 0
+                time.sleep(pause)
+            if row is None:
+                break
+    conn.commit()
+    return deleted + pending
+
+@_timed
+def incremental_vacuum(db_path=None, pause=RETENTION_PAUSE):
+    """Returns free pages to the filesystem in short steps; returns bytes reclaimed.
+
+    Needs auto_vacuum=INCREMENTAL, which new databases get from PRAGMAS
+    and older ones after a VACUUM (migrate_db.py runs one).
+    """
+    conn = get_connection(db_path)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    before = conn.execute("PRAGMA page_count").fetchone()[0]
+    while conn.execute("PRAGMA freelist_count").fetchone()[0]:
+        # executescript() steps the pragma to completion; execute() would
+        # free a single page per call
+        conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_STEP});")
+        time.sleep(pause)
+    return (before - conn.execute("PRAGMA page_count").fetchone()[0]) * page_size
+
+@_timed
+def apply_retention(retention_days=None, now=None, batch_size=RETENTION_BATCH_SIZE,
+                    pause=RETENTION_PAUSE, vacuum=True, db_path=None):
+    """Prunes each sensor tier to its retention and reclaims the space.
+
+    retention_days defaults to RETENTION_DAYS. Raw rows go first, then
+    hourly and daily rollup buckets, each in batch_size-row transactions
+    with pause seconds between them so the API keeps getting the write
+    lock. The raw tier also covers sensor rows already moved into the
+    archive; archived appliance rows are kept, as energy is folded from
+    them. Returns rows deleted per tier and bytes reclaimed.
+    """
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    now_ms = to_ms(now or datetime.now())
+    conn = get_connection(db_path)
+    if conn.in_transaction:
+        conn.commit()
+    keys = conn.execute("SELECT DISTINCT room_id, sensor_type_id FROM sensor_rollup").fetchall()
+
+    result = {}
+    for tier, days in retention_days.items():
+        if days is None:
+            result[tier] = 0
+            continue
+        cutoff = now_ms - days * DAY_MS
+        if tier == 'raw':
+            result[tier] = _delete_before(conn, 'sensor_log', 'ts_ms', "room_id = ? AND sensor_type_id = ?",
+                                          keys, cutoff, batch_size, pause)
+            result[tier] += _prune_archive(conn, cutoff, db_path)
+        else:
+            # Only buckets that end before the cutoff
+            width = ROLLUP_BUCKETS[tier]
+            result[tier] = _delete_before(conn, 'sensor_rollup', 'bucket_ms',
+                                          "room_id = ? AND sensor_type_id = ? AND resolution = ?",
+                                          [(*key, width) for key in keys], cutoff - width + 1, batch_size, pause)
+    result["bytes_reclaimed"] = incremental_vacuum(db_path, pause) if vacuum else 0
+    DB_ROWS.inc(sum(result[tier] for tier in retention_days), ("apply_retention",))
+
+    for tier in retention_days:
+        _retention_totals["rows_deleted"][tier] = _retention_totals["rows_deleted"].get(tier, 0) + result[tier]
+    _retention_totals["bytes_reclaimed"] += result["bytes_reclaimed"]
+    _retention_totals["last_run"] = format_ts(_now_ms(), 'seconds')
+    return result
+
+class RetentionWorker:
+    """Background thread that runs apply_retention() once per low-load window.
 
+    When ARCHIVE_AFTER_DAYS is set, each pass first moves the days older
+    than that into the archive with archive_before().
+
+    window is a (start, end) pair of local hours and may wrap midnight,
+    e.g. (23, 2). The clock is checked every check_interval seconds.
+    """
+    def __init__(self, window=RETENTION_WINDOW, check_interval=60, db_path=None, **options):
+        self.window = window
+        self.check_interval = check_interval
+        self.db_path = db_path
+        self.options = options  # passed on to apply_retention
+        self._last_window = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def due(self, now):
+        """True inside the window if this window has not had its run yet."""
+        start, end = self.window
+        if (now.hour - start) % 24 >= (end - start) % 24:
+            return False
+        # Shifting by the start hour gives each window one date, even across midnight
+        return (now - timedelta(hours=start)).date() != self._last_window
+
+    def _run(self):
+        while not self._stopped.wait(self.check_interval):
+            now = datetime.now()
+            if not self.due(now):
+                continue
+            self._last_window = (now - timedelta(hours=self.window[0])).date()
+            try:
+                if ARCHIVE_AFTER_DAYS is not None:
+                    # Whole days only, so an archived range never reopens
+                    cutoff = (now - timedelta(days=ARCHIVE_AFTER_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+                    log.info("Archive pass: %s", archive_before(cutoff, db_path=self.db_path))
+                log.info("Retention pass: %s", apply_retention(db_path=self.db_path, **self.options))
+            except sqlite3.Error as e:
+                log.error("Retention pass failed: %s", e)
+            finally:
+                release_connection()
+
+# Cold archive: closed days of sensor_log and appliance_log rows moved
+# into per-room columnar files (see archive.py) next to the database
+
+def archive_dir(db_path=None):
+    """Directory holding the archive files of a database file."""
+    return (db_path or current_db_path()) + ".archive"
+
+def _archived(room_id, kind, name, db_path=None):
+    """A series' archived columns, or None if it has no archived rows."""
+    room = archive.open_room(archive_dir(db_path), room_id)
+    return room.columns(kind, name) if room is not None else None
+
+def _keyset_end(columns, ts, row_id):
+    """Number of archived rows whose (ts_ms, id) sorts below (ts, row_id)."""
+    stamps = columns["ts_ms"]
+    low = int(np.searchsorted(stamps, ts, 'left'))
+    high = int(np.searchsorted(stamps, ts, 'right'))
+    return low + int(np.searchsorted(columns["id"][low:high], row_id, 'left'))
+
+def _archived_range(columns, start_ms, end_ms, batch_size, limit=None):
+    """Yields archived (id, value, ts_ms) rows with start_ms <= ts_ms < end_ms, in order."""
+    stamps = columns["ts_ms"]
+    low = int(np.searchsorted(stamps, start_ms, 'left'))
+    high = int(np.searchsorted(stamps, end_ms, 'left'))
+    if limit is not None:
+        high = min(high, low + limit)
+    for i in range(low, high, batch_size):
+        j = min(i + batch_size, high)
+        yield from zip(columns["id"][i:j].tolist(), columns["value"][i:j].tolist(), stamps[i:j].tolist())
+
+def _merge_series(old, new):
+    """Archived columns plus newly moved ones, sorted by (ts_ms, id).
+
+    Rows the archive already holds (same id and timestamp, left in the
+    table by an interrupted run) are dropped from new.
+    """
+    if old is None:
+        return new
+    order = np.argsort(old["id"], kind='stable')
+    old_ids = old["id"][order]
+    pos = np.minimum(np.searchsorted(old_ids, new["id"]), max(len(old_ids) - 1, 0))
+    held = (old_ids[pos] == new["id"]) & (old["ts_ms"][order][pos] == new["ts_ms"])
+    merged = {}
+    for column in archive.COLUMNS[new["kind"]]:
+        merged[column] = np.concatenate([old[column], new[column][~held]])
+    order = np.lexsort((merged["id"], merged["ts_ms"]))
+    merged = {column: values[order] for column, values in merged.items()}
+    merged.update(kind=new["kind"], name=new["name"], end_ms=max(old.get("end_ms", 0), new["end_ms"]))
+    return merged
+
+def _series_from_file(room, kind, name):
+    columns = room.columns(kind, name)
+    columns.update(kind=kind, name=name, end_ms=room.end_ms(kind, name))
+    return columns
+
+@_timed
+def archive_before(cutoff, db_path=None):
+    """Moves sensor and appliance rows older than cutoff into the room archives.
+
+    Appliance rows are only moved once update_energy_checkpoints() has
+    folded them in, and each appliance's newest row stays in
+    appliance_log, so calculate_energy() and get_last_state() never need
+    the archive. Every room is moved in one write transaction: its file
+    is rewritten (old and new rows together), then the rows deleted. A
+    crash in between leaves rows in both places until the next run.
+    Returns the rows moved per table.
+    """
+    cutoff_ms = to_ms(cutoff)
+    update_energy_checkpoints(db_path)
+    conn = get_connection(db_path)
+    if conn.in_transaction:
+        conn.commit()
+    directory = archive_dir(db_path)
+    moved = {"sensor_log": 0, "appliance_log": 0}
+    for room_pk, room_id in list(id_names(conn, 'room', db_path).items()):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table, count in _archive_room(conn, directory, room_pk, room_id, cutoff_ms, db_path).items():
+                moved[table] += count
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    DB_ROWS.inc(sum(moved.values()), ("archive_before",))
+    return moved
+
+def _archive_room(conn, directory, room_pk, room_id, cutoff_ms, db_path):
+    existing = archive.open_room(directory, room_id)
+    series = {}
+    deletes = []
+    moved = {"sensor_log": 0, "appliance_log": 0}
+
+    for type_pk, sensor_type in id_names(conn, 'sensor_type', db_path).items():
+        rows = conn.execute('''
+            SELECT id, ts_ms, value FROM sensor_log
+            WHERE room_id = ? AND sensor_type_id = ? AND ts_ms < ? ORDER BY ts_ms, id
+        ''', (room_pk, type_pk, cutoff_ms)).fetchall()
+        if not rows:
+            continue
+        ids, stamps, values = zip(*rows)
+        new = {"kind": 'sensor', "name": sensor_type, "end_ms": cutoff_ms,
+               "id": np.array(ids, dtype=np.int64), "ts_ms": np.array(stamps, dtype=np.int64),
+               "value": np.array(values, dtype=np.float64)}
+        old = _series_from_file(existing, 'sensor', sensor_type) if existing and existing.columns('sensor', sensor_type) else None
+        series[('sensor', sensor_type)] = _merge_series(old, new)
+        deletes.append(("DELETE FROM sensor_log WHERE room_id = ? AND sensor_type_id = ? AND ts_ms < ?",
+                        (room_pk, type_pk, cutoff_ms)))
+        moved["sensor_log"] += len(rows)
+
+    watermark = conn.execute("SELECT COALESCE(MAX(last_row_id), 0) FROM energy_checkpoint").fetchone()[0]
+    states = id_names(conn, 'state', db_path)
+    for appliance_pk, appliance in id_names(conn, 'appliance', db_path).items():
+        # Stop at the newest row and at the first row not yet folded
+        newest, unfolded = conn.execute('''
+            SELECT MAX(ts_ms), MIN(CASE WHEN id > ? THEN ts_ms END) FROM appliance_log
+            WHERE room_id = ? AND appliance_id = ?
+        ''', (watermark, room_pk, appliance_pk)).fetchone()
+        if newest is None:
+            continue
+        end_ms = min(cutoff_ms, newest, cutoff_ms if unfolded is None else unfolded)
+        rows = conn.execute('''
+            SELECT id, ts_ms, is_on, state_id FROM appliance_log
+            WHERE room_id = ? AND appliance_id = ? AND ts_ms < ? ORDER BY ts_ms, id
+        ''', (room_pk, appliance_pk, end_ms)).fetchall()
+        if not rows:
+            continue
+        old = None
+        names = []
+        if existing and existing.columns('appliance', appliance):
+            old = _series_from_file(existing, 'appliance', appliance)
+            names = list(old.pop("states"))
+        codes = {}
+        for state_pk in {row[3] for row in rows}:
+            name = states.get(state_pk)
+            if name not in names:
+                names.append(name)
+            codes[state_pk] = names.index(name)
+        ids, stamps, is_on, state_ids = zip(*rows)
+        new = {"kind": 'appliance', "name": appliance, "end_ms": end_ms,
+               "id": np.array(ids, dtype=np.int64), "ts_ms": np.array(stamps, dtype=np.int64),
+               "is_on": np.array(is_on, dtype=np.int8),
+               "state": np.array([codes[state_pk] for state_pk in state_ids], dtype=np.uint16)}
+        merged = _merge_series(old, new)
+        merged["states"] = names
+        series[('appliance', appliance)] = merged
+        deletes.append(("DELETE FROM appliance_log WHERE room_id = ? AND appliance_id = ? AND ts_ms < ?",
+                        (room_pk, appliance_pk, end_ms)))
+        moved["appliance_log"] += len(rows)
+
+    if not series:
+        return moved
+    # Series with nothing new are carried over from the old file
+    if existing is not None:
+        for kind, name in existing.series:
+            if (kind, name) not in series:
+                series[(kind, name)] = _series_from_file(existing, kind, name)
+    archive.write_room(directory, room_id, list(series.values()))
+    for sql, params in deletes:
+        conn.execute(sql, params)
+    return moved
+
+def _prune_archive(conn, cutoff_ms, db_path=None):
+    """Drops archived sensor rows older than cutoff_ms; returns how many.
+
+    Each room file that has any is rewritten under the write lock, so it
+    never races archive_before(). A file left with no rows is removed.
+    """
+    directory = archive_dir(db_path)
+    pruned = 0
+    for room_id in archive.rooms(directory):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = archive.open_room(directory, room_id)
+            if existing is None:
+                conn.commit()
+                continue
+            series = []
+            dropped = 0
+            for kind, name in existing.series:
+                columns = _series_from_file(existing, kind, name)
+                if kind == 'sensor':
+                    # Series are sorted by ts_ms
+                    start = int(np.searchsorted(columns["ts_ms"], cutoff_ms, 'left'))
+                    dropped += start
+                    columns.update({column: columns[column][start:] for column in archive.COLUMNS[kind]})
+                    if not len(columns["ts_ms"]):
+                        continue
+                series.append(columns)
+            if dropped:
+                if series:
+                    archive.write_room(directory, room_id, series)
+                else:
+                    os.remove(existing.path)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        pruned += dropped
+    return pruned
+
+def archive_stats(db_path=None):
+    """Files, bytes and rows held in a database's archive."""
+    directory = archive_dir(db_path)
+    stats = {"files": 0, "bytes": 0, "sensor_rows": 0, "appliance_rows": 0}
+    for room_id in archive.rooms(directory):
+        room = archive.open_room(directory, room_id)
+        if room is None:
+            continue
+        stats["files"] += 1
+        stats["bytes"] += os.path.getsize(room.path)
+        stats["sensor_rows"] += room.rows('sensor')
+        stats["appliance_rows"] += room.rows('appliance')
+    return stats
+
+@_timed
 def get_db_stats():
     """Returns row counts for the /api/stats endpoint."""
-    conn = sqlite3.connect('smarthome.db')
+    conn = get_connection()
     cursor = conn.cursor()
     stats = {}
     for table in ['sensor_log', 'appliance_log', 'energy_log']:
         cursor.execute(f"SELECT COUNT(*) FROM {table}")
         stats[table] = cursor.fetchone()[0]
-    conn.close()
+    stats["schema_version"] = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+    # Sensor rows per retention tier, and what pruning has given back
+    stats["tiers"] = {"raw": stats["sensor_log"]}
+    for tier, width in ROLLUP_BUCKETS.items():
+        cursor.execute("SELECT COUNT(*) FROM sensor_rollup WHERE resolution = ?", (width,))
+        stats["tiers"][tier] = cursor.fetchone()[0]
+    page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+    stats["file_bytes"] = cursor.execute("PRAGMA page_count").fetchone()[0] * page_size
+    stats["free_bytes"] = cursor.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+    stats["retention"] = {"days": RETENTION_DAYS, **_retention_totals}
+    stats["archive"] = archive_stats()
     return stats
 
     #manualreset
 
+@_timed
 def reset_db():
     """Clears all logs for a fresh, clean simulation run."""
-    conn = sqlite3.connect('smarthome.db')
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("DELETE FROM sensor_log")
     cursor.execute("DELETE FROM appliance_log")
     cursor.execute("DELETE FROM energy_log")
+    cursor.execute("DELETE FROM energy_checkpoint")
+    cursor.execute("DELETE FROM sensor_rollup")
+    cursor.execute("DELETE FROM energy_rollup")
     conn.commit()
-    conn.close()
-    print("Database cleared for a fresh 24-hour simulation.")
\ No newline at end of file
+    shutil.rmtree(archive_dir(), ignore_errors=True)
+    archive.forget(archive_dir())
+    # Its marks point at deleted rows
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(snapshot_path())
+    with _last_state_lock:
+        _last_state.clear()
+        _state_versions.clear()
+    log.info("Database cleared for a fresh 24-hour simulation.")
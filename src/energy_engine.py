@@ -0,0 +1,142 @@
+import gc
+
+import numpy as np
+
+import archive
+import database as db
+
+# Both queries walk the (room, appliance, timestamp) index in the same
+# order, so row i of BULK_ROWS_SQL belongs to the group covering i in
+# BULK_GROUPS_SQL and no sort or per-row string is needed. Names are
+# joined in only after grouping, once per appliance.
+# Each row is packed into one integer, ts_ms * 2 + is_on, so it can be
+# streamed straight into an int64 array without building row tuples.
+BULK_GROUPS_SQL = '''
+    SELECT r.name, a.name, g.n FROM (
+        SELECT room_id, appliance_id, COUNT(*) AS n FROM appliance_log
+        GROUP BY room_id, appliance_id
+    ) g
+    JOIN rooms r ON r.id = g.room_id
+    JOIN appliances a ON a.id = g.appliance_id
+    ORDER BY g.room_id, g.appliance_id
+'''
+BULK_ROWS_SQL = '''
+    SELECT ts_ms * 2 + is_on FROM appliance_log
+    ORDER BY room_id, appliance_id, ts_ms
+'''
+
+def ratings_from_controllers(controllers):
+    """Builds {(room, appliance): kW} from RoomController objects' Appliance.power."""
+    ratings = {}
+    for controller in controllers:
+        for appliance in (controller.ac, controller.lights):
+            ratings[(controller.room_name, appliance.name)] = appliance.power
+    return ratings
+
+def integrate(keys, counts, is_on, timestamps_ms, power_ratings=None):
+    """Vectorized kWh per (room, appliance) from transition arrays.
+
+    keys[g] is the (room, appliance) of the next counts[g] rows; rows are
+    sorted by time within each group. Follows the same rules as
+    database.recompute_energy(): an ON row (re)starts the open interval
+    and the next OFF row closes it.
+    power_ratings maps (room, appliance) or appliance name to kW and
+    defaults to database.POWER_RATINGS.
+    """
+    n = len(is_on)
+    if n == 0:
+        return {}
+    ratings = db.POWER_RATINGS if power_ratings is None else power_ratings
+
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    group = np.repeat(np.arange(len(counts)), counts)
+    group_start = starts[group]
+
+    # An OFF row closes an interval if the latest ON in its group came
+    # after the previous OFF
+    idx = np.arange(n)
+    on = is_on == 1
+    off = is_on == 0
+    last_on = np.maximum.accumulate(np.where(on, idx, -1))
+    last_off = np.maximum.accumulate(np.where(off, idx, -1))
+    prev_off = np.empty(n, dtype=np.int64)
+    prev_off[0] = -1
+    prev_off[1:] = last_off[:-1]
+    closes = off & (last_on >= group_start) & (last_on > prev_off)
+
+    hours = (timestamps_ms[closes] - timestamps_ms[last_on[closes]]) / db.HOUR_MS
+    hours_per_group = np.bincount(group[closes], weights=hours, minlength=len(starts))
+
+    result = {}
+    for g, key in enumerate(keys):
+        power = ratings.get(key, ratings.get(key[1], 0))
+        result[key] = float(hours_per_group[g]) * power
+    return result
+
+def load_transitions(db_path=None):
+    """Reads all of appliance_log and the archive as (keys, counts, is_on, timestamps_ms)."""
+    conn = db.get_connection(db_path)
+    if conn.in_transaction:
+        conn.commit()
+    # One read transaction so both queries see the same snapshot
+    conn.execute("BEGIN")
+    gc_was_enabled = gc.isenabled()
+    # A million row tuples trigger repeated, useless GC passes
+    gc.disable()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(BULK_GROUPS_SQL)
+        groups = cursor.fetchall()
+        cursor.execute(BULK_ROWS_SQL)
+        packed = np.fromiter((value for (value,) in cursor), dtype=np.int64)
+    finally:
+        conn.commit()
+        if gc_was_enabled:
+            gc.enable()
+    keys = [(room_id, appliance) for room_id, appliance, _ in groups]
+    counts = [count for _, _, count in groups]
+    return with_archive(keys, counts, packed & 1, packed >> 1, db_path)
+
+def with_archive(keys, counts, is_on, timestamps_ms, db_path=None):
+    """Adds each appliance's archived rows in front of its appliance_log rows.
+
+    The archive columns are read straight from the mapped files.
+    """
+    directory = db.archive_dir(db_path)
+    rooms = archive.rooms(directory)
+    if not rooms:
+        return keys, counts, is_on, timestamps_ms
+    bounds = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+    parts = {key: [(is_on[start:end], timestamps_ms[start:end])]
+             for key, start, end in zip(keys, bounds[:-1], bounds[1:])}
+    for room_id in rooms:
+        room = archive.open_room(directory, room_id)
+        if room is None:
+            continue
+        for appliance in room.names('appliance'):
+            columns = room.columns('appliance', appliance)
+            parts.setdefault((room_id, appliance), []).insert(0, (columns["is_on"], columns["ts_ms"]))
+
+    keys = list(parts)
+    counts = []
+    all_is_on = []
+    all_timestamps = []
+    for key in keys:
+        group_is_on = np.concatenate([part[0] for part in parts[key]]).astype(np.int64)
+        group_timestamps = np.concatenate([part[1] for part in parts[key]])
+        # Rows back-dated into the archived range sort in, by (ts_ms, is_on)
+        # like the index, so OFF comes before ON at equal timestamps
+        steps = np.diff(group_timestamps)
+        if (steps < 0).any() or ((steps == 0) & (np.diff(group_is_on) < 0)).any():
+            order = np.lexsort((group_is_on, group_timestamps))
+            group_is_on, group_timestamps = group_is_on[order], group_timestamps[order]
+        counts.append(len(group_timestamps))
+        all_is_on.append(group_is_on)
+        all_timestamps.append(group_timestamps)
+    return keys, counts, np.concatenate(all_is_on), np.concatenate(all_timestamps)
+
+def calculate_energy_bulk(db_path=None, power_ratings=None):
+    """Returns {(room, appliance): kWh} for every appliance in appliance_log."""
+    return integrate(*load_transitions(db_path), power_ratings=power_ratings)
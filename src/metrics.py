@@ -0,0 +1,190 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+# SHEMS_METRICS=0 turns instrumentation off at import: timed() then returns
+# the function itself, so the hot paths pay nothing. disable() switches it
+# off at runtime, leaving one flag check per call.
+ENABLED = os.environ.get('SHEMS_METRICS', '1') != '0'
+
+# Latency bucket upper bounds in seconds, from 10 µs to 10 s
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = {}  # name -> Counter/Histogram, in registration order
+_registry_lock = threading.Lock()
+
+def configure_logging(level=None):
+    """Leveled console logging for entry points.
+
+    The level defaults to SHEMS_LOG_LEVEL (INFO if unset): DEBUG adds a
+    line per logged sensor reading, WARNING or higher quiets the rest.
+    """
+    logging.basicConfig(level=level or os.environ.get('SHEMS_LOG_LEVEL', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+class Counter:
+    """A monotonically increasing count per combination of label values."""
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}  # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, label_values=()):
+        if not ENABLED:
+            return
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self.values.items()]
+
+class Histogram:
+    """Observation counts per latency bucket, plus their sum and count.
+
+    Counts are kept per bucket and only made cumulative when rendered,
+    so observe() is one bisect and two additions.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [count per bucket..., count above the last, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_values=()):
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        result = []
+        for labels, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                result.append((f"{self.name}_bucket", labels + (_format_bound(bound),), cumulative))
+            result.append((f"{self.name}_sum", labels, values[-1]))
+            result.append((f"{self.name}_count", labels, cumulative))
+        return result
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            # Modules re-imported under another name share the series
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+def counter(name, help_text, label_names=()):
+    return _register(Counter(name, help_text, label_names))
+
+def histogram(name, help_text, label_names=(), buckets=BUCKETS):
+    return _register(Histogram(name, help_text, label_names, buckets))
+
+def timed(histogram, *label_values):
+    """Decorator recording each call's duration in histogram."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, label_values)
+        return wrapper
+    return decorate
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def render():
+    """Every registered metric in the Prometheus text format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        names = metric.label_names
+        for sample, labels, value in metric.samples():
+            # Histogram buckets carry one more label value than names, for le
+            label_names = names + ('le',) if len(labels) > len(names) else names
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, labels))
+            lines.append(f"{sample}{{{label_text}}} {value}" if label_text else f"{sample} {value}")
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    """Clears every recorded value; the metrics stay registered."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        with metric._lock:
+            if metric.kind == 'counter':
+                metric.values.clear()
+            else:
+                metric.series.clear()
+
+HTTP_REQUEST_SECONDS = histogram(
+    "shems_http_request_duration_seconds", "Time to handle an API request", ["method", "route"])
+HTTP_REQUESTS = counter(
+    "shems_http_requests_total", "API requests handled", ["method", "route", "status"])
+
+def observe_request(method, route, status, seconds):
+    HTTP_REQUEST_SECONDS.observe(seconds, (method, route))
+    HTTP_REQUESTS.inc(1, (method, route, str(status)))
+
+def instrument_flask(app):
+    """Times every request to a Flask app, labelled by its route template."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        if ENABLED:
+            g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            observe_request(request.method, route, response.status_code, time.perf_counter() - start)
+        return response
@@ -0,0 +1,126 @@
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import database
+import metrics
+
+# The same questions asked of the old text schema and the new integer one
+LEGACY_QUERIES = {
+    "history (newest 50)": (
+        "SELECT value, timestamp FROM sensor_log WHERE room_id = ? AND sensor_type = ? "
+        "ORDER BY timestamp DESC LIMIT 50"),
+    "appliance rows": (
+        "SELECT state, is_on, timestamp FROM appliance_log WHERE room_id = ? AND appliance = ? "
+        "ORDER BY timestamp ASC"),
+    "sensor rows per day": (
+        "SELECT substr(timestamp, 1, 10), COUNT(*) FROM sensor_log GROUP BY 1"),
+}
+COMPACT_QUERIES = {
+    "history (newest 50)": database.HISTORY_SQL,
+    "appliance rows": database.ENERGY_ROWS_SQL,
+    "sensor rows per day": f"SELECT ts_ms / {database.DAY_MS}, COUNT(*) FROM sensor_log GROUP BY 1",
+}
+
+def sample_keys(conn, compact):
+    """(room, sensor_type, appliance) to query with, as names or ids."""
+    if compact:
+        room, sensor = conn.execute("SELECT room_id, sensor_type_id FROM sensor_log LIMIT 1").fetchone() or (0, 0)
+        appliance = (conn.execute("SELECT appliance_id FROM appliance_log LIMIT 1").fetchone() or (0,))[0]
+    else:
+        room, sensor = conn.execute("SELECT room_id, sensor_type FROM sensor_log LIMIT 1").fetchone() or ('', '')
+        appliance = (conn.execute("SELECT appliance FROM appliance_log LIMIT 1").fetchone() or ('',))[0]
+    return room, sensor, appliance
+
+def time_queries(db_path, compact, repeat=5):
+    """Best-of-repeat seconds per query, including turning timestamps into datetimes."""
+    conn = sqlite3.connect(db_path)
+    room, sensor, appliance = sample_keys(conn, compact)
+    queries = COMPACT_QUERIES if compact else LEGACY_QUERIES
+    params = {
+        "history (newest 50)": (room, sensor),
+        "appliance rows": (room, appliance),
+        "sensor rows per day": (),
+    }
+    # What the energy math needs from each row: a datetime or an integer
+    parse = (lambda ts: ts) if compact else datetime.fromisoformat
+    timings = {}
+    for name, sql in queries.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = conn.execute(sql, params[name]).fetchall()
+            if name == "appliance rows":
+                [parse(row[2]) for row in rows]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    conn.close()
+    return timings
+
+def row_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ('sensor_log', 'appliance_log')}
+    conn.close()
+    return counts
+
+def file_size(db_path):
+    """Bytes of the database file plus its WAL, if any."""
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+def migrate(db_path, backup=True):
+    conn = sqlite3.connect(db_path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    if version >= database.SCHEMA_VERSION:
+        print(f"{db_path} is already at schema v{version}, nothing to do.")
+        return
+
+    if backup:
+        backup_path = f"{db_path}.v{version}.bak"
+        # Through SQLite, so rows still in the -wal file are included
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(backup_path)
+        source.backup(target)
+        target.close()
+        source.close()
+        print(f"Backup written to {backup_path}")
+
+    size_before = file_size(db_path)
+    counts_before = row_counts(db_path)
+    before = time_queries(db_path, compact=version > 0)
+
+    start = time.perf_counter()
+    database.migrate_schema(db_path)
+    # Return the space the text columns used to the filesystem, and switch
+    # the file to incremental auto-vacuum for apply_retention()
+    database.close_all_connections()
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.close()
+    elapsed = time.perf_counter() - start
+
+    size_after = file_size(db_path)
+    counts_after = row_counts(db_path)
+    after = time_queries(db_path, compact=True)
+
+    print(f"Converted in {elapsed:.1f}s")
+    for table, count in counts_before.items():
+        print(f"  {table}: {count:,} rows -> {counts_after[table]:,}")
+    print(f"  file size: {size_before / 1e6:.2f} MB -> {size_after / 1e6:.2f} MB "
+          f"({size_after / size_before:.0%} of the original)")
+    for name, seconds in before.items():
+        print(f"  {name}: {seconds * 1000:.2f} ms -> {after[name] * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a SHEMS database to the compact integer schema")
+    parser.add_argument("db_path", nargs="?", default=database.DB_PATH)
+    parser.add_argument("--no-backup", action="store_true", help="convert in place without a .bak copy")
+    args = parser.parse_args()
+    metrics.configure_logging()
+    migrate(args.db_path, backup=not args.no_backup)
@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+
+class _Build:
+    """One build() in progress, which other callers for the same version wait on."""
+    def __init__(self, version):
+        self.version = version
+        self.entry = None
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, entry=None, error=None):
+        self.entry = entry
+        self.error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.entry
+
+class ResponseCache:
+    """Rendered response bodies, each valid until its version counter moves.
+
+    get(key, version, build) calls build() only when key has no entry for
+    that version; otherwise it returns the stored body. Every entry also
+    carries an ETag (a hash of the body) and the time it was built, for
+    conditional GETs.
+
+    build() runs without the lock, so a slow build only holds up callers
+    of the same key and version (who wait for its result rather than
+    building again); lookups and other keys are never blocked by it.
+    """
+    def __init__(self):
+        self._entries = {}  # key -> (version, body, etag, built_at)
+        self._building = {}  # key -> _Build in progress
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key, version, build):
+        """Returns (body, etag, built_at); build() must return the body as bytes."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1:]
+            # A burst of polls after a change renders the body once, not
+            # once per client: later callers wait for the first one's build
+            pending = self._building.get(key)
+            if pending is not None and pending.version == version:
+                self.hits += 1
+                wait = True
+            else:
+                self.misses += 1
+                pending = self._building[key] = _Build(version)
+                wait = False
+        if wait:
+            return pending.wait()
+        try:
+            body = build()
+            entry = (version, body, hashlib.blake2b(body, digest_size=8).hexdigest(), time.time())
+        except BaseException as e:
+            with self._lock:
+                if self._building.get(key) is pending:
+                    del self._building[key]
+            pending.finish(error=e)
+            raise
+        with self._lock:
+            self._entries[key] = entry
+            if self._building.get(key) is pending:
+                del self._building[key]
+        pending.finish(entry[1:])
+        return entry[1:]
+
+    def lookup(self, key, version):
+        """Returns (body, etag, built_at) if key is current for version, else None.
+
+        A None is not counted as a miss; the caller is expected to follow
+        up with get(), which counts it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.hits += 1
+            return entry[1:]
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
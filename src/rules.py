@@ -0,0 +1,101 @@
+import numpy as np
+
+from control import AC_ON_ABOVE, LIGHT_ON_BELOW, STATE_CODES, STATE_NAMES, state_code
+
+ALL_HOURS = range(24)
+
+OFF = STATE_CODES["OFF"]
+COOLING = STATE_CODES["COOLING"]
+ON = STATE_CODES["ON"]
+
+class RoomRules:
+    """Automation settings for one room; defaults match RoomController."""
+    def __init__(self, ac_on_above=AC_ON_ABOVE, light_on_below=LIGHT_ON_BELOW,
+                 light_needs_occupancy=True, ac_hours=ALL_HOURS, light_hours=ALL_HOURS):
+        self.ac_on_above = ac_on_above
+        self.light_on_below = light_on_below
+        self.light_needs_occupancy = light_needs_occupancy
+        # Hours of the day (0-23) in which automation may switch the appliance on
+        self.ac_hours = ac_hours
+        self.light_hours = light_hours
+
+def _hour_mask(hours):
+    mask = 0
+    for hour in hours:
+        if hour not in ALL_HOURS:
+            raise ValueError(f"Schedule hours are 0-23, not {hour!r}")
+        mask |= 1 << hour
+    return mask
+
+class RuleTable:
+    """Per-room rules compiled into arrays and evaluated for all rooms at once.
+
+    Gives the same decisions as RoomController.evaluate_state: AC cools
+    above its threshold, lights turn on below theirs while occupied, and
+    a manual override (non-zero state code) always wins. Schedules limit
+    the automatic decision to the allowed hours.
+    """
+    def __init__(self, room_names, rules=None):
+        """rules maps room name to RoomRules; missing rooms use the defaults."""
+        self.room_names = list(room_names)
+        self.index = {name: i for i, name in enumerate(self.room_names)}
+        n = len(self.room_names)
+        default = RoomRules()
+        self.ac_on_above = np.full(n, default.ac_on_above, dtype=float)
+        self.light_on_below = np.full(n, default.light_on_below, dtype=float)
+        self.light_needs_occupancy = np.full(n, default.light_needs_occupancy, dtype=bool)
+        self.ac_schedule = np.full(n, _hour_mask(default.ac_hours), dtype=np.uint32)
+        self.light_schedule = np.full(n, _hour_mask(default.light_hours), dtype=np.uint32)
+        # Only rooms with their own rules need per-room work
+        for name, room_rules in (rules or {}).items():
+            i = self.index.get(name)
+            if i is None:
+                continue
+            self.ac_on_above[i] = room_rules.ac_on_above
+            self.light_on_below[i] = room_rules.light_on_below
+            self.light_needs_occupancy[i] = room_rules.light_needs_occupancy
+            self.ac_schedule[i] = _hour_mask(room_rules.ac_hours)
+            self.light_schedule[i] = _hour_mask(room_rules.light_hours)
+
+    def evaluate(self, temps, occupied, light_levels, hour=None, ac_override=None, light_override=None):
+        """Returns (ac_codes, light_codes) arrays of state codes, one per room.
+
+        Overrides are arrays of state codes where 0 means none. With
+        hour=None schedules are ignored; other hours are taken modulo 24,
+        so the simulation's hour 24 is midnight, hour 0.
+        """
+        ac_on = np.asarray(temps) > self.ac_on_above
+        light_on = (np.asarray(light_levels) < self.light_on_below) & (
+            np.asarray(occupied, dtype=bool) | ~self.light_needs_occupancy)
+        if hour is not None:
+            bit = np.uint32(1 << (int(hour) % 24))
+            ac_on &= (self.ac_schedule & bit) != 0
+            light_on &= (self.light_schedule & bit) != 0
+
+        ac = np.where(ac_on, COOLING, OFF).astype(np.uint8)
+        lights = np.where(light_on, ON, OFF).astype(np.uint8)
+        if ac_override is not None:
+            ac = np.where(ac_override != 0, ac_override, ac).astype(np.uint8)
+        if light_override is not None:
+            lights = np.where(light_override != 0, light_override, lights).astype(np.uint8)
+        return ac, lights
+
+    def apply(self, controllers, hour=None):
+        """Evaluates RoomController objects in one pass and stores their states.
+
+        controllers must be in room_names order. Returns the same
+        (ac_state, light_state) pairs as calling evaluate_state on each.
+        """
+        temps = np.fromiter((c.current_temp for c in controllers), dtype=float, count=len(controllers))
+        occupied = np.fromiter((c.is_occupied for c in controllers), dtype=bool, count=len(controllers))
+        light_levels = np.fromiter((c.current_light_level for c in controllers), dtype=float, count=len(controllers))
+        ac_override = np.fromiter((state_code(c.manual_ac_override) for c in controllers), dtype=np.uint8, count=len(controllers))
+        light_override = np.fromiter((state_code(c.manual_light_override) for c in controllers), dtype=np.uint8, count=len(controllers))
+
+        ac, lights = self.evaluate(temps, occupied, light_levels, hour, ac_override, light_override)
+        states = []
+        for controller, ac_code, light_code in zip(controllers, ac.tolist(), lights.tolist()):
+            controller.ac.state = STATE_NAMES[ac_code]
+            controller.lights.state = STATE_NAMES[light_code]
+            states.append((controller.ac.state, controller.lights.state))
+        return states
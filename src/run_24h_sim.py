@@ -1,5 +1,4 @@
 import requests
-import time
 
 # Use the /api prefix consistently [cite: 34]
 BASE_URL = "http://127.0.0.1:5000/api"
@@ -8,22 +7,22 @@ ROOM = "Living Room"
 def start_simulation():
     print(f"--- Starting 24-Hour Architecture-Verified Simulation: {ROOM} ---")
     
-    for hour in range(1, 25):
-        # Sends the hour to the API to generate matching timestamps 
-        response = requests.post(f"{BASE_URL}/tick", json={
-            "hour": hour,
-            "room_id": ROOM
-        })
-        
-        if response.status_code == 200:
-            d = response.json()['data']
-            # Formatting for clear terminal output
-            print(f"Hour {hour:02d}: Temp={d['temperature']:.1f}°C | AC={d['ac_state']} | Lights={d['light_state']}")
-        else:
-            print(f"Error at hour {hour}: {response.text}")
-            break
-            
-        time.sleep(0.1) # Faster simulation for testing
+    # One batch request advances all 24 hours; timestamps still match each hour
+    response = requests.post(f"{BASE_URL}/tick/batch", json={
+        "rooms": [ROOM],
+        "start_hour": 1,
+        "end_hour": 24
+    })
+
+    if response.status_code != 200:
+        print(f"Error during simulation: {response.text}")
+        return
+
+    result = response.json()
+    d = result['data'][ROOM]
+    for i, hour in enumerate(result['hours']):
+        # Formatting for clear terminal output
+        print(f"Hour {hour:02d}: Temp={d['temperature'][i]:.1f}°C | AC={d['ac_state'][i]} | Lights={d['light_state'][i]}")
 
     print("\n--- Finalizing Simulation: Reconciling Energy Windows ---")
     # Force appliances OFF at hour 25 to close usage windows for calculation [cite: 134, 189]
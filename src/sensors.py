@@ -1,20 +1,215 @@
+import atexit
+import collections
+import logging
 import random
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+SENSOR_READ_SECONDS = metrics.histogram(
+    "shems_sensor_read_seconds", "Time in RoomSensors.read_all, observers included")
 
 class RoomSensors:
-    def __init__(self, room_name, base_temp=25.0):
+    __slots__ = ('room_name', 'base_temp', 'observers', 'random')
+
+    def __init__(self, room_name, base_temp=25.0, seed=None):
         self.room_name = room_name
         self.base_temp = base_temp
         self.observers = []
+        # A seed gives this room its own reproducible stream
+        self.random = random if seed is None else random.Random(seed)
 
     def add_observer(self, observer):
         self.observers.append(observer)
 
+    @metrics.timed(SENSOR_READ_SECONDS)
     def read_all(self, hour):
         """Simulates sensor readings based on the time of day"""
         # Simulating higher temps during the day (hours 10-16)
-        temp = self.base_temp + (5.0 if 10 <= hour <= 16 else 0) + random.uniform(-1, 1)
+        temp = self.base_temp + (5.0 if 10 <= hour <= 16 else 0) + self.random.uniform(-1, 1)
         occupied = True if 8 <= hour <= 22 else False
         light_level = 800 if 7 <= hour <= 18 else 100
-        
+
         for observer in self.observers:
-            observer.update(temp, occupied, light_level)
\ No newline at end of file
+            observer.update(temp, occupied, light_level)
+
+class QueuedObserver:
+    """Wraps a slow observer so the Subject never waits on it.
+
+    update() only enqueues the reading on a bounded queue; a background
+    thread replays it into the wrapped observer. When the queue is full,
+    policy 'block' makes the caller wait for space and 'drop_oldest'
+    discards the oldest pending reading. Control observers should stay
+    inline; this is for sinks such as database logging.
+    """
+    POLICIES = ('block', 'drop_oldest')
+
+    def __init__(self, observer, maxsize=1000, policy='block', name=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}")
+        self.observer = observer
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name or type(observer).__name__
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._worker = threading.Thread(target=self._run, name=f"queued-{self.name}", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def update(self, *args):
+        with self._cond:
+            if self._closed:
+                # Nothing will drain the queue any more; deliver inline
+                self.observer.update(*args)
+                return
+            if len(self._queue) >= self.maxsize:
+                if self.policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+            self._queue.append((time.monotonic(), args))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                enqueued, args = self._queue.popleft()
+                self._busy = True
+                self._cond.notify_all()
+            try:
+                self.observer.update(*args)
+            except Exception:
+                self.errors += 1
+                log.exception("Observer %s failed on %r", self.name, args)
+            lag = time.monotonic() - enqueued
+            with self._cond:
+                self._busy = False
+                self.processed += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until every queued reading has been delivered."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    def close(self):
+        """Delivers what is still queued and stops the worker."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+    def metrics(self):
+        """Queue depth, throughput and lag (enqueue to delivered) figures."""
+        with self._cond:
+            return {
+                "policy": self.policy,
+                "depth": len(self._queue),
+                "max_depth": self.max_depth,
+                "capacity": self.maxsize,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "last_lag_ms": round(self.last_lag * 1000, 3),
+                "max_lag_ms": round(self.max_lag * 1000, 3),
+            }
+
+class BatchRoomSensors:
+    """Vectorized RoomSensors for many rooms at once.
+
+    Produces the same daily pattern as RoomSensors as NumPy arrays shaped
+    (rooms, hours). Each room draws from its own generator seeded with
+    (seed, room name), so a room's readings are reproducible regardless of
+    which other rooms are simulated alongside it.
+
+    Observers added with add_room_observer(room_name, observer) get one
+    room's readings through the usual update(temp, occupied, light_level).
+    Observers added with add_bulk_observer receive the whole block in one
+    update_bulk(room_names, hours, temps, occupied, light_levels) call.
+    """
+    def __init__(self, room_names, base_temp=25.0, seed=0):
+        self.room_names = list(room_names)
+        self.base_temps = np.broadcast_to(np.asarray(base_temp, dtype=float), (len(self.room_names),)).copy()
+        self.seed = seed
+        self.rngs = [np.random.default_rng([seed, zlib.crc32(name.encode())]) for name in self.room_names]
+        self.observers = {}
+        self.bulk_observers = []
+
+    def add_room_observer(self, room_name, observer):
+        self.observers.setdefault(room_name, []).append(observer)
+
+    def add_bulk_observer(self, observer):
+        self.bulk_observers.append(observer)
+
+    def generate(self, hours):
+        """Returns (temps, occupied, light_levels) arrays for the given hours of day."""
+        hours = np.asarray(hours)
+        noise = np.empty((len(self.room_names), len(hours)))
+        for i, rng in enumerate(self.rngs):
+            noise[i] = rng.uniform(-1, 1, size=len(hours))
+        day_heat = np.where((hours >= 10) & (hours <= 16), 5.0, 0.0)
+        temps = self.base_temps[:, None] + day_heat + noise
+        occupied = np.broadcast_to((hours >= 8) & (hours <= 22), temps.shape)
+        light_levels = np.broadcast_to(np.where((hours >= 7) & (hours <= 18), 800, 100), temps.shape)
+        return temps, occupied, light_levels
+
+    def deliver(self, hours, temps, occupied, light_levels):
+        """Notifies bulk observers once and per-room observers hour by hour."""
+        for observer in self.bulk_observers:
+            observer.update_bulk(self.room_names, hours, temps, occupied, light_levels)
+        if self.observers:
+            temp_rows, occupied_rows, light_rows = temps.tolist(), occupied.tolist(), light_levels.tolist()
+            for i, name in enumerate(self.room_names):
+                for observer in self.observers.get(name, ()):
+                    for h in range(len(hours)):
+                        observer.update(temp_rows[i][h], occupied_rows[i][h], light_rows[i][h])
+
+    def read_hours(self, hours):
+        """Generates and delivers readings for several hours; returns the arrays."""
+        hours = list(hours)
+        readings = self.generate(hours)
+        self.deliver(hours, *readings)
+        return readings
+
+    def read_all(self, hour):
+        """Same as RoomSensors.read_all, for every room at once."""
+        return self.read_hours([hour])
+
+    def stream(self, hours):
+        """Generates every hour in one pass, then delivers them one at a time.
+
+        Yields each hour after its observers have run, so callers can
+        evaluate controllers between hours without paying for a generator
+        call per room per hour.
+        """
+        hours = list(hours)
+        temps, occupied, light_levels = self.generate(hours)
+        for j, hour in enumerate(hours):
+            self.deliver([hour], temps[:, j:j + 1], occupied[:, j:j + 1], light_levels[:, j:j + 1])
+            yield hour
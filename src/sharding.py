@@ -0,0 +1,381 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import archive
+import database as db
+import metrics
+
+# A sharded store is a directory of shard-<i>.db files plus a manifest
+# recording how many there are. Every room lives in exactly one shard,
+# picked by a CRC32 of its name (stable across processes, unlike hash()),
+# so each file has its own SQLite write lock and rooms on different
+# shards never wait for each other. The store offers the database.py
+# calls the API uses, under the same names.
+
+DEFAULT_SHARDS = 4
+MANIFEST = "shards.json"
+
+def shard_for(room_id, shards):
+    """Index of the shard holding room_id."""
+    return zlib.crc32(room_id.encode()) % shards
+
+def shard_path(directory, index):
+    return os.path.join(directory, f"shard-{index}.db")
+
+def read_manifest(directory):
+    """The shard count recorded in directory, or None for a new store."""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)["shards"]
+    except FileNotFoundError:
+        return None
+
+def write_manifest(directory, shards):
+    # Written to a temp file and renamed, so readers never see half of it
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"shards": shards}, f)
+    os.replace(path + ".tmp", path)
+
+class ShardedStore:
+    """Routes per-room calls to one shard and fans aggregates out to all.
+
+    shards is only used to create a new store; an existing one keeps the
+    count in its manifest until rebalance() changes it.
+    """
+    def __init__(self, directory, shards=None):
+        os.makedirs(directory, exist_ok=True)
+        recorded = read_manifest(directory)
+        if recorded is None:
+            recorded = shards or DEFAULT_SHARDS
+            write_manifest(directory, recorded)
+        elif shards is not None and shards != recorded:
+            raise ValueError(f"{directory} holds {recorded} shards, not {shards}; "
+                             f"use `python sharding.py rebalance` to change it")
+        self.directory = directory
+        self.paths = [shard_path(directory, i) for i in range(recorded)]
+        self.pool = ThreadPoolExecutor(max_workers=len(self.paths), thread_name_prefix="shard")
+
+    def path_for(self, room_id):
+        return self.paths[shard_for(room_id, len(self.paths))]
+
+    def on_shard(self, path, fn, *args):
+        """fn(*args) with the database layer pointed at one shard file."""
+        with db.using_db(path):
+            return fn(*args)
+
+    def on_room(self, room_id, fn, *args):
+        return self.on_shard(self.path_for(room_id), fn, *args)
+
+    def fan_out(self, fn, *args):
+        """fn(*args) on every shard in parallel, results in shard order."""
+        if len(self.paths) == 1:
+            return [self.on_shard(self.paths[0], fn, *args)]
+        return list(self.pool.map(lambda path: self.on_shard(path, fn, *args), self.paths))
+
+    def group(self, rows, room_index=0):
+        """Rows grouped by the shard of their room, as {path: rows}."""
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.path_for(row[room_index]), []).append(row)
+        return groups
+
+    def _write_groups(self, fn, rows):
+        groups = self.group(rows)
+        paths = list(groups)
+        if len(paths) == 1:
+            return [self.on_shard(paths[0], fn, groups[paths[0]])]
+        return list(self.pool.map(lambda path: self.on_shard(path, fn, groups[path]), paths))
+
+    def close(self):
+        self.pool.shutdown()
+
+    # Setup
+
+    def init_db(self):
+        for path in self.paths:
+            db.init_db(path)
+
+    # Per-room calls, routed to one shard
+
+    def record_appliance_state(self, room_id, appliance, state, is_on, timestamp=None):
+        return self.on_room(room_id, db.record_appliance_state, room_id, appliance, state, is_on, timestamp)
+
+    def log_appliance_state(self, room_id, appliance, state, is_on, hour):
+        return self.on_room(room_id, db.log_appliance_state, room_id, appliance, state, is_on, hour)
+
+    def get_last_state(self, room_id, appliance):
+        return self.on_room(room_id, db.get_last_state, room_id, appliance)
+
+    def get_sensor_history(self, room_id, sensor_type):
+        return self.on_room(room_id, db.get_sensor_history, room_id, sensor_type)
+
+    def get_sensor_history_page(self, room_id, sensor_type, limit=50, cursor=None):
+        return self.on_room(room_id, db.get_sensor_history_page, room_id, sensor_type, limit, cursor)
+
+    def calculate_energy(self, room_id, appliance):
+        return self.on_room(room_id, db.calculate_energy, room_id, appliance)
+
+    # Batches, split by shard and written in parallel
+
+    def record_sensor_readings(self, rows):
+        self._write_groups(db.record_sensor_readings, rows)
+
+    def record_appliance_states(self, rows):
+        self._write_groups(db.record_appliance_states, rows)
+
+    def log_appliance_states(self, entries):
+        return sum(self._write_groups(db.log_appliance_states, entries))
+
+    # Aggregates over every room, fanned out and merged
+
+    def calculate_total_energy(self):
+        breakdown = {}
+        for shard in self.fan_out(db.energy_breakdown):
+            for name, kwh in shard.items():
+                breakdown[name] = breakdown.get(name, 0) + kwh
+        return {"total_kwh": round(sum(breakdown.values()), 2),
+                "breakdown": {name: round(kwh, 2) for name, kwh in breakdown.items()}}
+
+    def get_db_stats(self):
+        shards = self.fan_out(db.get_db_stats)
+        stats = {}
+        for key in ('sensor_log', 'appliance_log', 'energy_log', 'file_bytes', 'free_bytes'):
+            stats[key] = sum(shard[key] for shard in shards)
+        stats["schema_version"] = min(shard["schema_version"] for shard in shards)
+        stats["tiers"] = {tier: sum(shard["tiers"][tier] for shard in shards) for tier in shards[0]["tiers"]}
+        # Retention totals are kept per process, not per file
+        stats["retention"] = shards[0]["retention"]
+        stats["archive"] = {key: sum(shard["archive"][key] for shard in shards) for key in shards[0]["archive"]}
+        stats["shards"] = [{"path": path, "sensor_log": shard["sensor_log"],
+                            "appliance_log": shard["appliance_log"], "file_bytes": shard["file_bytes"]}
+                           for path, shard in zip(self.paths, shards)]
+        return stats
+
+    def apply_retention(self, **options):
+        result = {}
+        for shard in self.fan_out(lambda: db.apply_retention(**options)):
+            for key, value in shard.items():
+                result[key] = result.get(key, 0) + value
+        return result
+
+    def reset_db(self):
+        self.fan_out(db.reset_db)
+
+class ShardedDataLogger:
+    """DataLogger interface with one BufferedDataLogger, and so one writer, per shard."""
+    def __init__(self, store, **options):
+        self.store = store
+        self.loggers = {path: db.BufferedDataLogger(path, **options) for path in store.paths}
+
+    def update(self, room_id, sensor_type, value):
+        self.loggers[self.store.path_for(room_id)].update(room_id, sensor_type, value)
+
+    def flush(self):
+        for logger in self.loggers.values():
+            logger.flush()
+
+    def close(self):
+        for logger in self.loggers.values():
+            logger.close()
+
+# Rebalancing: the columns copied per table and the dictionary each id
+# column refers to. Row ids are not copied; rows keep their order, and
+# each new shard numbers them above the ids in its rooms' archive files,
+# which move over unchanged, so ids are never reused within a shard.
+COPIED_TABLES = {
+    'sensor_log': ('room_id', 'sensor_type_id', 'value', 'ts_ms'),
+    'appliance_log': ('room_id', 'appliance_id', 'state_id', 'is_on', 'ts_ms'),
+    'energy_log': ('room_id', 'appliance_id', 'kwh', 'start_ms', 'end_ms'),
+    'energy_checkpoint': ('room_id', 'appliance_id', 'last_row_id', 'on_since_ms', 'kwh', 'last_ts_ms'),
+    'sensor_rollup': ('room_id', 'sensor_type_id', 'resolution', 'bucket_ms', 'count', 'total',
+                      'min_value', 'max_value'),
+    'energy_rollup': ('room_id', 'appliance_id', 'bucket_ms', 'kwh'),
+}
+ID_COLUMNS = {
+    'room_id': 'rooms',
+    'sensor_type_id': 'sensor_types',
+    'appliance_id': 'appliances',
+    'state_id': 'states',
+}
+ROWID_TABLES = ('sensor_log', 'appliance_log', 'energy_log')
+
+def copy_rooms_sql(table):
+    """INSERT ... SELECT copying the moving rooms' rows of table from src,
+    with every dictionary id translated through the names."""
+    columns = COPIED_TABLES[table]
+    selected = []
+    joins = []
+    for column in columns:
+        dictionary = ID_COLUMNS.get(column)
+        if dictionary is None:
+            selected.append(f"s.{column}")
+            continue
+        # Room ids always resolve; the other ids may be NULL
+        join = "JOIN" if column == 'room_id' else "LEFT JOIN"
+        joins.append(f"{join} src.{dictionary} o_{column} ON o_{column}.id = s.{column} "
+                     f"{join} main.{dictionary} n_{column} ON n_{column}.name = o_{column}.name")
+        selected.append(f"n_{column}.id")
+    order = "ORDER BY s.id" if table in ROWID_TABLES else ""
+    return (f"INSERT INTO main.{table} ({', '.join(columns)}) SELECT {', '.join(selected)} "
+            f"FROM src.{table} s {' '.join(joins)} "
+            f"WHERE o_room_id.name IN (SELECT name FROM temp.moving) {order}")
+
+def table_counts(path):
+    conn = sqlite3.connect(path)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in COPIED_TABLES}
+    conn.close()
+    return counts
+
+def rebalance(directory, shards, backup=True):
+    """Redistributes every room of the store in directory over shards files.
+
+    Run it with the servers stopped. The new files are built beside the
+    old ones and swapped in once their row counts match; the old files
+    are kept in a before-rebalance-* directory unless backup is False.
+    """
+    old_paths = [shard_path(directory, i) for i in range(read_manifest(directory))]
+    if len(old_paths) == shards:
+        print(f"{directory} already has {shards} shards, nothing to do.")
+        return
+    start = time.perf_counter()
+
+    # 1. Fold every appliance row into the checkpoints, so the copied
+    # checkpoints need no row ids from the old files
+    for path in old_paths:
+        db.update_energy_checkpoints(path)
+    db.close_all_connections()
+
+    # 2. Build the new shards, pulling each room's rows from its old shard
+    build_dir = os.path.join(directory, "rebalance")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+    new_paths = [shard_path(build_dir, i) for i in range(shards)]
+    for index, new_path in enumerate(new_paths):
+        db.init_db(new_path)
+        conn = db.get_connection(new_path)
+        with conn:
+            # Copied rows get ids above every archived row of the shard's rooms
+            for old_path in old_paths:
+                archived = db._archived_max_ids(db.archive_dir(old_path), [
+                    room_id for room_id in archive.rooms(db.archive_dir(old_path))
+                    if shard_for(room_id, shards) == index])
+                for table, seq in archived.items():
+                    db._raise_sequence(conn.cursor(), table, seq)
+        # The copied rollups already cover the copied raw rows
+        conn.execute("DROP TRIGGER sensor_log_rollup")
+        conn.execute("CREATE TEMP TABLE moving (name TEXT PRIMARY KEY)")
+        for old_path in old_paths:
+            conn.execute("ATTACH DATABASE ? AS src", (old_path,))
+            with conn:
+                conn.execute("DELETE FROM temp.moving")
+                rooms = [name for (name,) in conn.execute("SELECT name FROM src.rooms ORDER BY id")
+                         if shard_for(name, shards) == index]
+                conn.executemany("INSERT INTO temp.moving VALUES (?)", [(name,) for name in rooms])
+                conn.execute("INSERT OR IGNORE INTO main.rooms (name) SELECT name FROM temp.moving")
+                for dictionary in ('sensor_types', 'appliances', 'states'):
+                    conn.execute(f"INSERT OR IGNORE INTO main.{dictionary} (name) "
+                                 f"SELECT name FROM src.{dictionary} ORDER BY id")
+                for table in COPIED_TABLES:
+                    conn.execute(copy_rooms_sql(table))
+            conn.execute("DETACH DATABASE src")
+        with conn:
+            # Every copied row is already folded in
+            conn.execute('''
+                UPDATE energy_checkpoint SET last_row_id = COALESCE(
+                    (SELECT MAX(id) FROM appliance_log a
+                     WHERE a.room_id = energy_checkpoint.room_id
+                       AND a.appliance_id = energy_checkpoint.appliance_id), 0)
+            ''')
+            db._create_indexes(conn.cursor())
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close_all_connections()
+
+    # 3. Nothing is swapped in unless every row arrived
+    before = [table_counts(path) for path in old_paths]
+    after = [table_counts(path) for path in new_paths]
+    for table in COPIED_TABLES:
+        old_total = sum(counts[table] for counts in before)
+        new_total = sum(counts[table] for counts in after)
+        if old_total != new_total:
+            raise RuntimeError(f"{table}: {old_total} rows before, {new_total} after; "
+                               f"old shards left in place, new ones in {build_dir}")
+
+    # 4. Swap the files and the manifest. Archive files are per room, so
+    # they move whole to their room's new shard
+    backup_dir = os.path.join(directory, f"before-rebalance-{len(old_paths)}-to-{shards}-{datetime.now():%Y%m%d-%H%M%S}")
+    os.makedirs(backup_dir)
+    for path in old_paths:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                shutil.move(path + suffix, os.path.join(backup_dir, os.path.basename(path) + suffix))
+        old_archive = db.archive_dir(path)
+        if os.path.isdir(old_archive):
+            shutil.copytree(old_archive, os.path.join(backup_dir, os.path.basename(old_archive)))
+            for room_id in archive.rooms(old_archive):
+                new_archive = db.archive_dir(new_paths[shard_for(room_id, shards)])
+                os.makedirs(new_archive, exist_ok=True)
+                os.replace(archive.room_path(old_archive, room_id), archive.room_path(new_archive, room_id))
+            shutil.rmtree(old_archive)
+            archive.forget(old_archive)
+    for new_path, final_path in zip(new_paths, [shard_path(directory, i) for i in range(shards)]):
+        os.replace(new_path, final_path)
+        if os.path.isdir(db.archive_dir(new_path)):
+            os.replace(db.archive_dir(new_path), db.archive_dir(final_path))
+        # Ids cached for the old file at this path no longer apply
+        db._clear_dictionary_cache(final_path)
+    write_manifest(directory, shards)
+    shutil.rmtree(build_dir)
+    if not backup:
+        shutil.rmtree(backup_dir)
+
+    print(f"Rebalanced {len(old_paths)} -> {shards} shards in {time.perf_counter() - start:.1f}s")
+    for table in COPIED_TABLES:
+        print(f"  {table}: {sum(counts[table] for counts in after):,} rows, per shard "
+              f"{[counts[table] for counts in after]}")
+    if backup:
+        print(f"Old shards kept in {backup_dir}")
+
+def split(db_path, directory, shards=DEFAULT_SHARDS):
+    """Turns a single database file into a sharded store in directory."""
+    if read_manifest(directory) is not None:
+        raise ValueError(f"{directory} already holds a sharded store")
+    os.makedirs(directory, exist_ok=True)
+    # A one-shard store is a copy of the file, which rebalance() then spreads out
+    db.close_all_connections()
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    shutil.copy2(db_path, shard_path(directory, 0))
+    if os.path.isdir(db.archive_dir(db_path)):
+        shutil.copytree(db.archive_dir(db_path), db.archive_dir(shard_path(directory, 0)))
+    db.migrate_schema(shard_path(directory, 0))
+    db.close_all_connections()
+    write_manifest(directory, 1)
+    if shards > 1:
+        rebalance(directory, shards, backup=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage a room-sharded SHEMS store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("rebalance", help="change the number of shards of a store")
+    command.add_argument("directory")
+    command.add_argument("shards", type=int)
+    command.add_argument("--no-backup", action="store_true", help="delete the old shard files afterwards")
+    command = commands.add_parser("split", help="create a store from a single database file")
+    command.add_argument("db_path")
+    command.add_argument("directory")
+    command.add_argument("--shards", type=int, default=DEFAULT_SHARDS)
+    args = parser.parse_args()
+    metrics.configure_logging()
+    if args.command == "rebalance":
+        rebalance(args.directory, args.shards, backup=not args.no_backup)
+    else:
+        split(args.db_path, args.directory, args.shards)
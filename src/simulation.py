@@ -0,0 +1,131 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import database as db
+import metrics
+from control import STATE_CODES, STATE_NAMES
+from rules import RuleTable
+from sensors import BatchRoomSensors
+
+class ReadingCollector:
+    """Bulk observer that keeps readings as sensor_log rows instead of writing them.
+
+    timestamps[i] is stamped on the i-th simulated hour it receives.
+    """
+    def __init__(self, timestamps):
+        self.timestamps = timestamps
+        self.delivered = 0
+        self.rows = []
+
+    def update_bulk(self, room_names, hours, temps, occupied, light_levels):
+        # Same rows the LoggerAdapter in app.py produces
+        for j in range(len(hours)):
+            timestamp = self.timestamps[self.delivered]
+            self.delivered += 1
+            for room_id, temp, occ, light in zip(room_names, temps[:, j].tolist(),
+                                                 occupied[:, j].tolist(), light_levels[:, j].tolist()):
+                self.rows.append((room_id, "Temperature", temp, timestamp))
+                self.rows.append((room_id, "Occupancy", 1 if occ else 0, timestamp))
+                self.rows.append((room_id, "LightLevel", light, timestamp))
+
+def simulate_chunk(room_names, hours, start_time, last_states, seed, rules=None):
+    """Runs the sensor -> controller cycle for a group of rooms.
+
+    Readings for every hour are generated up front and each hour's
+    decisions are made for all rooms at once by a RuleTable, which gives
+    the same results as RoomController.evaluate_state.
+
+    last_states maps (room, appliance) to the is_on already in the
+    database so the first tick only logs real transitions. Sensor noise
+    is seeded per room, so results do not depend on the chunking.
+    Returns (sensor rows, appliance transition rows).
+    """
+    start_ms = db.to_ms(start_time)
+    timestamps = [start_ms + h * db.HOUR_MS for h in range(hours)]
+    sensors = BatchRoomSensors(room_names, seed=seed)
+    collector = ReadingCollector(timestamps)
+    sensors.add_bulk_observer(collector)
+    table = RuleTable(room_names, rules)
+    hours_of_day = [h % 24 for h in range(hours)]
+    temps, occupied, light_levels = sensors.read_hours(hours_of_day)
+
+    # Last logged is_on per room and appliance; -1 = nothing logged yet
+    appliances = [("AC", STATE_CODES["COOLING"]), ("Light", STATE_CODES["ON"])]
+    last = {appliance: np.array([last_states.get((name, appliance), -1) for name in room_names])
+            for appliance, _ in appliances}
+
+    appliance_rows = []
+    for h, hour in enumerate(hours_of_day):
+        decisions = table.evaluate(temps[:, h], occupied[:, h], light_levels[:, h], hour)
+        for (appliance, on_code), codes in zip(appliances, decisions):
+            is_on = (codes == on_code).astype(np.int64)
+            changed = np.flatnonzero(is_on != last[appliance])
+            last[appliance][changed] = is_on[changed]
+            for i in changed.tolist():
+                appliance_rows.append((room_names[i], appliance, STATE_NAMES[codes[i]], int(is_on[i]), timestamps[h]))
+
+    return collector.rows, appliance_rows
+
+def run(n_rooms, days, workers=None, chunk_size=100, write=True, seed=0):
+    """Simulates n_rooms for the given number of days across a process pool.
+
+    Chunks are written to the database as they finish, each in one
+    transaction. Returns a dict of counts and rooms*hours per second.
+    """
+    hours = days * 24
+    room_names = [f"Room {i}" for i in range(n_rooms)]
+    start_time = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+    chunks = [room_names[i:i + chunk_size] for i in range(0, n_rooms, chunk_size)]
+
+    sensor_count = appliance_count = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for i, chunk in enumerate(chunks):
+            last_states = {}
+            if write:
+                for name in chunk:
+                    for appliance in ("AC", "Light"):
+                        state = db.get_last_state(name, appliance)
+                        if state is not None:
+                            last_states[(name, appliance)] = state
+            futures.append(pool.submit(simulate_chunk, chunk, hours, start_time, last_states, seed))
+
+        for future in as_completed(futures):
+            sensor_rows, appliance_rows = future.result()
+            if write:
+                db.record_sensor_readings(sensor_rows)
+                db.record_appliance_states(appliance_rows)
+            sensor_count += len(sensor_rows)
+            appliance_count += len(appliance_rows)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "rooms": n_rooms,
+        "hours": hours,
+        "sensor_rows": sensor_count,
+        "appliance_rows": appliance_count,
+        "seconds": round(elapsed, 3),
+        "room_hours_per_sec": round(n_rooms * hours / elapsed, 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process multi-room simulation")
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=None, help="default: CPU count")
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--no-write", action="store_true", help="skip database writes")
+    args = parser.parse_args()
+
+    metrics.configure_logging()
+    if not args.no_write:
+        db.init_db()
+    result = run(args.rooms, args.days, args.workers, args.chunk_size, write=not args.no_write)
+    print(f"Simulated {result['rooms']} rooms x {result['hours']} hours in {result['seconds']}s")
+    print(f"  {result['sensor_rows']:,} sensor rows, {result['appliance_rows']:,} appliance transitions")
+    print(f"  {result['room_hours_per_sec']:,} room-hours/sec")
@@ -0,0 +1,226 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+
+import numpy as np
+
+import database as db
+import metrics
+from control import STATE_CODES, STATE_NAMES
+
+log = logging.getLogger(__name__)
+
+# Room state snapshots for fast warm restarts. The snapshot is one .npz
+# file next to the database (db.snapshot_path()) holding:
+#
+#   meta          JSON: format version, when it was taken, the log marks
+#                 (id and ts_ms of the newest sensor_log / appliance_log
+#                 row it reflects), room names, appliance state names and
+#                 the (room, appliance) keys of the state arrays
+#   room_<column> every RoomStateStore column: readings, appliance states
+#                 and manual overrides, one slot per room
+#   state_*       the newest appliance_log row of each (room, appliance):
+#                 ts_ms, is_on and state, as the state cache holds them
+#
+# restore() loads it and replays only the log rows above its marks, so
+# startup no longer scans the whole appliance_log, and controllers come
+# back with the states and overrides they had. The file is written to a
+# temp file and renamed over the old one, so a crash never leaves half a
+# snapshot. Energy checkpoints need no copy here: energy_checkpoint
+# already persists them and calculate_energy() only folds newer rows.
+
+VERSION = 1
+SNAPSHOT_INTERVAL = 60  # seconds between SnapshotWorker snapshots
+
+# Sensor types and appliances logged by app.LoggerAdapter and tick_room,
+# and the RoomStateStore column each one sets when replayed
+READING_COLUMNS = {"Temperature": 'temp', "Occupancy": 'occupied', "LightLevel": 'light_level'}
+APPLIANCE_COLUMNS = {"AC": 'ac_state', "Light": 'light_state'}
+OVERRIDE_COLUMNS = ['ac_override', 'light_override']
+
+SNAPSHOT_SECONDS = metrics.histogram(
+    "shems_snapshot_write_seconds", "Time to read the log changes and write a state snapshot")
+
+# db path -> (marks, states) of the newest snapshot written or restored in
+# this process, so the next write only reads rows above its marks
+_latest = {}
+_latest_lock = threading.Lock()
+
+def _newer(states, changes):
+    """states updated with changes, keeping the newest row per key (ties go to changes)."""
+    merged = dict(states)
+    for key, entry in changes.items():
+        current = merged.get(key)
+        if current is None or entry[0] >= current[0]:
+            merged[key] = entry
+    return merged
+
+@metrics.timed(SNAPSHOT_SECONDS)
+def write(store, db_path=None):
+    """Snapshots store and the appliance states of its database; returns the meta.
+
+    Only rows logged since the previous snapshot of this process are read;
+    the first snapshot reads the newest row of every appliance once.
+    """
+    path = db.snapshot_path(db_path)
+    with _latest_lock:
+        previous = _latest.get(path)
+    if previous is not None and not db.marks_intact(previous[0], db_path):
+        previous = None
+    after, states = previous or (None, {})
+    marks, changes, _ = db.read_changes(after, readings=False, db_path=db_path)
+    states = _newer(states, changes)
+
+    # The store is updated before readings are logged, so it is never
+    # older than the marks
+    names = list(store.names)
+    arrays = {f"room_{name}": store.column(name).copy() for name in store.columns}
+    keys = list(states)
+    state_names = sorted({entry[2] for entry in states.values() if entry[2]})
+    state_index = {name: i + 1 for i, name in enumerate(state_names)}  # 0 = unknown
+    arrays["state_ts"] = np.array([states[key][0] for key in keys], dtype=np.int64)
+    arrays["state_is_on"] = np.array([states[key][1] for key in keys], dtype=np.int8)
+    arrays["state_code"] = np.array([state_index.get(states[key][2], 0) for key in keys], dtype=np.uint16)
+    meta = {
+        "version": VERSION,
+        "created": time.time(),
+        "marks": marks,
+        "rooms": names,
+        "room_state_names": list(STATE_NAMES),  # what the room_*state / *override codes mean
+        "state_keys": [list(key) for key in keys],
+        "state_names": [None] + state_names,
+    }
+    arrays["meta"] = np.array(json.dumps(meta))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    with _latest_lock:
+        _latest[path] = (marks, states)
+    return meta
+
+def load(db_path=None):
+    """(meta, arrays) of the snapshot of a database, or None if it has none."""
+    try:
+        with np.load(db.snapshot_path(db_path), allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+    except FileNotFoundError:
+        return None
+    meta = json.loads(str(arrays.pop("meta")))
+    if meta.get("version") != VERSION:
+        raise ValueError(f"unsupported snapshot version {meta.get('version')}")
+    return meta, arrays
+
+def restore(store, db_path=None):
+    """Fills store and the state cache from the snapshot plus the rows logged after it.
+
+    Rooms must already be registered in store; snapshot rooms that are not
+    are left out. Without a usable snapshot the cache is warmed from the
+    full log instead and store keeps its defaults. Returns a summary, or
+    None when there was no usable snapshot.
+    """
+    try:
+        snapshot = load(db_path)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        log.warning("Ignoring unreadable snapshot: %s", e)
+        snapshot = None
+    if snapshot is not None and not db.marks_intact(snapshot[0]["marks"], db_path):
+        log.warning("Ignoring snapshot: the logs changed under its marks")
+        snapshot = None
+    if snapshot is None:
+        db.warm_state_cache(db_path)
+        return None
+    meta, arrays = snapshot
+
+    # 1. Appliance states as of the snapshot, then the rows logged since
+    state_names = meta["state_names"]
+    states = {tuple(key): (ts, is_on, state_names[code])
+              for key, ts, is_on, code in zip(meta["state_keys"], arrays["state_ts"].tolist(),
+                                              arrays["state_is_on"].tolist(), arrays["state_code"].tolist())}
+    marks, changes, latest = db.read_changes(meta["marks"], db_path=db_path)
+    states = _newer(states, changes)
+    db.seed_state_cache(states, marks['appliance_log_version'], db_path)
+
+    # 2. Room columns, mapping state codes through their names in case the
+    # list changed; a state this version does not know becomes 0 (none)
+    codes = np.array([STATE_CODES.get(name, 0) for name in meta["room_state_names"]], dtype=np.uint8)
+    restored = 0
+    for i, room_name in enumerate(meta["rooms"]):
+        if room_name not in store:
+            continue
+        slot = store.index[room_name]
+        for name in store.columns:
+            if f"room_{name}" not in arrays:
+                continue  # a column added since the snapshot keeps its default
+            value = arrays[f"room_{name}"][i]
+            if name in APPLIANCE_COLUMNS.values() or name in OVERRIDE_COLUMNS:
+                value = codes[value]
+            store.columns[name][slot] = value
+        restored += 1
+
+    # 3. Readings and appliance states logged after the snapshot
+    for (room_name, sensor_type), value in latest.items():
+        if room_name in store and sensor_type in READING_COLUMNS:
+            store.columns[READING_COLUMNS[sensor_type]][store.index[room_name]] = value
+    for (room_name, appliance), (ts, is_on, state) in changes.items():
+        if (room_name in store and appliance in APPLIANCE_COLUMNS and state in STATE_CODES
+                and states[(room_name, appliance)][0] == ts):
+            store.columns[APPLIANCE_COLUMNS[appliance]][store.index[room_name]] = STATE_CODES[state]
+    store.touch()
+
+    with _latest_lock:
+        _latest[db.snapshot_path(db_path)] = (marks, states)
+    summary = {
+        "rooms": restored,
+        "age_seconds": round(time.time() - meta["created"], 1),
+        "replayed": {table: marks[table][0] - meta["marks"][table][0] for table in db.LOG_TABLES},
+    }
+    log.info("Restored snapshot: %s", summary)
+    return summary
+
+class SnapshotWorker:
+    """Background thread that writes a snapshot every interval seconds.
+
+    stop() (also run at exit) writes a last one, so a clean restart has
+    nothing to replay.
+    """
+    def __init__(self, store, interval=SNAPSHOT_INTERVAL, db_path=None):
+        self.store = store
+        self.interval = interval
+        self.db_path = db_path
+        self.errors = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="snapshot", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._snapshot()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._snapshot()
+
+    def _snapshot(self):
+        try:
+            write(self.store, self.db_path)
+        except (OSError, sqlite3.Error) as e:
+            self.errors += 1
+            log.error("Snapshot failed: %s", e)
+        finally:
+            db.release_connection()
@@ -0,0 +1,213 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+import metrics
+from control import (AC_ON_ABOVE, AC_POWER, EVALUATE_SECONDS, LIGHT_ON_BELOW, LIGHT_POWER,
+                     STATE_CODES, STATE_NAMES, state_code)
+from rules import RuleTable
+
+# Column name -> dtype; one array per column, one slot per room
+COLUMNS = {
+    'temp': np.float64,
+    'light_level': np.float64,
+    'occupied': np.bool_,
+    'ac_state': np.uint8,
+    'light_state': np.uint8,
+    'ac_override': np.uint8,  # 0 = no manual override
+    'light_override': np.uint8,
+}
+
+class RoomStateStore(Mapping):
+    """Columnar registry of room state, used like a dict of RoomControllers.
+
+    Every field lives in a NumPy column indexed by room slot, and
+    appliance states and overrides are stored as control.STATE_CODES.
+    store[room_id] returns a RoomView that reads and writes those columns
+    with the RoomController attribute names, so existing code keeps
+    working while the per-room cost drops to a few dozen bytes.
+
+    version goes up on every write, so callers can cache anything derived
+    from the store and rebuild it only when the version has moved.
+    """
+    def __init__(self, capacity=64):
+        self.names = []
+        self.index = {}
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.version = 0
+        self._rules = None
+
+    def add(self, room_name):
+        """Registers a room with RoomController's defaults and returns its view."""
+        if room_name in self.index:
+            return self[room_name]
+        slot = len(self.names)
+        if slot == len(self.columns['temp']):
+            for name, column in self.columns.items():
+                grown = np.zeros(2 * len(column), dtype=column.dtype)
+                grown[:slot] = column
+                self.columns[name] = grown
+        self.names.append(room_name)
+        self.index[room_name] = slot
+        cols = self.columns
+        cols['temp'][slot] = 25.0
+        cols['light_level'][slot] = 500
+        cols['occupied'][slot] = False
+        cols['ac_state'][slot] = STATE_CODES["OFF"]
+        cols['light_state'][slot] = STATE_CODES["OFF"]
+        cols['ac_override'][slot] = 0
+        cols['light_override'][slot] = 0
+        self._rules = None
+        self.version += 1
+        return RoomView(self, slot)
+
+    def column(self, name):
+        """The live part of a column (a view, so writes go to the store).
+
+        Call touch() after writing through it directly.
+        """
+        return self.columns[name][:len(self.names)]
+
+    def touch(self):
+        self.version += 1
+
+    def evaluate_all(self, rules=None, hour=None):
+        """Runs the automation rules for every room in one vectorized pass.
+
+        rules maps room name to rules.RoomRules, as for RuleTable. Stores
+        and returns the (ac_codes, light_codes) arrays.
+        """
+        if rules is not None or self._rules is None:
+            self._rules = RuleTable(self.names, rules)
+        ac, lights = self._rules.evaluate(
+            self.column('temp'), self.column('occupied'), self.column('light_level'), hour,
+            self.column('ac_override'), self.column('light_override'))
+        self.column('ac_state')[:] = ac
+        self.column('light_state')[:] = lights
+        self.version += 1
+        return ac, lights
+
+    def __getitem__(self, room_name):
+        return RoomView(self, self.index[room_name])
+
+    def __contains__(self, room_name):
+        return room_name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+def _light_value(value):
+    # Light levels are stored as floats; hand whole lux values back as ints
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+class RoomView:
+    """RoomController-compatible view of one slot in a RoomStateStore."""
+    __slots__ = ('store', 'slot')
+
+    def __init__(self, store, slot):
+        self.store = store
+        self.slot = slot
+
+    @property
+    def room_name(self):
+        return self.store.names[self.slot]
+
+    @property
+    def ac(self):
+        return ApplianceView(self.store, self.slot, 'ac_state', "AC", AC_POWER)
+
+    @property
+    def lights(self):
+        return ApplianceView(self.store, self.slot, 'light_state', "Light", LIGHT_POWER)
+
+    @property
+    def current_temp(self):
+        return float(self.store.columns['temp'][self.slot])
+
+    @current_temp.setter
+    def current_temp(self, value):
+        self._set('temp', value)
+
+    @property
+    def current_light_level(self):
+        return _light_value(self.store.columns['light_level'][self.slot])
+
+    @current_light_level.setter
+    def current_light_level(self, value):
+        self._set('light_level', value)
+
+    @property
+    def is_occupied(self):
+        return bool(self.store.columns['occupied'][self.slot])
+
+    @is_occupied.setter
+    def is_occupied(self, value):
+        self._set('occupied', value)
+
+    @property
+    def manual_ac_override(self):
+        return STATE_NAMES[self.store.columns['ac_override'][self.slot]]
+
+    @manual_ac_override.setter
+    def manual_ac_override(self, value):
+        self._set('ac_override', state_code(value))
+
+    @property
+    def manual_light_override(self):
+        return STATE_NAMES[self.store.columns['light_override'][self.slot]]
+
+    @manual_light_override.setter
+    def manual_light_override(self, value):
+        self._set('light_override', state_code(value))
+
+    def _set(self, column, value):
+        self.store.columns[column][self.slot] = value
+        self.store.version += 1
+
+    def update(self, temp, occupied, light_level):
+        """Called by RoomSensors (Subject) via Observer Pattern"""
+        cols, slot = self.store.columns, self.slot
+        cols['temp'][slot] = temp
+        cols['occupied'][slot] = occupied
+        cols['light_level'][slot] = light_level
+        self.store.version += 1
+
+    @metrics.timed(EVALUATE_SECONDS)
+    def evaluate_state(self):
+        """Same decisions as RoomController.evaluate_state, for this slot only."""
+        cols, slot = self.store.columns, self.slot
+        ac = cols['ac_override'][slot]
+        if not ac:
+            ac = STATE_CODES["COOLING"] if cols['temp'][slot] > AC_ON_ABOVE else STATE_CODES["OFF"]
+        light = cols['light_override'][slot]
+        if not light:
+            light = (STATE_CODES["ON"] if cols['occupied'][slot] and cols['light_level'][slot] < LIGHT_ON_BELOW
+                     else STATE_CODES["OFF"])
+        cols['ac_state'][slot] = ac
+        cols['light_state'][slot] = light
+        self.store.version += 1
+        return STATE_NAMES[ac], STATE_NAMES[light]
+
+class ApplianceView:
+    """Appliance-compatible view of one appliance state column entry."""
+    __slots__ = ('store', 'slot', 'column', 'name', 'power')
+
+    def __init__(self, store, slot, column, name, power):
+        self.store = store
+        self.slot = slot
+        self.column = column
+        self.name = name
+        self.power = power
+
+    @property
+    def state(self):
+        return STATE_NAMES[self.store.columns[self.column][self.slot]]
+
+    @state.setter
+    def state(self, value):
+        self.store.columns[self.column][self.slot] = state_code(value)
+        self.store.version += 1
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in src/ and import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import database as db
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """A new database file that calls without an explicit path use."""
+    previous = db.DB_PATH
+    path = str(tmp_path / "test.db")
+    db.set_db_path(path)
+    with db._last_state_lock:
+        db._last_state.clear()
+    db.init_db()
+    yield path
+    db.close_all_connections()
+    db.set_db_path(previous)
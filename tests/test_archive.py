@@ -0,0 +1,77 @@
+import pytest
+
+import database as db
+
+HOUR = db.HOUR_MS
+START = db.to_ms("2026-01-01 00:00:00")
+
+def archive_newest_id(temp_db):
+    """Logs AC rows whose newest id is back-dated, then archives it away."""
+    db.record_appliance_states([("Kitchen", "AC", "COOLING", 1, START),
+                                ("Kitchen", "AC", "OFF", 0, START + 2 * HOUR),
+                                ("Kitchen", "AC", "COOLING", 1, START + 3 * HOUR)])
+    db.record_appliance_state("Kitchen", "AC", "OFF", 0, START + HOUR)
+    moved = db.archive_before(START + 2 * HOUR + 1)
+    assert moved["appliance_log"] == 3
+    assert db.get_connection().execute("SELECT MAX(id) FROM appliance_log").fetchone()[0] == 3
+
+def without_autoincrement():
+    """Rebuilds the log tables as schema v2 created them."""
+    conn = db.get_connection()
+    with conn:
+        for table in ('sensor_log', 'appliance_log', 'energy_log'):
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (table,)).fetchone()[0]
+            conn.execute(f"ALTER TABLE {table} RENAME TO old_{table}")
+            conn.execute(sql.replace(" AUTOINCREMENT", ""))
+            conn.execute(f"INSERT INTO {table} SELECT * FROM old_{table}")
+            conn.execute(f"DROP TABLE old_{table}")
+        conn.execute("PRAGMA user_version = 2")
+
+def test_new_rows_after_archiving_are_folded(temp_db):
+    archive_newest_id(temp_db)
+    db.record_appliance_state("Kitchen", "AC", "OFF", 0, START + 4 * HOUR)
+    assert db.calculate_energy("Kitchen", "AC") == pytest.approx(db.recompute_energy("Kitchen", "AC")) == 3.0
+
+def test_migration_keeps_ids_above_the_archive_and_watermark(temp_db):
+    without_autoincrement()
+    archive_newest_id(temp_db)
+    db.close_all_connections()
+    assert db.migrate_schema() == 2
+    conn = db.get_connection()
+    assert conn.execute("SELECT MAX(id) FROM appliance_log").fetchone()[0] == 3
+    db.record_appliance_state("Kitchen", "AC", "OFF", 0, START + 4 * HOUR)
+    assert conn.execute("SELECT MAX(id) FROM appliance_log").fetchone()[0] == 5
+    assert db.calculate_energy("Kitchen", "AC") == pytest.approx(db.recompute_energy("Kitchen", "AC")) == 3.0
+    assert db.check_query_plans() == {}
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'sensor_log_rollup'").fetchone()
+
+def test_retention_prunes_archived_sensor_rows(temp_db):
+    now = START + 40 * db.DAY_MS
+    db.record_sensor_readings([("Kitchen", "Temperature", float(day), START + day * db.DAY_MS)
+                               for day in range(40)])
+    db.record_appliance_states([("Kitchen", "AC", "COOLING", 1, START),
+                                ("Kitchen", "AC", "OFF", 0, START + HOUR),
+                                ("Kitchen", "AC", "COOLING", 1, START + 35 * db.DAY_MS)])
+    db.archive_before(now - 7 * db.DAY_MS)
+    assert db.archive_stats()["sensor_rows"] == 33
+
+    result = db.apply_retention({'raw': 30, 'hour': None, 'day': None}, now=db.format_ts(now), pause=0)
+    assert result['raw'] == 10
+    assert db.archive_stats()["sensor_rows"] == 23
+    assert db.archive_stats()["appliance_rows"] == 2
+    history = db.get_connection().execute("SELECT COUNT(*) FROM sensor_log").fetchone()[0]
+    assert history == 7
+    assert db.calculate_energy("Kitchen", "AC") == pytest.approx(db.recompute_energy("Kitchen", "AC")) == 1.5
+
+    # Appliance rows outlive every reading
+    db.apply_retention({'raw': 0, 'hour': None, 'day': None}, now=db.format_ts(now), pause=0)
+    assert db.archive_stats()["sensor_rows"] == 0
+    assert db.archive_stats()["appliance_rows"] == 2
+
+def test_room_file_without_rows_left_is_removed(temp_db):
+    db.record_sensor_readings([("Kitchen", "Temperature", 20.0, START)])
+    db.archive_before(START + HOUR)
+    assert db.archive_stats()["files"] == 1
+    db.apply_retention({'raw': 1, 'hour': None, 'day': None}, now=db.format_ts(START + 2 * db.DAY_MS), pause=0)
+    assert db.archive_stats()["files"] == 0
+    assert db.get_sensor_history("Kitchen", "Temperature") == []
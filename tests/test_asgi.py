@@ -0,0 +1,122 @@
+import asyncio
+import json
+import sqlite3
+import time
+
+import pytest
+
+import app as flask_app
+import asgi
+import database as db
+
+def sensor_values(room_id):
+    return [row[0] for row in db.get_connection().execute(
+        "SELECT s.value FROM sensor_log s JOIN rooms r ON r.id = s.room_id WHERE r.name = ? ORDER BY s.id",
+        (room_id,))]
+
+async def call(method, path, payload=None, body=None):
+    """Sends one request through asgi.app; returns (status, parsed JSON body)."""
+    if body is None:
+        body = json.dumps(payload).encode() if payload is not None else b""
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"", "headers": []}
+    received = [{"type": "http.request", "body": body}]
+    sent = []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.app(scope, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+@pytest.fixture
+def writer(temp_db, monkeypatch):
+    # A fresh writer, without the startup() workers
+    monkeypatch.setattr(asgi, "writer", asgi.SerialWriter())
+    monkeypatch.setattr(asgi, "_started", True)
+    return asgi.writer
+
+def test_bad_row_fails_only_its_own_write(writer):
+    async def run():
+        writer.start()
+        bad = (["not", "a", "name"], "Temperature", 1.0)
+        results = await asyncio.gather(
+            writer.submit(writer.update, "Kitchen", "Temperature", 20.0),
+            writer.submit(writer.update, *bad),  # past log_sensor's checks
+            writer.submit(writer.update, "Kitchen", "Temperature", 21.0),
+            return_exceptions=True)
+        await writer.stop()
+        return results
+
+    first, bad, last = asyncio.run(run())
+    assert first is None and last is None
+    assert isinstance(bad, ValueError)
+    assert sensor_values("Kitchen") == [20.0, 21.0]
+
+@pytest.mark.parametrize("payload", [
+    {"room_id": "Kitchen", "type": "Temperature", "value": "hot"},
+    {"room_id": "Kitchen", "type": "Temperature", "value": None},
+    {"room_id": ["Kitchen"], "type": "Temperature", "value": 20.0},
+    {"room_id": "Kitchen", "type": "Temperature"},
+])
+def test_log_sensor_rejects_bad_readings(writer, payload):
+    async def run():
+        writer.start()
+        response = await call("POST", "/log/sensor", payload)
+        await writer.stop()
+        return response
+
+    status, body = asyncio.run(run())
+    assert status == 400
+    assert "error" in body
+    assert sensor_values("Kitchen") == []
+
+def test_errors_map_to_json(writer, monkeypatch):
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    def broken(*args):
+        raise RuntimeError("bug")
+
+    async def run():
+        writer.start()
+        responses = [await call("POST", "/log/sensor", body=b"{not json")]
+        responses.append(await call("POST", "/log/appliance",
+                                    {"room_id": "Kitchen", "appliance": 5, "state": "ON", "is_on": 1}))
+        monkeypatch.setattr(db, "record_appliance_state", locked)
+        responses.append(await call("POST", "/log/appliance",
+                                    {"room_id": "Kitchen", "appliance": "AC", "state": "ON", "is_on": 1}))
+        monkeypatch.setattr(db, "record_appliance_state", broken)
+        responses.append(await call("POST", "/log/appliance",
+                                    {"room_id": "Kitchen", "appliance": "AC", "state": "ON", "is_on": 1}))
+        await writer.stop()
+        return responses
+
+    statuses = [status for status, body in asyncio.run(run())]
+    assert statuses == [400, 400, 500, 500]
+
+def test_slow_energy_rebuild_does_not_stall_the_event_loop(writer, monkeypatch):
+    flask_app.response_cache.clear()
+
+    def slow_payload():
+        time.sleep(0.5)
+        return {"status": "success"}
+
+    monkeypatch.setattr(flask_app, "energy_payload", slow_payload)
+
+    async def run():
+        writer.start()
+        energy = asyncio.ensure_future(call("GET", "/api/energy"))
+        await asyncio.sleep(0.1)
+        start = time.perf_counter()
+        status, _ = await call("GET", "/api/status")
+        elapsed = time.perf_counter() - start
+        assert (await energy)[0] == 200
+        await writer.stop()
+        return status, elapsed
+
+    status, elapsed = asyncio.run(run())
+    assert status == 200
+    assert elapsed < 0.2
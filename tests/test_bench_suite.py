@@ -0,0 +1,27 @@
+import json
+
+import bench_suite
+
+def results(**points):
+    return {"meta": {}, "results": points}
+
+def test_compare_flags_slowdowns_in_either_direction(capsys):
+    baseline = results(a={"warm_ms": 10.0, "rows_per_sec": 1000.0, "rows": 5},
+                       b={"p99_ms": 1.0}, c={"cold_ms": 0})
+    current = results(a={"warm_ms": 13.0, "rows_per_sec": 700.0, "rows": 50},
+                      b={"p99_ms": 1.2}, c={"cold_ms": 5.0}, d={"cold_ms": 1.0})
+    assert bench_suite.compare(baseline, current, threshold=0.25) == [("a", "warm_ms"), ("a", "rows_per_sec")]
+    # Counts and points without a baseline are not compared
+    printed = capsys.readouterr().out
+    assert "rows " not in printed and "\nc " not in printed and "\nd " not in printed
+
+def test_quick_run_is_saved_as_json(temp_db, monkeypatch):
+    monkeypatch.setattr(bench_suite, "ENERGY_HISTORY", ((), (200,)))
+    monkeypatch.setattr(bench_suite, "SUMMARY_ROOMS", ((), (2,)))
+    monkeypatch.setattr(bench_suite, "SUMMARY_ROWS_PER_ROOM", 20)
+    run = bench_suite.run_suite(quick=True, repeat=1, only=["calculate_energy", "api_energy"])
+    assert set(run["results"]) == {"calculate_energy.rows=200", "api_energy.rooms=2"}
+    assert run["meta"]["quick"] and run["meta"]["repeat"] == 1
+    assert all(value >= 0 for values in run["results"].values() for value in values.values())
+    assert json.loads(json.dumps(run)) == run
+    assert bench_suite.compare(run, run) == []
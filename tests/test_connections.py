@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+
+import pytest
+
+import database as db
+
+def in_threads(fn, count=1):
+    """Runs fn on count threads at once; returns their results."""
+    results = [None] * count
+    started = threading.Barrier(count)
+
+    def run(i):
+        started.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_connections_are_tuned(temp_db):
+    conn = db.get_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert conn.execute("PRAGMA synchronous").fetchone() == (1,)  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone() == (db.PRAGMAS['busy_timeout'],)
+    assert conn.execute("PRAGMA auto_vacuum").fetchone() == (2,)  # INCREMENTAL
+
+def test_each_thread_reuses_its_own_connection(temp_db):
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+    assert in_threads(db.get_connection)[0] is not conn
+
+def test_released_connections_are_pooled(temp_db, monkeypatch):
+    monkeypatch.setattr(db, "POOL_SIZE", 1)
+    db.close_all_connections()
+    held = threading.Barrier(2)
+
+    def open_and_release():
+        conn = db.get_connection()
+        conn.execute("BEGIN")
+        held.wait()  # both threads hold a connection
+        db.release_connection()
+        return conn
+
+    conns = in_threads(open_and_release, 2)
+    # One is kept, its transaction rolled back; the other is closed
+    [idle] = db._pool[temp_db]
+    assert not idle.in_transaction
+    [closed] = [conn for conn in conns if conn is not idle]
+    with pytest.raises(sqlite3.ProgrammingError):
+        closed.execute("SELECT 1")
+    # The next thread gets the pooled one back
+    assert in_threads(db.get_connection)[0] is idle
+
+def test_using_db_routes_one_thread(temp_db, tmp_path):
+    other = str(tmp_path / "other.db")
+    db.init_db(other)
+    with db.using_db(other):
+        db.record_sensor_readings([("Kitchen", "Temperature", 20.0, db._now_ms())])
+        assert in_threads(db.current_db_path)[0] == temp_db
+        assert len(db.get_sensor_history("Kitchen", "Temperature")) == 1
+    assert db.get_sensor_history("Kitchen", "Temperature") == []
+
+def test_concurrent_writers_do_not_lock_each_other_out(temp_db):
+    def write():
+        for i in range(50):
+            db.DataLogger().update("Kitchen", "Temperature", float(i))
+        db.release_connection()
+
+    in_threads(write, 4)
+    assert db.get_connection().execute("SELECT COUNT(*) FROM sensor_log").fetchone() == (200,)
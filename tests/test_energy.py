@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+import database as db
+
+HOUR = db.HOUR_MS
+START = db.to_ms("2026-01-01 00:00:00")
+
+def energy_tables(room_id, appliance):
+    """(kWh in energy_rollup, kWh in energy_log) of one appliance."""
+    conn = db.get_connection()
+    key = (db.name_to_id(conn, 'room', room_id, create=False), db.name_to_id(conn, 'appliance', appliance, create=False))
+    rollup = conn.execute("SELECT COALESCE(SUM(kwh), 0) FROM energy_rollup WHERE room_id = ? AND appliance_id = ?",
+                          key).fetchone()[0]
+    logged = conn.execute("SELECT COALESCE(SUM(kwh), 0) FROM energy_log WHERE room_id = ? AND appliance_id = ?",
+                          key).fetchone()[0]
+    return rollup, logged
+
+def test_back_dated_off_after_current_on(temp_db):
+    db.record_appliance_state("Kitchen", "AC", "COOLING", 1, START + 10 * HOUR)
+    assert db.calculate_energy("Kitchen", "AC") == 0
+    # An OFF from before the ON arrives late: the ON is still open
+    db.record_appliance_state("Kitchen", "AC", "OFF", 0, START)
+    assert db.calculate_energy("Kitchen", "AC") == pytest.approx(db.recompute_energy("Kitchen", "AC")) == 0
+    db.record_appliance_state("Kitchen", "AC", "OFF", 0, START + 12 * HOUR)
+    assert db.calculate_energy("Kitchen", "AC") == pytest.approx(db.recompute_energy("Kitchen", "AC")) == 3.0
+
+def test_back_dated_row_splits_a_folded_interval(temp_db):
+    db.record_appliance_states([("Kitchen", "AC", "COOLING", 1, START),
+                                ("Kitchen", "AC", "OFF", 0, START + 4 * HOUR)])
+    assert db.calculate_energy("Kitchen", "AC") == pytest.approx(6.0)
+    db.record_appliance_state("Kitchen", "AC", "OFF", 0, START + HOUR)
+    assert db.calculate_energy("Kitchen", "AC") == pytest.approx(db.recompute_energy("Kitchen", "AC")) == 1.5
+    rollup, logged = energy_tables("Kitchen", "AC")
+    assert rollup == pytest.approx(1.5)
+    assert logged == pytest.approx(1.5)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_shuffled_batches_match_recompute(temp_db, seed):
+    rng = random.Random(seed)
+    rows = []
+    for room_id in ("Kitchen", "Office"):
+        for appliance in ("AC", "Light"):
+            ts = START
+            for _ in range(60):
+                ts += rng.choice([0, 1, 2, 5]) * 15 * 60_000  # includes equal timestamps
+                is_on = rng.random() < 0.5
+                rows.append((room_id, appliance, "ON" if is_on else "OFF", is_on, ts))
+    rng.shuffle(rows)
+    for i in range(0, len(rows), 25):
+        db.record_appliance_states(rows[i:i + 25])
+        if rng.random() < 0.5:
+            db.update_energy_checkpoints()
+    for room_id in ("Kitchen", "Office"):
+        for appliance in ("AC", "Light"):
+            expected = db.recompute_energy(room_id, appliance)
+            assert db.calculate_energy(room_id, appliance) == pytest.approx(expected)
+            rollup, logged = energy_tables(room_id, appliance)
+            assert rollup == pytest.approx(expected)
+            assert logged == pytest.approx(expected)
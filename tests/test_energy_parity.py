@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+import database as db
+import energy_engine
+from bench_energy import generate_transitions
+
+START = db.to_ms("2026-01-01 00:00:00")
+KEYS = [(room_id, appliance) for room_id in ("Kitchen", "Office", "Garage") for appliance in ("AC", "Light")]
+
+def out_of_order_rows(seed, per_key=80):
+    """Rows with repeated states, equal timestamps and a shuffled insert order."""
+    rng = random.Random(seed)
+    rows = []
+    for room_id, appliance in KEYS:
+        ts = START
+        for _ in range(per_key):
+            ts += rng.choice([0, 0, 1, 3, 10]) * 60_000
+            is_on = rng.random() < 0.5
+            rows.append((room_id, appliance, "ON" if is_on else "OFF", is_on, ts))
+    rng.shuffle(rows)
+    return rows
+
+def assert_paths_agree(keys=KEYS):
+    bulk = energy_engine.calculate_energy_bulk()
+    assert set(bulk) == set(keys)
+    for room_id, appliance in keys:
+        expected = db.recompute_energy(room_id, appliance)
+        assert bulk[(room_id, appliance)] == pytest.approx(expected)
+        assert db.calculate_energy(room_id, appliance) == pytest.approx(expected)
+
+def test_in_order_rows(temp_db):
+    rows = generate_transitions(3000, 3)
+    db.record_appliance_states(rows)
+    assert_paths_agree({(room_id, appliance) for room_id, appliance, *_ in rows})
+
+@pytest.mark.parametrize("seed", range(3))
+def test_back_dated_and_duplicate_rows(temp_db, seed):
+    rows = out_of_order_rows(seed)
+    rng = random.Random(seed)
+    for i in range(0, len(rows), 40):
+        db.record_appliance_states(rows[i:i + 40])
+        if rng.random() < 0.5:
+            # Fold part-way so later batches land behind the checkpoints
+            db.update_energy_checkpoints()
+    assert_paths_agree()
+
+def test_rows_one_at_a_time_with_reports_between(temp_db):
+    for row in out_of_order_rows(7, per_key=30):
+        db.record_appliance_state(*row)
+        db.calculate_energy(row[0], row[1])
+    assert_paths_agree()
+
+def test_back_dated_rows_into_the_archive(temp_db):
+    rows = out_of_order_rows(11)
+    db.record_appliance_states(rows[:300])
+    db.archive_before(db.EPOCH.replace(year=2030))
+    db.record_appliance_states(rows[300:])
+    assert_paths_agree()
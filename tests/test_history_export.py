@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+
+import pytest
+
+import app as flask_app
+import database as db
+
+HOUR = db.HOUR_MS
+START = db.to_ms("2026-01-01 00:00:00")
+
+@pytest.fixture
+def client(temp_db):
+    return flask_app.app.test_client()
+
+def log_readings(count, ts=lambda i: START + i * HOUR):
+    db.record_sensor_readings([("Kitchen", "Temperature", float(i), ts(i)) for i in range(count)])
+
+def pages(client, limit):
+    """Every value the paged endpoint returns, logging a newer reading between pages."""
+    url = f"/api/history/Kitchen/Temperature?limit={limit}"
+    values, cursor = [], None
+    while True:
+        body = client.get(url + (f"&cursor={cursor}" if cursor else "")).get_json()
+        values += [row["value"] for row in body["data"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return values
+        # Newer than every cursor, so it must not shift the pages
+        db.record_sensor_readings([("Kitchen", "Temperature", -1.0, START + 1000 * HOUR)])
+
+def test_pages_cover_every_row_once(client):
+    # Three readings share each timestamp, so the id breaks the ties
+    log_readings(25, ts=lambda i: START + (i // 3) * HOUR)
+    db.archive_before(START + 4 * HOUR)
+    values = pages(client, 4)
+    assert values == [float(i) for i in reversed(range(25))]
+
+def test_bad_cursor_is_rejected(client):
+    log_readings(3)
+    assert client.get("/api/history/Kitchen/Temperature?cursor=not-a-cursor").status_code == 400
+
+def test_export_ndjson_and_csv(client, monkeypatch):
+    monkeypatch.setattr(flask_app, "EXPORT_CHUNK_ROWS", 3)
+    log_readings(10)
+    db.archive_before(START + 4 * HOUR)
+    url = "/api/history/Kitchen/Temperature/export?start=2026-01-01T02:00:00&end=2026-01-01T08:00:00"
+
+    response = client.get(url)
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers["Content-Disposition"] == 'attachment; filename="Kitchen_Temperature.ndjson"'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["value"] for row in rows] == [2.0, 3.0, 4.0, 5.0, 6.0, 7.0]
+    assert rows[0] == {"id": rows[0]["id"], "room_id": "Kitchen", "sensor_type": "Temperature",
+                       "value": 2.0, "timestamp": db.format_ts(START + 2 * HOUR)}
+
+    response = client.get(url + "&format=csv")
+    assert response.mimetype == "text/csv"
+    table = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert table[0] == flask_app.EXPORT_COLUMNS
+    assert [float(row[3]) for row in table[1:]] == [2.0, 3.0, 4.0, 5.0, 6.0, 7.0]
+
+def test_empty_and_bad_exports(client):
+    response = client.get("/api/history/Kitchen/Temperature/export?format=csv")
+    assert response.get_data(as_text=True).splitlines() == [",".join(flask_app.EXPORT_COLUMNS)]
+    assert client.get("/api/history/Kitchen/Temperature/export?format=xml").status_code == 400
+    assert client.get("/api/history/Kitchen/Temperature/export?start=yesterday").status_code == 400
+
+def test_iter_sensor_log_reads_in_batches(temp_db):
+    log_readings(10)
+    rows = db.iter_sensor_log("Kitchen", "Temperature", db.format_ts(START), db.format_ts(START + 10 * HOUR),
+                              batch_size=3)
+    first = next(rows)
+    assert first[1:4] == ("Kitchen", "Temperature", 0.0)
+    # Rows written after the export began are not part of its snapshot
+    log_readings(1, ts=lambda i: START + 5 * HOUR + 1)
+    assert [row[3] for row in rows] == [float(i) for i in range(1, 10)]
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+import database as db
+
+def sensor_rows(room_id):
+    return db.get_connection().execute(
+        "SELECT COUNT(*) FROM sensor_log s JOIN rooms r ON r.id = s.room_id WHERE r.name = ?",
+        (room_id,)).fetchone()[0]
+
+@pytest.mark.parametrize("value", ["24.5", None, [1], {"a": 1}, float("nan")])
+def test_non_numeric_values_are_rejected_before_buffering(temp_db, value):
+    logger = db.BufferedDataLogger()
+    with pytest.raises(ValueError):
+        logger.update("Kitchen", "Temperature", value)
+    with pytest.raises(ValueError):
+        db.DataLogger().update("Kitchen", "Temperature", value)
+    logger.close()
+    assert sensor_rows("Kitchen") == 0
+
+def test_one_bad_row_does_not_lose_the_batch(temp_db):
+    logger = db.BufferedDataLogger(max_rows=1000, max_delay=60)
+    for i in range(5):
+        logger.update("Kitchen", "Temperature", 20.0 + i)
+    # Rows that cannot be written, as if they had got past validation
+    logger._buffer.append((["not", "a", "name"], "Temperature", 1.0, db._now_ms()))
+    logger._buffer.append(("Kitchen", "Temperature", [1], db._now_ms()))
+    for i in range(5):
+        logger.update("Kitchen", "Temperature", 25.0 + i)
+    logger.flush()
+    assert sensor_rows("Kitchen") == 10
+    assert logger.dropped == 2
+    assert logger._buffer == []
+    logger.close()
+
+def test_periodic_flush_survives_a_failed_flush(temp_db):
+    logger = db.BufferedDataLogger(max_rows=1000, max_delay=0.05)
+    logger._buffer.append((["bad"], "Temperature", 1.0, db._now_ms()))
+    time.sleep(0.2)
+    logger.update("Kitchen", "Temperature", 21.0)
+    deadline = time.monotonic() + 5
+    while sensor_rows("Kitchen") == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert sensor_rows("Kitchen") == 1
+    assert logger._flusher.is_alive()
+    logger.close()
+
+def test_log_sensor_endpoint_rejects_bad_values(temp_db, monkeypatch):
+    import api
+    monkeypatch.setattr(api, "logger", db.BufferedDataLogger())
+    client = api.app.test_client()
+    assert client.post("/log/sensor", json={"room_id": "Kitchen", "type": "Temperature", "value": [1]}).status_code == 400
+    assert client.post("/log/sensor", json={"room_id": "Kitchen", "type": "Temperature"}).status_code == 400
+    assert client.post("/log/sensor", json={"room_id": "Kitchen", "type": "Temperature", "value": 22}).status_code == 201
+    api.logger.close()
+    assert sensor_rows("Kitchen") == 1
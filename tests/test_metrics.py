@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+
+import app as flask_app
+import database as db
+import metrics
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry, so the test's metrics are the only ones rendered."""
+    monkeypatch.setattr(metrics, "_registry", {})
+    monkeypatch.setattr(metrics, "ENABLED", True)
+
+def test_histogram_renders_cumulative_buckets(registry):
+    latency = metrics.histogram("test_seconds", "Test latency", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, ('/a"b',))
+    calls = metrics.counter("test_total", "Test calls")
+    calls.inc()
+    calls.inc(2)
+    assert metrics.render().splitlines() == [
+        "# HELP test_seconds Test latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+        'test_seconds_bucket{route="/a\\"b",le="1.0"} 3',
+        'test_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        'test_seconds_sum{route="/a\\"b"} 4.05',
+        'test_seconds_count{route="/a\\"b"} 4',
+        "# HELP test_total Test calls",
+        "# TYPE test_total counter",
+        "test_total 3",
+    ]
+    assert metrics.counter("test_total", "Registered twice") is calls
+
+def test_disabled_metrics_record_nothing(registry):
+    latency = metrics.histogram("test_seconds", "Test latency")
+
+    def work():
+        return 42
+
+    timed = metrics.timed(latency)(work)
+    metrics.disable()
+    assert timed() == 42
+    assert latency.samples() == []
+    # Decorated while disabled, the function is left as it is
+    assert metrics.timed(latency)(work) is work
+    metrics.enable()
+    timed()
+    assert latency.samples()[-1] == ("test_seconds_count", (), 1)
+
+def test_metrics_endpoint_reports_routes_and_database_calls(temp_db):
+    metrics.reset()
+    client = flask_app.app.test_client()
+    assert client.get("/api/history/Kitchen/Temperature").status_code == 200
+    response = client.get("/api/metrics")
+    assert response.content_type == metrics.CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert ('shems_http_requests_total{method="GET",route="/api/history/<room_id>/<sensor_type>",status="200"} 1'
+            in text.splitlines())
+    assert 'shems_db_call_seconds_count{function="get_sensor_history_page"} 1' in text.splitlines()
+
+def test_readings_are_logged_at_debug_instead_of_printed(temp_db, caplog, capsys):
+    with caplog.at_level(logging.DEBUG, logger="database"):
+        db.DataLogger().update("Kitchen", "Temperature", 21.5)
+    assert capsys.readouterr().out == ""
+    assert [record.getMessage() for record in caplog.records] == ["Recorded Temperature in Kitchen: 21.5"]
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="database"):
+        db.DataLogger().update("Kitchen", "Temperature", 22.0)
+    assert caplog.records == []
@@ -0,0 +1,23 @@
+import sqlite3
+
+import database as db
+import migrate_db
+
+def test_backup_includes_rows_still_in_the_wal(temp_db):
+    db.record_sensor_readings([("Kitchen", "Temperature", 20.0, 0)])
+    db.close_all_connections()
+    # An older schema whose newest rows have not been checkpointed yet
+    conn = sqlite3.connect(temp_db)
+    conn.execute("PRAGMA wal_autocheckpoint = 0")
+    with conn:
+        conn.execute("PRAGMA user_version = 2")
+        conn.execute("INSERT INTO sensor_log (room_id, sensor_type_id, value, ts_ms) VALUES (1, 1, 21.0, 1)")
+
+    migrate_db.migrate(temp_db)
+    conn.close()
+
+    backup = sqlite3.connect(f"{temp_db}.v2.bak")
+    assert backup.execute("SELECT value FROM sensor_log ORDER BY id").fetchall() == [(20.0,), (21.0,)]
+    assert backup.execute("PRAGMA user_version").fetchone()[0] == 2
+    backup.close()
+    assert db.get_connection().execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
@@ -0,0 +1,43 @@
+import pytest
+
+import database as db
+
+def history(room_id):
+    return db.get_connection().execute(
+        "SELECT s.value FROM sensor_log s JOIN rooms r ON r.id = s.room_id WHERE r.name = ? ORDER BY s.id",
+        (room_id,)).fetchall()
+
+def test_rolled_back_name_is_not_cached(temp_db):
+    conn = db.get_connection()
+    kitchen = db.name_to_id(conn, 'room', "Kitchen")
+    conn.rollback()
+    # The rolled-back id is free again and goes to the next new name
+    db.record_sensor_readings([("Garage", "Temperature", 10.0, db._now_ms())])
+    db.record_sensor_readings([("Kitchen", "Temperature", 20.0, db._now_ms())])
+    garage = db.name_to_id(conn, 'room', "Garage", create=False)
+    assert garage == kitchen
+    assert db.name_to_id(conn, 'room', "Kitchen", create=False) != garage
+    assert history("Garage") == [(10.0,)]
+    assert history("Kitchen") == [(20.0,)]
+
+def test_id_names_skips_uncommitted_names(temp_db):
+    conn = db.get_connection()
+    db.name_to_id(conn, 'room', "Kitchen")
+    assert db.id_names(conn, 'room') == {1: "Kitchen"}
+    conn.rollback()
+    db.record_sensor_readings([("Garage", "Temperature", 10.0, db._now_ms())])
+    assert db.id_names(conn, 'room') == {1: "Garage"}
+
+@pytest.mark.parametrize("room_id", [None, 1, ["Kitchen"]])
+def test_bad_names_are_rejected_before_any_insert(temp_db, room_id):
+    with pytest.raises(ValueError):
+        db.DataLogger().update(room_id, "Temperature", 20.0)
+    with pytest.raises(ValueError):
+        db.record_appliance_state("Kitchen", room_id, "ON", 1)
+    with pytest.raises(ValueError):
+        db.record_sensor_readings([("Kitchen", "Temperature", 20.0, db._now_ms()),
+                                   (room_id, "Temperature", 20.0, db._now_ms())])
+    conn = db.get_connection()
+    assert not conn.in_transaction
+    assert db.id_names(conn, 'room') == {}
+    assert db.id_names(conn, 'appliance') == {}
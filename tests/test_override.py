@@ -0,0 +1,50 @@
+import pytest
+
+import app as flask_app
+import control
+import database as db
+
+@pytest.fixture
+def client(temp_db):
+    if "Override Room" not in flask_app.rooms:
+        flask_app.add_room("Override Room", db.DataLogger(), queued=False)
+    return flask_app.app.test_client()
+
+def override(client, appliance, state, room_id="Override Room"):
+    return client.post("/api/override", json={"room_id": room_id, "appliance": appliance, "state": state})
+
+def test_allowed_states_set_and_clear(client):
+    assert override(client, "AC", "OFF").status_code == 200
+    assert override(client, "light", "ON").status_code == 200
+    room = flask_app.rooms["Override Room"]
+    assert (room.manual_ac_override, room.manual_light_override) == ("OFF", "ON")
+    assert room.evaluate_state() == ("OFF", "ON")
+    assert override(client, "AC", None).status_code == 200
+    assert override(client, "light", "").status_code == 200
+    assert (room.manual_ac_override, room.manual_light_override) == (None, None)
+
+@pytest.mark.parametrize("state", ["FAN", "on", 5, 1.5, ["ON"], {"state": "ON"}, True])
+def test_other_states_are_rejected(client, state):
+    response = override(client, "AC", state)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+    assert flask_app.rooms["Override Room"].manual_ac_override is None
+
+def test_request_input_never_grows_the_state_registry(client):
+    names = list(control.STATE_NAMES)
+    for i in range(300):
+        assert override(client, "light", f"MODE-{i}").status_code == 400
+    assert control.STATE_NAMES == names
+    assert override(client, "light", "OFF").status_code == 200
+
+@pytest.mark.parametrize("room_id, appliance", [(None, "ac"), (["Override Room"], "ac"), ("Override Room", 3),
+                                                ("Override Room", "fan"), ("Nowhere", "ac")])
+def test_bad_room_or_appliance(client, room_id, appliance):
+    assert override(client, appliance, "OFF", room_id).status_code == 400
+
+def test_unknown_state_names_raise_value_error():
+    with pytest.raises(ValueError):
+        control.state_code("FAN")
+    with pytest.raises(ValueError):
+        control.state_code(["ON"])
+    assert control.state_code(None) == 0
@@ -0,0 +1,16 @@
+import database as db
+
+def test_hot_queries_use_their_covering_indexes(temp_db):
+    assert db.check_query_plans() == {}
+
+def test_hot_queries_stay_index_only_with_data(temp_db):
+    db.record_sensor_readings([("Kitchen", "Temperature", 20.0 + i, i * 60_000) for i in range(500)])
+    db.record_appliance_states([("Kitchen", "AC", "ON", i % 2, i * 60_000) for i in range(500)])
+    db.get_connection().execute("ANALYZE")
+    assert db.check_query_plans() == {}
+
+def test_missing_index_is_reported(temp_db):
+    conn = db.get_connection()
+    conn.execute("DROP INDEX idx_sensor_log_room_type_ts")
+    conn.commit()
+    assert set(db.check_query_plans()) == {"sensor_history", "sensor_history_page", "sensor_export"}
@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+def slow(body, started, release):
+    def build():
+        started.set()
+        release.wait(5)
+        return body
+    return build
+
+def test_slow_build_blocks_neither_lookups_nor_other_keys():
+    cache = ResponseCache()
+    cache.get("status", 1, lambda: b"status")
+    started, release = threading.Event(), threading.Event()
+    builder = threading.Thread(target=cache.get, args=("energy", 1, slow(b"energy", started, release)))
+    builder.start()
+    assert started.wait(5)
+    start = time.perf_counter()
+    assert cache.lookup("status", 1)[0] == b"status"
+    assert cache.get("status", 2, lambda: b"status 2")[0] == b"status 2"
+    assert cache.lookup("energy", 1) is None
+    assert time.perf_counter() - start < 0.5
+    release.set()
+    builder.join()
+    assert cache.lookup("energy", 1)[0] == b"energy"
+
+def test_concurrent_gets_of_one_version_build_once():
+    cache = ResponseCache()
+    started, release = threading.Event(), threading.Event()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return slow(b"energy", started, release)()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("energy", 1, build)[0]))
+               for _ in range(5)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [b"energy"] * 5
+    assert len(builds) == 1
+
+def test_failed_build_is_not_cached():
+    cache = ResponseCache()
+
+    def broken():
+        raise RuntimeError("database is locked")
+
+    with pytest.raises(RuntimeError):
+        cache.get("energy", 1, broken)
+    assert cache.get("energy", 1, lambda: b"energy")[0] == b"energy"
@@ -0,0 +1,82 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+import database as db
+
+HOUR = db.HOUR_MS
+START = db.to_ms("2026-01-01 00:00:00")
+NOW = datetime(2026, 1, 11, 3, 0)
+
+def count(table):
+    return db.get_connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_raw_rows_go_in_batches(temp_db, monkeypatch):
+    # Two readings per hour over ten days; the first five days are past retention
+    db.record_sensor_readings([("Kitchen", "Temperature", float(i), START + i * HOUR // 2)
+                               for i in range(480)])
+    hourly = count("sensor_rollup")
+    pauses = []
+    monkeypatch.setattr(db.time, "sleep", pauses.append)
+
+    result = db.apply_retention({'raw': 5, 'hour': None, 'day': None}, now=NOW, batch_size=25,
+                                pause=0.5, vacuum=False)
+    # Cut at NOW - 5 days = Jan 6 03:00
+    assert result == {'raw': 246, 'hour': 0, 'day': 0, 'bytes_reclaimed': 0}
+    assert count("sensor_log") == 480 - 246
+    # A pause after every full batch; the two readings of an hour never straddle one
+    assert pauses == [0.5] * (246 // 26)
+    assert count("sensor_rollup") == hourly
+
+def test_rollup_tiers_keep_buckets_that_end_after_the_cutoff(temp_db):
+    db.record_sensor_readings([("Kitchen", "Temperature", float(i), START + i * HOUR) for i in range(240)])
+    result = db.apply_retention({'raw': 0, 'hour': 5, 'day': 8}, now=NOW, batch_size=7, pause=0)
+    assert result['raw'] == 240
+    # Hours before Jan 6 03:00, days ending before Jan 3 03:00
+    assert result['hour'] == 5 * 24 + 3
+    assert result['day'] == 2
+    stats = db.get_db_stats()
+    assert stats["tiers"] == {"raw": 0, "hour": 240 - 123, "day": 8}
+    assert stats["retention"]["rows_deleted"]["hour"] >= 123
+
+@pytest.mark.parametrize("window, hour, due", [
+    ((2, 5), 1, False), ((2, 5), 2, True), ((2, 5), 4, True), ((2, 5), 5, False),
+    ((23, 2), 23, True), ((23, 2), 0, True), ((23, 2), 1, True), ((23, 2), 2, False),
+])
+def test_window_hours(window, hour, due):
+    assert db.RetentionWorker(window).due(datetime(2026, 1, 10, hour, 30)) is due
+
+def test_one_run_per_window_across_midnight():
+    worker = db.RetentionWorker((23, 2))
+    worker._last_window = datetime(2026, 1, 10).date()
+    assert not worker.due(datetime(2026, 1, 11, 1, 0))  # the window that opened on Jan 10
+    assert worker.due(datetime(2026, 1, 11, 23, 0))
+
+def test_worker_archives_then_prunes_once(temp_db, monkeypatch):
+    class Clock(datetime):
+        @classmethod
+        def now(cls):
+            return NOW
+
+    db.record_sensor_readings([("Kitchen", "Temperature", float(i), START + i * HOUR) for i in range(240)])
+    monkeypatch.setattr(db, "datetime", Clock)
+    monkeypatch.setattr(db, "ARCHIVE_AFTER_DAYS", 2)
+    passes = []
+    ran = threading.Event()
+    real_apply = db.apply_retention
+
+    def apply_retention(**options):
+        passes.append(real_apply(**options))
+        ran.set()
+
+    monkeypatch.setattr(db, "apply_retention", apply_retention)
+    worker = db.RetentionWorker((3, 4), check_interval=0.01, db_path=temp_db,
+                                retention_days={'raw': 5, 'hour': None, 'day': None}, pause=0).start()
+    assert ran.wait(5)
+    worker.stop()
+    assert len(passes) == 1
+    # Everything before Jan 9 was archived, and the archive pruned before Jan 6 03:00
+    assert passes[0]['raw'] == 5 * 24 + 3
+    assert count("sensor_log") == 240 - 8 * 24
+    assert db.archive_stats()["sensor_rows"] == 8 * 24 - 123
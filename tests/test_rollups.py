@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as flask_app
+import database as db
+
+HOUR = db.HOUR_MS
+START = db.to_ms("2026-01-01 00:00:00")
+
+def rollup_rows():
+    return db.get_connection().execute(
+        "SELECT * FROM sensor_rollup ORDER BY room_id, sensor_type_id, resolution, bucket_ms").fetchall()
+
+@pytest.fixture
+def client(temp_db):
+    return flask_app.app.test_client()
+
+def test_trigger_matches_a_rebuild(temp_db):
+    # Out of order, two rooms, and one row written with plain SQL
+    db.record_sensor_readings([("Kitchen", "Temperature", float(i % 5), START + (i * 7 % 50) * HOUR // 2)
+                               for i in range(50)])
+    db.record_sensor_readings([("Garage", "Humidity", 40.0, START + 25 * HOUR)])
+    conn = db.get_connection()
+    with conn:
+        conn.execute("INSERT INTO sensor_log (room_id, sensor_type_id, value, ts_ms) VALUES (1, 1, 9.5, ?)",
+                     (START + 3 * HOUR,))
+    live = rollup_rows()
+    with conn:
+        db.rebuild_sensor_rollups(conn.cursor())
+    assert live == rollup_rows()
+    assert len({row[2] for row in live}) == 2  # hour and day buckets
+
+def test_sensor_range_buckets(client):
+    db.record_sensor_readings([("Kitchen", "Temperature", value, START + minutes * 60_000)
+                               for value, minutes in ((20.0, 0), (22.0, 30), (30.0, 60), (10.0, 25 * 60))])
+    url = "/api/history/Kitchen/Temperature/range?start=2026-01-01T00:00:00&end=2026-01-03T00:00:00"
+
+    hours = client.get(url + "&resolution=hour").get_json()
+    assert hours["resolution"] == "hour"
+    assert hours["data"] == [
+        {"bucket": "2026-01-01 00:00:00", "count": 2, "avg": 21.0, "min": 20.0, "max": 22.0},
+        {"bucket": "2026-01-01 01:00:00", "count": 1, "avg": 30.0, "min": 30.0, "max": 30.0},
+        {"bucket": "2026-01-02 01:00:00", "count": 1, "avg": 10.0, "min": 10.0, "max": 10.0},
+    ]
+    days = client.get(url + "&resolution=day").get_json()["data"]
+    assert [(row["bucket"], row["count"], row["min"], row["max"]) for row in days] == [
+        ("2026-01-01 00:00:00", 3, 20.0, 30.0), ("2026-01-02 00:00:00", 1, 10.0, 10.0)]
+    raw = client.get(url + "&resolution=raw").get_json()["data"]
+    assert [row["value"] for row in raw] == [20.0, 22.0, 30.0, 10.0]
+    assert client.get(url + "&resolution=week").status_code == 400
+
+def test_auto_resolution_follows_span_and_retention():
+    now = datetime(2026, 1, 10)
+    assert db.choose_resolution(now - timedelta(hours=2), now, now) == 'raw'
+    assert db.choose_resolution(now - timedelta(days=2), now, now) == 'hour'
+    assert db.choose_resolution(now - timedelta(days=30), now, now) == 'day'
+    # Raw rows that old are pruned, so the hour rollup answers instead
+    old = now - timedelta(days=60)
+    assert db.choose_resolution(old, old + timedelta(hours=2), now) == 'hour'
+
+def test_energy_range_splits_runs_at_hour_boundaries(client):
+    db.record_appliance_states([("Kitchen", "AC", "COOLING", 1, START + HOUR // 2),
+                                ("Kitchen", "AC", "OFF", 0, START + 3 * HOUR // 2)])
+    url = "/api/energy/Kitchen/AC/range?start=2026-01-01T00:00:00&end=2026-01-02T00:00:00"
+    hours = client.get(url).get_json()["data"]
+    assert [row["bucket"] for row in hours] == ["2026-01-01 00:00:00", "2026-01-01 01:00:00"]
+    assert [row["kwh"] for row in hours] == pytest.approx([0.75, 0.75])
+    days = client.get(url + "&resolution=day").get_json()["data"]
+    assert [row["kwh"] for row in days] == pytest.approx([1.5])
+    assert sum(row["kwh"] for row in hours) == pytest.approx(db.calculate_energy("Kitchen", "AC"))
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from control import STATE_CODES
+from rules import RoomRules, RuleTable
+
+OFF, COOLING, ON = STATE_CODES["OFF"], STATE_CODES["COOLING"], STATE_CODES["ON"]
+
+def evaluate(table, hour):
+    # Hot, occupied and dark: both appliances would switch on
+    return table.evaluate(np.array([30.0]), np.array([True]), np.array([10.0]), hour)
+
+def test_hour_24_is_midnight():
+    table = RuleTable(["Office"], {"Office": RoomRules(ac_hours=[0], light_hours=range(1, 24))})
+    ac, lights = evaluate(table, 24)
+    assert ac.tolist() == evaluate(table, 0)[0].tolist() == [COOLING]
+    assert lights.tolist() == evaluate(table, 0)[1].tolist() == [OFF]
+
+def test_default_rules_match_every_simulated_hour():
+    table = RuleTable(["Office"])
+    for hour in range(1, 25):
+        ac, lights = evaluate(table, hour)
+        assert (ac.tolist(), lights.tolist()) == ([COOLING], [ON]), hour
+
+def test_large_hours_wrap_instead_of_overflowing():
+    table = RuleTable(["Office"], {"Office": RoomRules(ac_hours=[8])})
+    assert evaluate(table, 32)[0].tolist() == [COOLING]
+    assert evaluate(table, 33)[0].tolist() == [OFF]
+
+@pytest.mark.parametrize("hour", [24, -1, 32])
+def test_schedule_hours_outside_the_day_are_rejected(hour):
+    with pytest.raises(ValueError):
+        RuleTable(["Office"], {"Office": RoomRules(ac_hours=[hour])})
@@ -0,0 +1,87 @@
+import logging
+
+import numpy as np
+
+import sensors
+
+class Failing:
+    def __init__(self):
+        self.seen = []
+
+    def update(self, *args):
+        self.seen.append(args)
+        if args[0] < 0:
+            raise RuntimeError("sink down")
+
+def test_queued_observer_logs_and_counts_failures(caplog):
+    sink = Failing()
+    queued = sensors.QueuedObserver(sink, name="sink")
+    with caplog.at_level(logging.ERROR, logger="sensors"):
+        for temp in (20.0, -1.0, 21.0):
+            queued.update(temp, True, 300)
+        assert queued.flush(timeout=5)
+    queued.close()
+    assert [args[0] for args in sink.seen] == [20.0, -1.0, 21.0]
+    assert queued.metrics()["errors"] == 1
+    assert queued.metrics()["processed"] == 3
+    [record] = caplog.records
+    assert "sink" in record.getMessage() and record.exc_info[0] is RuntimeError
+
+class Recorder:
+    def __init__(self):
+        self.readings = []
+
+    def update(self, temp, occupied, light_level):
+        self.readings.append((temp, occupied, light_level))
+
+def test_batch_room_observers_get_their_room_only():
+    batch = sensors.BatchRoomSensors(["Kitchen", "Garage"], seed=1)
+    kitchen = Recorder()
+    batch.add_room_observer("Kitchen", kitchen)
+    hours = np.arange(1, 4)
+    temps, occupied, light_levels = batch.read_hours(hours)
+    assert kitchen.readings == [(temps[0][h], occupied[0][h], light_levels[0][h]) for h in range(len(hours))]
+
+class BulkRecorder:
+    def __init__(self):
+        self.calls = []
+
+    def update_bulk(self, room_names, hours, temps, occupied, light_levels):
+        self.calls.append((room_names, list(hours), temps.copy()))
+
+def test_room_streams_do_not_depend_on_their_neighbours():
+    hours = list(range(24)) * 2
+    alone = sensors.BatchRoomSensors(["Kitchen"], seed=7).generate(hours)
+    together = sensors.BatchRoomSensors(["Garage", "Kitchen", "Attic"], seed=7).generate(hours)
+    for column, shared in zip(alone, together):
+        np.testing.assert_array_equal(column[0], shared[1])
+    other_seed = sensors.BatchRoomSensors(["Kitchen"], seed=8).generate(hours)
+    assert not np.array_equal(alone[0], other_seed[0])
+
+def test_daily_pattern_matches_room_sensors():
+    hours = np.arange(24)
+    temps, occupied, light_levels = sensors.BatchRoomSensors(["Kitchen"], base_temp=20.0).generate(hours)
+    room = sensors.RoomSensors("Kitchen", base_temp=20.0, seed=1)
+    readings = Recorder()
+    room.add_observer(readings)
+    for hour in hours.tolist():
+        room.read_all(hour)
+    expected_temps, expected_occupied, expected_light = map(np.array, zip(*readings.readings))
+    # Same daily heat, within the same +-1 noise band
+    assert np.all(np.abs(temps[0] - expected_temps) <= 2.0)
+    np.testing.assert_array_equal(occupied[0], expected_occupied)
+    np.testing.assert_array_equal(light_levels[0], expected_light)
+
+def test_bulk_observers_get_one_call_and_stream_goes_hour_by_hour():
+    batch = sensors.BatchRoomSensors(["Kitchen", "Garage"], seed=2)
+    bulk, garage = BulkRecorder(), Recorder()
+    batch.add_bulk_observer(bulk)
+    batch.add_room_observer("Garage", garage)
+    batch.read_hours(range(5))
+    assert len(bulk.calls) == 1 and bulk.calls[0][2].shape == (2, 5)
+
+    bulk.calls.clear()
+    seen = []
+    for hour in batch.stream(range(3)):
+        seen.append((hour, len(bulk.calls), len(garage.readings)))
+    assert seen == [(0, 1, 6), (1, 2, 7), (2, 3, 8)]
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+import archive
+import database as db
+import sharding
+
+HOUR = db.HOUR_MS
+START = db.to_ms("2026-01-01 00:00:00")
+ROOMS = [f"Room {i}" for i in range(6)]
+
+def fill(store):
+    """Readings and AC transitions for every room, the older half archived."""
+    store.record_sensor_readings([(room, "Temperature", float(i), START + i * HOUR)
+                                  for i in range(20) for room in ROOMS])
+    store.record_appliance_states([(room, "AC", "COOLING" if i % 2 == 0 else "OFF", i % 2 == 0, START + i * HOUR)
+                                   for i in range(8) for room in ROOMS])
+    for path in store.paths:
+        store.on_shard(path, db.archive_before, START + 10 * HOUR)
+
+def history(store, room):
+    """Every (value, timestamp) of a room, paged through with the keyset cursor."""
+    rows, cursor = [], None
+    while True:
+        page, cursor = store.get_sensor_history_page(room, "Temperature", 7, cursor)
+        rows += [(row["value"], row["timestamp"]) for row in page]
+        if cursor is None:
+            return rows
+
+def snapshot_of(store):
+    return ({room: history(store, room) for room in ROOMS},
+            {room: store.calculate_energy(room, "AC") for room in ROOMS},
+            totals(store.paths))
+
+def totals(paths):
+    """Rows per log table, in SQLite and in the archive together."""
+    counts = {"sensor_log": 0, "appliance_log": 0}
+    for path in paths:
+        stats = db.archive_stats(path)
+        counts["sensor_log"] += stats["sensor_rows"]
+        counts["appliance_log"] += stats["appliance_rows"]
+        conn = db.get_connection(path)
+        for table in counts:
+            counts[table] += conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return counts
+
+def assert_ids_unique(path):
+    """No room's id is held twice in a shard, and new rows are numbered above all of them.
+
+    Archive files keep the ids of the shard they came from, so two rooms'
+    files may share ids; history and archiving only compare ids within a room.
+    """
+    directory = db.archive_dir(path)
+    conn = db.get_connection(path)
+    for kind, table in (('sensor', 'sensor_log'), ('appliance', 'appliance_log')):
+        highest = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        for room_pk, room_id in db.id_names(conn, 'room', path).items():
+            ids = [row[0] for row in conn.execute(f"SELECT id FROM {table} WHERE room_id = ?", (room_pk,))]
+            room = archive.open_room(directory, room_id)
+            for name in room.names(kind) if room else []:
+                ids += room.columns(kind, name)["id"].tolist()
+            assert len(ids) == len(set(ids)), (table, room_id)
+            highest = max([highest, *ids])
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        assert (seq[0] if seq else 0) >= highest, table
+
+def reopen(directory):
+    db.close_all_connections()
+    return sharding.ShardedStore(directory)
+
+def test_rebalance_keeps_rows_history_and_unique_ids(temp_db, tmp_path):
+    directory = str(tmp_path / "store")
+    store = sharding.ShardedStore(directory, 2)
+    store.init_db()
+    fill(store)
+    before = snapshot_of(store)
+    store.close()
+
+    db.close_all_connections()
+    sharding.rebalance(directory, 3, backup=False)
+    store = reopen(directory)
+    assert len(store.paths) == 3
+    assert snapshot_of(store) == before
+    for path in store.paths:
+        assert_ids_unique(path)
+
+    # New rows land above the archived ids and show up in the history
+    store.record_sensor_readings([(room, "Temperature", 99.0, START + 30 * HOUR) for room in ROOMS])
+    for path in store.paths:
+        assert_ids_unique(path)
+    assert history(store, "Room 0")[0] == (99.0, db.format_ts(START + 30 * HOUR))
+    store.close()
+
+def test_split_keeps_rows_history_and_unique_ids(temp_db, tmp_path):
+    single = sharding.ShardedStore(str(tmp_path / "single"), 1)
+    single.close()
+    # A one-shard store routes every call to temp_db's stand-in file
+    single.paths = [temp_db]
+    fill(single)
+    before = snapshot_of(single)
+
+    directory = str(tmp_path / "store")
+    sharding.split(temp_db, directory, 3)
+    store = reopen(directory)
+    assert sharding.read_manifest(directory) == 3
+    assert snapshot_of(store) == before
+    for path in store.paths:
+        assert_ids_unique(path)
+    assert not os.path.exists(os.path.join(directory, "rebalance"))
+    store.close()
+
+def test_rebalance_refuses_a_store_that_lost_rows(temp_db, tmp_path, monkeypatch):
+    directory = str(tmp_path / "store")
+    store = sharding.ShardedStore(directory, 2)
+    store.init_db()
+    fill(store)
+    store.close()
+    db.close_all_connections()
+    # A copy that silently drops a table's rows
+    real_copy = sharding.copy_rooms_sql
+    monkeypatch.setattr(sharding, "copy_rooms_sql",
+                        lambda table: real_copy(table).replace("WHERE", "WHERE 0 AND") if table == 'sensor_log'
+                        else real_copy(table))
+    with pytest.raises(RuntimeError):
+        sharding.rebalance(directory, 3, backup=False)
+    assert sharding.read_manifest(directory) == 2
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import database as db
+import simulation
+from control import RoomController
+
+ROOMS = [f"Room {i}" for i in range(7)]
+START = datetime(2026, 1, 1)
+HOURS = 48
+
+def controller_transitions(sensor_rows):
+    """The appliance rows RoomController would log for the same readings, hour by hour."""
+    readings = {}
+    for room, sensor_type, value, ts in sensor_rows:
+        readings.setdefault((room, ts), {})[sensor_type] = value
+    controllers = {room: RoomController(room) for room in ROOMS}
+    last, rows = {}, []
+    for (room, ts), values in sorted(readings.items(), key=lambda item: (item[0][1], ROOMS.index(item[0][0]))):
+        controller = controllers[room]
+        controller.update(values["Temperature"], bool(values["Occupancy"]), values["LightLevel"])
+        for appliance, state in zip(("AC", "Light"), controller.evaluate_state()):
+            is_on = int(state != "OFF")
+            if last.get((room, appliance)) != is_on:
+                last[(room, appliance)] = is_on
+                rows.append((room, appliance, state, is_on, ts))
+    return rows
+
+def test_chunk_matches_room_controller():
+    sensor_rows, appliance_rows = simulation.simulate_chunk(ROOMS, HOURS, START, {}, seed=3)
+    assert len(sensor_rows) == 3 * len(ROOMS) * HOURS
+    assert sorted(appliance_rows) == sorted(controller_transitions(sensor_rows))
+
+def test_results_do_not_depend_on_chunking():
+    whole = simulation.simulate_chunk(ROOMS, HOURS, START, {}, seed=3)
+    parts = [simulation.simulate_chunk(ROOMS[i:i + 3], HOURS, START, {}, seed=3) for i in range(0, len(ROOMS), 3)]
+    for merged, rows in zip(zip(*parts), whole):
+        assert sorted(sum(merged, [])) == sorted(rows)
+
+def test_known_states_are_not_logged_again():
+    _, first = simulation.simulate_chunk(ROOMS, HOURS, START, {}, seed=3)
+    known = {(room, appliance): is_on for room, appliance, _, is_on, ts in first if ts == db.to_ms(START)}
+    _, appliance_rows = simulation.simulate_chunk(ROOMS, HOURS, START, known, seed=3)
+    assert appliance_rows == [row for row in first if row[4] != db.to_ms(START)]
+
+def test_run_writes_every_chunk(temp_db):
+    result = simulation.run(5, 1, workers=2, chunk_size=2)
+    conn = db.get_connection()
+    assert result["sensor_rows"] == 5 * 24 * 3
+    assert conn.execute("SELECT COUNT(*) FROM sensor_log").fetchone() == (result["sensor_rows"],)
+    assert conn.execute("SELECT COUNT(*) FROM appliance_log").fetchone() == (result["appliance_rows"],)
+    assert result["room_hours_per_sec"] > 0
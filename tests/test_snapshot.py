@@ -0,0 +1,94 @@
+import sqlite3
+
+import numpy as np
+
+import database as db
+import snapshot
+from control import STATE_CODES
+from state_store import RoomStateStore
+
+HOUR = db.HOUR_MS
+START = db.to_ms("2026-01-01 00:00:00")
+
+def make_store(rooms=("Kitchen", "Garage")):
+    store = RoomStateStore()
+    for room in rooms:
+        store.add(room)
+    return store
+
+def restart(temp_db):
+    """Forgets what this process knew, as a new one would."""
+    snapshot._latest.clear()
+    db._last_state.clear()
+    db._state_versions.clear()
+    db.close_all_connections()
+
+def test_restore_replays_rows_after_the_snapshot(temp_db):
+    store = make_store()
+    kitchen = store.index["Kitchen"]
+    store.columns['temp'][kitchen] = 27.5
+    store.columns['ac_state'][kitchen] = STATE_CODES["COOLING"]
+    store.columns['light_override'][kitchen] = STATE_CODES["ON"]
+    store.touch()
+    db.record_appliance_states([("Kitchen", "AC", "COOLING", 1, START), ("Garage", "Light", "ON", 1, START)])
+    db.record_sensor_readings([("Kitchen", "Temperature", 27.5, START)])
+    snapshot.write(store)
+
+    # Logged after the snapshot, then the process restarts
+    db.record_appliance_states([("Garage", "Light", "OFF", 0, START + HOUR)])
+    db.record_sensor_readings([("Garage", "Temperature", 18.0, START + HOUR)])
+    restart(temp_db)
+    restored = make_store(("Kitchen", "Garage", "Attic"))
+    summary = snapshot.restore(restored)
+
+    assert summary["rooms"] == 2
+    assert summary["replayed"] == {"sensor_log": 1, "appliance_log": 1}
+    garage = restored.index["Garage"]
+    assert restored.columns['temp'][kitchen] == 27.5
+    assert restored.columns['ac_state'][kitchen] == STATE_CODES["COOLING"]
+    assert restored.columns['light_override'][kitchen] == STATE_CODES["ON"]
+    assert restored.columns['temp'][garage] == 18.0
+    assert restored.columns['light_state'][garage] == STATE_CODES["OFF"]
+    assert restored.columns['temp'][restored.index["Attic"]] == 25.0
+    # The state cache is seeded, and still trusted for this database
+    assert db._last_state[temp_db] == {("Kitchen", "AC"): (START, 1), ("Garage", "Light"): (START + HOUR, 0)}
+    assert db.get_last_state("Garage", "Light") == 0
+    assert db._state_versions[temp_db] == db.appliance_log_version(db.get_connection())
+
+def test_snapshot_behind_changed_logs_is_ignored(temp_db):
+    store = make_store()
+    db.record_appliance_states([("Kitchen", "AC", "COOLING", 1, START)])
+    snapshot.write(store)
+    # Another process clears the logs and starts over
+    conn = sqlite3.connect(temp_db)
+    with conn:
+        conn.execute("DELETE FROM appliance_log")
+    conn.close()
+    db.record_appliance_states([("Kitchen", "Light", "ON", 1, START + HOUR)])
+    assert not db.marks_intact(snapshot.load()[0]["marks"])
+
+    # The next write starts over instead of merging with the old states
+    meta = snapshot.write(store)
+    assert meta["state_keys"] == [["Kitchen", "Light"]]
+
+    restart(temp_db)
+    snapshot.write(store)
+    conn = sqlite3.connect(temp_db)
+    with conn:
+        conn.execute("DELETE FROM appliance_log")
+    conn.close()
+    db.record_appliance_states([("Garage", "AC", "OFF", 0, START + 2 * HOUR)])
+    restart(temp_db)
+    restored = make_store()
+    restored.columns['temp'][:] = 19.0
+    assert snapshot.restore(restored) is None
+    assert np.all(restored.column('temp') == 19.0)
+    # Warmed from the full log instead
+    assert db._last_state[temp_db] == {("Garage", "AC"): (START + 2 * HOUR, 0)}
+
+def test_unreadable_snapshot_is_ignored(temp_db):
+    db.record_appliance_states([("Kitchen", "AC", "COOLING", 1, START)])
+    with open(db.snapshot_path(), 'wb') as f:
+        f.write(b"not a snapshot")
+    assert snapshot.restore(make_store()) is None
+    assert db.get_last_state("Kitchen", "AC") == 1
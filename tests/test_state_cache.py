@@ -0,0 +1,58 @@
+import sqlite3
+
+import database as db
+
+def log_elsewhere(path, room_id, appliance, state, is_on, ts):
+    """Logs an appliance row the way another process (api.py) would."""
+    conn = sqlite3.connect(path)
+    with conn:
+        for table, name in (('rooms', room_id), ('appliances', appliance), ('states', state)):
+            conn.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+        ids = [conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+               for table, name in (('rooms', room_id), ('appliances', appliance), ('states', state))]
+        conn.execute(db.APPLIANCE_INSERT_SQL, (*ids, is_on, ts))
+    conn.close()
+
+def light_rows(room_id="Kitchen"):
+    return [row[0] for row in db.get_connection().execute(
+        "SELECT is_on FROM appliance_log a JOIN rooms r ON r.id = a.room_id WHERE r.name = ? ORDER BY a.id",
+        (room_id,))]
+
+def test_rows_from_another_process_are_seen(temp_db):
+    db.record_appliance_states([("Kitchen", "Light", "OFF", 0, 1000), ("Kitchen", "Light", "ON", 1, 0)])
+    db.init_db()  # warms the cache, as app.py does at startup
+    assert db.get_last_state("Kitchen", "Light") == 0
+    log_elsewhere(temp_db, "Kitchen", "Light", "ON", 1, 2000)
+    assert db.get_last_state("Kitchen", "Light") == 1
+    # The OFF is a change, not a repeat of the cached OFF
+    db.log_appliance_state("Kitchen", "Light", "OFF", 0, 24)
+    assert light_rows() == [0, 1, 1, 0]
+
+def test_own_writes_keep_the_cache(temp_db):
+    db.record_appliance_state("Kitchen", "Light", "ON", 1, 1000)
+    conn = db.get_connection()
+    assert db.get_last_state("Kitchen", "Light") == 1
+    db.record_appliance_states([("Kitchen", "Light", "OFF", 0, 2000), ("Kitchen", "AC", "OFF", 0, 2000)])
+    assert db._state_versions[temp_db] == db.appliance_log_version(conn)
+    assert db._last_state[temp_db][("Kitchen", "Light")] == (2000, 0)
+    assert db.get_last_state("Kitchen", "Light") == 0
+
+def test_cleared_log_is_seen(temp_db):
+    db.record_appliance_state("Kitchen", "Light", "ON", 1, 1000)
+    assert db.get_last_state("Kitchen", "Light") == 1
+    conn = sqlite3.connect(temp_db)
+    with conn:
+        conn.execute("DELETE FROM appliance_log")
+    conn.close()
+    assert db.get_last_state("Kitchen", "Light") is None
+
+def test_energy_response_sees_rows_from_another_process(temp_db):
+    import app as flask_app
+    flask_app.response_cache.clear()
+    client = flask_app.app.test_client()
+    db.record_appliance_state("Kitchen", "AC", "COOLING", 1, 0)
+    assert client.get("/api/energy").get_json()["data"]["total_kwh"] == 0
+    version = db.energy_version()
+    log_elsewhere(temp_db, "Kitchen", "AC", "OFF", 0, 2 * db.HOUR_MS)
+    assert db.energy_version() != version
+    assert client.get("/api/energy").get_json()["data"]["total_kwh"] == 3.0
@@ -0,0 +1,38 @@
+import pytest
+
+import app as flask_app
+import database as db
+
+@pytest.fixture
+def client(temp_db):
+    if "Batch Room" not in flask_app.rooms:
+        flask_app.add_room("Batch Room", db.DataLogger(), queued=False)
+    return flask_app.app.test_client()
+
+def tick(client, **body):
+    return client.post("/api/tick/batch", json={"rooms": ["Batch Room"], **body})
+
+def test_one_day_in_one_request(client):
+    response = tick(client, start_hour=1, end_hour=24)
+    assert response.status_code == 200
+    assert response.get_json()["hours"] == list(range(1, 25))
+
+@pytest.mark.parametrize("start_hour, end_hour", [
+    (-1, 5), (1, 25), (0, 10 ** 9), (5, 4), (True, 3), (1.5, 3), ("1", "3"), (None, 3),
+])
+def test_hours_outside_one_day_are_rejected(client, start_hour, end_hour):
+    assert tick(client, start_hour=start_hour, end_hour=end_hour).status_code == 400
+
+@pytest.mark.parametrize("room_ids", ["Batch Room", [["Batch Room"]], [{"name": "Batch Room"}], [1], {"a": 1}])
+def test_rooms_must_be_a_list_of_names(client, room_ids):
+    response = client.post("/api/tick/batch", json={"rooms": room_ids, "start_hour": 1, "end_hour": 2})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+def test_non_object_body_is_rejected(client):
+    assert client.post("/api/tick/batch", json=[1, 2]).status_code == 400
+
+def test_repeated_rooms_tick_once(client):
+    response = tick(client, rooms=["Batch Room"] * 3, start_hour=1, end_hour=2)
+    assert response.status_code == 200
+    assert list(response.get_json()["data"]) == ["Batch Room"]